@@ -0,0 +1,79 @@
+"""
+.. module:: bench_metrics
+   :platform: Unix
+   :synopsis: Benchmark of overhead of metrics tween per request.
+
+.. moduleauthor:: Mykola Radionov <moodaq@gmail.com>
+
+Sends the same request to Pyramid app with trivial view without and with
+metrics_tween_factory and reports the difference of the best mean time per
+request, i.e. the cost of recording the request in MetricsRegistry. The
+rendering of /metrics is measured separately with --routes routes of
+observed requests.
+
+    python benchmarks/bench_metrics.py --requests 20000
+
+"""
+
+import argparse
+import time
+
+from pyramid.config import Configurator
+from pyramid.request import Request
+from pyramid.response import Response
+
+from td.metrics import MetricsRegistry
+
+
+def make_app(metrics):
+    """Make app with one route, instrumented if metrics aren't None."""
+    config = Configurator(settings={"metrics": metrics})
+    if metrics is not None:
+        config.add_tween("td.metrics.metrics_tween_factory")
+    config.add_route("home", "/")
+    config.add_view(lambda request: Response("ok"), route_name="home")
+    return config.make_wsgi_app()
+
+
+def measure(app, requests, repeat):
+    """Return the best mean seconds per request of repeat runs."""
+    environ = Request.blank("/").environ
+
+    def start_response(status, headers):
+        pass
+
+    best = None
+    for _ in range(repeat):
+        started = time.time()
+        for _ in range(requests):
+            app(dict(environ), start_response)
+        duration = (time.time() - started) / requests
+        best = duration if best is None else min(best, duration)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure overhead of metrics tween.")
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--routes", type=int, default=20)
+    args = parser.parse_args()
+
+    plain = measure(make_app(None), args.requests, args.repeat)
+    metrics = MetricsRegistry()
+    instrumented = measure(make_app(metrics), args.requests, args.repeat)
+    print("without tween %8.2f us/request" % (plain * 1e6))
+    print("with tween    %8.2f us/request" % (instrumented * 1e6))
+    print("overhead      %8.2f us/request" % ((instrumented - plain) * 1e6))
+
+    for number in range(args.routes):
+        metrics.observe("route_%d" % number, 200, 0.01)
+    started = time.time()
+    body = metrics.render()
+    print("render of %d routes %8.3f ms, %d B" % (
+        args.routes + 1, (time.time() - started) * 1e3, len(body)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+.. module:: bench_prefork
+   :platform: Unix
+   :synopsis: Benchmark of single waitress process versus pre-fork workers
+   under CPU bound requests.
+
+.. moduleauthor:: Mykola Radionov <moodaq@gmail.com>
+
+The server runs td.servers.prefork.Supervisor in it's own process with 1
+and with --workers workers, each request encodes --items items to JSON the
+way big item pages do, so it holds the GIL of it's process. --clients
+threads send requests one after another for --duration seconds and
+requests per second are reported. On a node with N cores throughput should
+grow about N times until --workers reaches N.
+
+    python benchmarks/bench_prefork.py --workers 4 --clients 16
+
+"""
+
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib2
+
+
+def make_app(items):
+    """Make WSGI app which encodes page of items on each request."""
+    page = [{"_id": "%024x" % number, "item_value": "item %d" % number,
+             "category": "red"} for number in range(items)]
+
+    def app(environ, start_response):
+        body = json.dumps({"items": page})
+        start_response("200 OK", [("Content-Type", "application/json"),
+                                  ("Content-Length", str(len(body)))])
+        return [body]
+    return app
+
+
+def run_server(port, workers, items):
+    """Serve the app in this process with the pre-fork supervisor."""
+    from td.servers import prefork
+    logging.basicConfig(level=logging.ERROR)
+    app = make_app(items)
+    prefork.Supervisor(lambda: app, prefork.bind_socket("127.0.0.1", port),
+                       workers).run()
+
+
+def run_clients(port, clients, duration):
+    """Return requests per second and count of failed requests."""
+    counts = [0] * clients
+    failures = [0]
+    deadline = time.time() + duration
+
+    def run(number):
+        while time.time() < deadline:
+            try:
+                urllib2.urlopen("http://127.0.0.1:%d/" % port,
+                                timeout=30).read()
+                counts[number] += 1
+            except Exception:
+                failures[0] += 1
+
+    threads = [threading.Thread(target=run, args=(number,))
+               for number in range(clients)]
+    started = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(counts) / (time.time() - started), failures[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare one waitress process with pre-fork workers.")
+    parser.add_argument("--workers", type=int, default=os.sysconf(
+        "SC_NPROCESSORS_ONLN"))
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=5)
+    parser.add_argument("--items", type=int, default=200,
+                        help="items encoded by each request")
+    parser.add_argument("--port", type=int, default=6591)
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        run_server(args.port, args.serve, args.items)
+        return
+
+    for workers in sorted(set([1, args.workers])):
+        server = subprocess.Popen([sys.executable, __file__,
+                                   "--serve", str(workers),
+                                   "--port", str(args.port),
+                                   "--items", str(args.items)])
+        try:
+            time.sleep(1)
+            rate, failures = run_clients(args.port, args.clients,
+                                         args.duration)
+        finally:
+            server.terminate()
+            server.wait()
+        print("%2d workers  %8.0f req/s  failed %4d" % (workers, rate,
+                                                        failures))
+
+
+if __name__ == "__main__":
+    main()
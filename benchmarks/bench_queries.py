@@ -0,0 +1,93 @@
+"""
+.. module:: bench_queries
+   :platform: Unix
+   :synopsis: Benchmark of interpolated versus prepared user lookups.
+
+.. moduleauthor:: Mykola Radionov <moodaq@gmail.com>
+
+Compares the old way of querying Users table, where value is interpolated
+into the query text, with the parameterized Connector.select_one which
+prepares statement once per pooled connection. Both paths use the same pooled
+connection, so only parsing and planning costs are compared.
+
+Run it against databases described in the [databases] section of ini file:
+
+    python benchmarks/bench_queries.py development.ini --engine postgres \
+        --engine mysql --engine sqlite --iterations 5000
+
+sqlite engine needs no server, the user should exist in it's file.
+
+"""
+
+import argparse
+import time
+
+from td.assessors.assessors import Connector, PooledAssessor
+from td.config import ConfigScanner
+
+
+def interpolated_lookup(connector, username):
+    """Run lookup the way it was done before parameterized queries."""
+    table = '"Users"' if connector.engine_type != "mysql" else "Users"
+    with PooledAssessor(connector.pool) as db:
+        cursor = db.cursor()
+        cursor.execute("SELECT id, groups, password FROM %s WHERE %s" %
+                       (table, "username='%s'" % username))
+        return cursor.fetchone()
+
+
+def prepared_lookup(connector, username):
+    """Run lookup with parameterized Connector.select_one."""
+    return connector.select_one("id, groups, password", "Users",
+                                {"username": username})
+
+
+def measure(lookup, connector, username, iterations):
+    """Run lookup iterations times and return list of durations in
+    seconds.
+    """
+    durations = []
+    for _ in range(iterations):
+        started = time.time()
+        lookup(connector, username)
+        durations.append(time.time() - started)
+    return durations
+
+
+def report(engine, name, durations):
+    """Print mean and percentiles of durations in microseconds."""
+    durations = sorted(durations)
+    count = len(durations)
+    print("%-9s %-13s mean %8.1f us  p50 %8.1f us  p99 %8.1f us" % (
+        engine, name,
+        sum(durations) / count * 1e6,
+        durations[count // 2] * 1e6,
+        durations[min(count - 1, int(count * 0.99))] * 1e6))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare interpolated and prepared user lookups.")
+    parser.add_argument("config", help="path to the ini file")
+    parser.add_argument("--engine", action="append",
+                        choices=["mysql", "postgres", "sqlite"],
+                        help="engine to benchmark, can be repeated")
+    parser.add_argument("--username", default="user")
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    databases = ConfigScanner(args.config).parse_section("databases")
+    for engine in args.engine or ["postgres", "mysql"]:
+        connector = Connector(engine, databases[engine])
+        # warm up the pool and prepared statement cache
+        prepared_lookup(connector, args.username)
+        interpolated_lookup(connector, args.username)
+        for name, lookup in (("interpolated", interpolated_lookup),
+                             ("prepared", prepared_lookup)):
+            report(engine, name, measure(lookup, connector, args.username,
+                                         args.iterations))
+        connector.pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+.. module:: bench_renderers
+   :platform: Unix
+   :synopsis: Benchmark of Pyramid's json renderer versus FastJSONRenderer.
+
+.. moduleauthor:: Mykola Radionov <moodaq@gmail.com>
+
+Renders page of items the way get_todo_list_items did it before (list of
+dicts with str ids encoded by Pyramid's json renderer) and with
+FastJSONRenderer, both from the whole list and streamed from the documents
+iterator. Documents are generated in memory, so only encoding is measured.
+
+    python benchmarks/bench_renderers.py --sizes 10 1000 100000
+
+"""
+
+import argparse
+import time
+
+from bson import ObjectId
+from pyramid import testing
+from pyramid.renderers import JSON
+
+from td.renderers import Deferred, FastJSONRenderer, StreamedArray
+from td.views import _encode_items
+
+
+def make_documents(count):
+    """Make documents like the ones returned by Items cursor."""
+    return [{"_id": ObjectId(), "item_value": "item number %d" % number,
+             "category": "red"}
+            for number in range(count)]
+
+
+def render_pyramid(documents):
+    """Render items converted to dicts with str ids by Pyramid's renderer."""
+    render = JSON()(None)
+    items = [{"item_value": document["item_value"],
+              "category": document["category"],
+              "id": str(document["_id"])}
+             for document in documents]
+    return [render({"items": items, "next": None, "version": 1},
+                   {"request": testing.DummyRequest()})]
+
+
+def render_fast(documents):
+    """Render items with ObjectId ids by FastJSONRenderer in one string."""
+    items = [{"item_value": document["item_value"],
+              "category": document["category"],
+              "id": document["_id"]}
+             for document in documents]
+    return [FastJSONRenderer(None)({"items": items, "next": None,
+                                    "version": 1},
+                                   {"request": testing.DummyRequest()})]
+
+
+def render_streamed(documents):
+    """Render items streamed from documents iterator by FastJSONRenderer
+    with the same chunk encoder as get_todo_list_items uses.
+    """
+    items = StreamedArray(iter(documents), encode_chunk=_encode_items)
+    return FastJSONRenderer(None)({"items": items,
+                                   "next": Deferred(lambda: None),
+                                   "version": 1},
+                                  {"request": testing.DummyRequest()})
+
+
+def measure(render, documents, repeat):
+    """Render documents repeat times and return the best duration in
+    seconds, size of the body and size of the biggest chunk.
+    """
+    best = None
+    for _ in range(repeat):
+        started = time.time()
+        chunks = [len(chunk) for chunk in render(documents)]
+        duration = time.time() - started
+        best = duration if best is None else min(best, duration)
+    return best, sum(chunks), max(chunks)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare JSON renderers of items pages.")
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[10, 1000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        documents = make_documents(size)
+        for name, render in (("pyramid", render_pyramid),
+                             ("fast", render_fast),
+                             ("streamed", render_streamed)):
+            duration, body_size, chunk_size = measure(render, documents,
+                                                      args.repeat)
+            print("%7d items  %-8s %10.3f ms  body %9d B  max chunk %9d B" % (
+                size, name, duration * 1e3, body_size, chunk_size))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+.. module:: bench_search
+   :platform: Unix
+   :synopsis: Benchmark of item search by the text index versus filtering
+   of the full list.
+
+.. moduleauthor:: Mykola Radionov <moodaq@gmail.com>
+
+Fills BenchItems collection of the Mongo database from the [databases]
+section with --items items of one user, made of random words of the
+vocabulary, and creates the indexes of td.search. Then random 3 letter
+prefixes are searched:
+
+* full list - all items of the user are read and filtered in Python, as
+  the browser did with the whole list;
+* search - first page of td.search.find_items, the way /api/search_items
+  does.
+
+Mean and percentiles of both are printed. mongomock doesn't support $text,
+so it needs Mongo server:
+
+    python benchmarks/bench_search.py development.ini --items 100000
+
+The collection is dropped at the end unless --keep is given, the next run
+with --keep reuses the items.
+
+"""
+
+import argparse
+import random
+import time
+
+from bson import ObjectId
+from pymongo import InsertOne
+
+from td.config import ConfigScanner
+from td.mongo_client import make_client
+from td.search import (create_search_index,
+                       find_items,
+                       get_search_terms,
+                       make_tokens)
+
+OWNER_ID = 1
+CATEGORIES = ["red", "green", "yellow"]
+
+
+def make_vocabulary(size, seed=0):
+    """Make list of random lowercase words."""
+    generator = random.Random(seed)
+    return ["".join(generator.choice("abcdefghijklmnopqrstuvwxyz")
+                    for _ in range(generator.randint(3, 10)))
+            for _ in range(size)]
+
+
+def fill_items(collection, count, vocabulary, batch_size=1000):
+    """Insert count of items of OWNER_ID with tokens like the views do."""
+    generator = random.Random(1)
+    operations = []
+    for _ in range(count):
+        item_value = " ".join(generator.sample(vocabulary, 4))
+        operations.append(InsertOne({"_id": ObjectId(),
+                                     "item_value": item_value,
+                                     "category": generator.choice(CATEGORIES),
+                                     "owner_id": OWNER_ID,
+                                     "item_tokens": make_tokens(item_value)}))
+        if len(operations) == batch_size:
+            collection.bulk_write(operations, ordered=False)
+            operations = []
+    if operations:
+        collection.bulk_write(operations, ordered=False)
+
+
+def full_list(collection, prefix, limit):
+    """Read all items of the user and filter them by the prefix."""
+    found = []
+    for document in collection.find({"owner_id": OWNER_ID},
+                                    {"item_value": 1, "category": 1}):
+        if any(word.startswith(prefix)
+               for word in document["item_value"].split()):
+            found.append(document)
+    return found[:limit]
+
+
+def search(collection, prefix, limit):
+    """Read the first page of the search results."""
+    return list(find_items(collection, OWNER_ID, get_search_terms(prefix),
+                           limit=limit + 1))
+
+
+def measure(find, collection, prefixes, limit):
+    """Run find for each prefix and return list of durations in seconds."""
+    durations = []
+    for prefix in prefixes:
+        started = time.time()
+        find(collection, prefix, limit)
+        durations.append(time.time() - started)
+    return durations
+
+
+def report(name, durations):
+    """Print mean and percentiles of durations in milliseconds."""
+    durations = sorted(durations)
+    count = len(durations)
+    print("%-10s mean %8.2f ms  p50 %8.2f ms  p95 %8.2f ms  p99 %8.2f ms" % (
+        name,
+        sum(durations) / count * 1e3,
+        durations[count // 2] * 1e3,
+        durations[min(count - 1, int(count * 0.95))] * 1e3,
+        durations[min(count - 1, int(count * 0.99))] * 1e3))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare item search with filtering of the full list.")
+    parser.add_argument("config", help="path to the ini file")
+    parser.add_argument("--items", type=int, default=100000)
+    parser.add_argument("--vocabulary", type=int, default=20000,
+                        help="count of distinct words in the items")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=50,
+                        help="items on the page of results")
+    parser.add_argument("--keep", action="store_true",
+                        help="don't drop the collection at the end")
+    args = parser.parse_args()
+
+    mongo_creds = ConfigScanner(args.config).get_subsection_in_section(
+        "mongo", "databases")
+    client = make_client(mongo_creds)
+    collection = client[mongo_creds["db_name"]].BenchItems
+    try:
+        vocabulary = make_vocabulary(args.vocabulary)
+        existing = collection.count({"owner_id": OWNER_ID})
+        if existing != args.items:
+            collection.delete_many({})
+            started = time.time()
+            fill_items(collection, args.items, vocabulary)
+            print("Inserted %d items in %.1f s." % (args.items,
+                                                    time.time() - started))
+        create_search_index(collection)
+        generator = random.Random(2)
+        prefixes = [generator.choice(vocabulary)[:3]
+                    for _ in range(args.queries)]
+        # warm up the cache of the server
+        search(collection, prefixes[0], args.limit)
+        full_list(collection, prefixes[0], args.limit)
+        for name, find in (("full list", full_list), ("search", search)):
+            report(name, measure(find, collection, prefixes, args.limit))
+    finally:
+        if not args.keep:
+            collection.drop()
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
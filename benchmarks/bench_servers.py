@@ -0,0 +1,134 @@
+"""
+.. module:: bench_servers
+   :platform: Unix
+   :synopsis: Benchmark of waitress versus the evented server under many
+   slow concurrent requests.
+
+.. moduleauthor:: Mykola Radionov <moodaq@gmail.com>
+
+Each server runs in it's own process and serves WSGI app which waits
+--wait seconds before the reply, the way views wait for Mongo and SQL
+servers or a long-polling client waits for changes. The waiting is done
+cooperatively under gevent and holds a thread under waitress. The client
+opens --concurrency connections at once and reports time to complete all
+of them and the count of OS threads of the server process.
+
+    python benchmarks/bench_servers.py --concurrency 1000 --wait 0.5
+
+"""
+
+import argparse
+import logging
+import os
+import subprocess
+import sys
+import time
+
+
+def make_app(wait):
+    """Make WSGI app which replies after waiting wait seconds."""
+    def app(environ, start_response):
+        time.sleep(wait)
+        start_response("200 OK", [("Content-Type", "application/json"),
+                                  ("Content-Length", "2")])
+        return ["{}"]
+    return app
+
+
+def run_server(kind, port, wait, threads):
+    """Serve the app in this process with waitress or gevent."""
+    logging.basicConfig(level=logging.ERROR)
+    if kind == "evented":
+        from gevent import monkey
+        monkey.patch_all()
+        from td.servers.evented import serve
+        serve(make_app(wait), "127.0.0.1", port)
+    else:
+        import waitress
+        waitress.serve(make_app(wait), host="127.0.0.1", port=port,
+                       threads=threads, connection_limit=100000,
+                       backlog=4096, _quiet=True)
+
+
+def count_threads(pid):
+    """Count OS threads of the process from /proc."""
+    try:
+        return len(os.listdir("/proc/%d/task" % pid))
+    except OSError:
+        return -1
+
+
+def run_client(port, concurrency, pid):
+    """Send concurrency requests at once and return duration, count of
+    failed requests and the biggest count of server's threads.
+    """
+    import gevent
+    import gevent.pool
+    import urllib2
+
+    failures = [0]
+    peak_threads = [count_threads(pid)]
+
+    def fetch():
+        try:
+            urllib2.urlopen("http://127.0.0.1:%d/" % port, timeout=120).read()
+        except Exception:
+            failures[0] += 1
+
+    def watch():
+        while True:
+            peak_threads[0] = max(peak_threads[0], count_threads(pid))
+            gevent.sleep(0.05)
+
+    watcher = gevent.spawn(watch)
+    started = time.time()
+    pool = gevent.pool.Pool(concurrency)
+    for _ in range(concurrency):
+        pool.spawn(fetch)
+    pool.join()
+    duration = time.time() - started
+    watcher.kill()
+    return duration, failures[0], peak_threads[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare waitress and evented server.")
+    parser.add_argument("--concurrency", type=int, default=1000)
+    parser.add_argument("--wait", type=float, default=0.5,
+                        help="seconds each request waits for 'database'")
+    parser.add_argument("--threads", type=int, default=4,
+                        help="threads of waitress (it's default is 4)")
+    parser.add_argument("--port", type=int, default=6590)
+    parser.add_argument("--serve", choices=["waitress", "evented"],
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        run_server(args.serve, args.port, args.wait, args.threads)
+        return
+
+    from gevent import monkey
+    monkey.patch_all()
+    for kind in ("waitress", "evented"):
+        server = subprocess.Popen([sys.executable, __file__,
+                                   "--serve", kind,
+                                   "--port", str(args.port),
+                                   "--wait", str(args.wait),
+                                   "--threads", str(args.threads)])
+        try:
+            time.sleep(1)
+            duration, failures, threads = run_client(args.port,
+                                                     args.concurrency,
+                                                     server.pid)
+        finally:
+            server.terminate()
+            server.wait()
+        print("%-9s %5d requests  %8.2f s  %6.0f req/s  failed %4d  "
+              "server threads %4d" % (kind, args.concurrency, duration,
+                                      args.concurrency / duration, failures,
+                                      threads))
+
+
+if __name__ == "__main__":
+    main()
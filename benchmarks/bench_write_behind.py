@@ -0,0 +1,92 @@
+"""
+.. module:: bench_write_behind
+   :platform: Unix
+   :synopsis: Benchmark of insert throughput with and without write-behind
+   queue.
+
+.. moduleauthor:: Mykola Radionov <moodaq@gmail.com>
+
+--threads threads insert documents one by one for --duration seconds into a
+collection stand-in which spends --latency seconds per call on the round
+trip to Mongo, and --per-call seconds plus --per-document seconds for each
+document of the call on the server one call at a time, like a commit of the
+journal. Inserts per second are reported for insert_one of the collection
+and for each durability mode of WriteBehindQueue (journaled is the same as
+acknowledged here).
+
+    python benchmarks/bench_write_behind.py --threads 16 --latency 0.002
+
+"""
+
+import argparse
+import threading
+import time
+
+from td.write_behind import WriteBehindQueue
+
+
+class RemoteCollection(object):
+    """Collection stand-in with latency of the network and the server."""
+
+    def __init__(self, latency, per_call, per_document):
+        self.latency = latency
+        self.per_call = per_call
+        self.per_document = per_document
+        self.server = threading.Lock()
+
+    def insert_one(self, document):
+        self.insert_many([document])
+
+    def insert_many(self, documents, ordered=True):
+        time.sleep(self.latency)
+        with self.server:
+            time.sleep(self.per_call + self.per_document * len(documents))
+
+
+def measure(insert, threads, duration):
+    """Return inserts per second of threads calling insert."""
+    counts = [0] * threads
+    deadline = time.time() + duration
+
+    def run(number):
+        while time.time() < deadline:
+            insert({"item_value": "benchmark", "category": "red"})
+            counts[number] += 1
+
+    workers = [threading.Thread(target=run, args=(number,))
+               for number in range(threads)]
+    started = time.time()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return sum(counts) / (time.time() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure inserts per second with write-behind queue.")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=3)
+    parser.add_argument("--latency", type=float, default=0.002)
+    parser.add_argument("--per-call", type=float, default=0.0005)
+    parser.add_argument("--per-document", type=float, default=0.00002)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--max-delay", type=float, default=0)
+    args = parser.parse_args()
+
+    collection = RemoteCollection(args.latency, args.per_call,
+                                  args.per_document)
+    print("insert_one    %8.0f inserts/s" % measure(
+        collection.insert_one, args.threads, args.duration))
+    for durability in ("acknowledged", "buffered"):
+        queue = WriteBehindQueue(collection, durability=durability,
+                                 writers=args.writers,
+                                 max_delay=args.max_delay)
+        rate = measure(queue.insert_one, args.threads, args.duration)
+        queue.close()
+        print("%-13s %8.0f inserts/s" % (durability, rate))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+"""
+.. module:: load_test
+   :platform: Unix
+   :synopsis: Load test of td app with local stand-ins of it's databases.
+
+.. moduleauthor:: Mykola Radionov <moodaq@gmail.com>
+
+Boots the app from td.main the same way pserve does, but Mongo is replaced
+with in-memory mongomock and Users table is kept by sqlite engine of
+Connector in a temporary file with one user per client (or in Mongo with
+--users-store mongo). The app is served by waitress on a free local port in
+this process.
+
+Each of --concurrency clients logs in with it's own user over keep-alive
+connection and then runs the workloads one after another until --duration
+seconds pass:
+
+    login   POST /api/post_login_credentials
+    list    GET /api/get_todo_list_items
+    add     POST /api/add_todo_list_item
+    remove  POST /api/remove_item (an item added by the client before)
+
+Requests per second and p50/p95/p99 latencies of each route are printed as
+JSON, so results of two commits can be compared by a script:
+
+    python benchmarks/load_test.py --concurrency 8 --duration 10 \
+        --workload list add remove --output before.json
+
+mock and mongomock of test_requirements.txt are needed.
+
+"""
+
+import argparse
+import httplib
+import json
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+import bcrypt
+import mock
+import mongomock
+from waitress.server import create_server
+
+import td
+from td.assessors.assessors import SQLITE_SCHEMA, Connector
+from td.assessors.mongo_connector import MongoConnector
+from td.migrations import copy_users
+
+
+WORKLOADS = ("login", "list", "add", "remove")
+PASSWORD = "password"
+AUTH_COOKIE = re.compile(r'auth_tkt=("[^"]*"|[^;,]*)')
+# settings of [app:main] section, login limits are off so logins aren't
+# rejected with 429
+APP_SETTINGS = {"auth.secret": "load-test-secret",
+                "db_in_use": "sqlite",
+                "items.page_size": "50",
+                "password_master.workers": "0",
+                "login_limit.user_rate": "0",
+                "login_limit.ip_rate": "0",
+                "config.reload_interval": "0"}
+
+
+def create_users(path, count, rounds):
+    """Create Users table with users user0 ... user<count - 1>.
+
+    :param path: path of SQLite file.
+    :type path: str
+    :param count: count of users.
+    :type count: int
+    :param rounds: log2 of bcrypt rounds of their passwords.
+    :type rounds: int
+    """
+    hashed = bcrypt.hashpw(PASSWORD, bcrypt.gensalt(rounds))
+    connection = sqlite3.connect(path)
+    connection.executescript(SQLITE_SCHEMA)
+    connection.executemany("INSERT INTO Users (username, password, groups) "
+                           "VALUES (?, ?, 'group:users')",
+                           [("user%d" % number, hashed)
+                            for number in range(count)])
+    connection.commit()
+    connection.close()
+
+
+def make_app(directory, users, rounds, settings):
+    """Create ini file and SQLite database in directory and boot the app.
+    Users are copied to Mongo if users_store setting is 'mongo'.
+
+    :return: tuple (WSGI app, list of started patchers).
+    :rtype: tuple
+    """
+    sqlite_path = os.path.join(directory, "td.sqlite")
+    create_users(sqlite_path, users, rounds)
+    ini_path = os.path.join(directory, "load_test.ini")
+    with open(ini_path, "w") as ini_file:
+        ini_file.write("[databases]\n"
+                       "sqlite.db_name = %(here)s/td.sqlite\n"
+                       "mongo.host = localhost\n"
+                       "mongo.port = 27017\n"
+                       "mongo.db_name = TDDB\n")
+    mongo_client = mongomock.MongoClient()
+    if settings.get("users_store") == "mongo":
+        copy_users(Connector("sqlite", {"db_name": sqlite_path}),
+                   MongoConnector(mongo_client.TDDB))
+    patchers = [mock.patch("td.mongo_client.pymongo.MongoClient",
+                           lambda *args, **kwargs: mongo_client)]
+    for patcher in patchers:
+        patcher.start()
+    app = td.main({"__file__": ini_path, "here": directory}, **settings)
+    return app, patchers
+
+
+class Client(threading.Thread):
+    """Thread which sends requests of the workloads over one connection."""
+
+    def __init__(self, port, username, workloads, deadline, results):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.connection = httplib.HTTPConnection("127.0.0.1", port)
+        self.username = username
+        self.workloads = workloads
+        self.deadline = deadline
+        # route -> list of latencies, route -> count of errors
+        self.latencies, self.errors = results
+        self.cookie = None
+        self.item_ids = []
+
+    def request(self, route, method, path, body=None):
+        """Send request, record it's latency and return decoded body or
+        None if it failed.
+        """
+        headers = {"X-Requested-With": "XMLHttpRequest"}
+        if self.cookie:
+            headers["Cookie"] = self.cookie
+        if body is not None:
+            body = json.dumps(body)
+            headers["Content-Type"] = "application/json"
+        started = time.time()
+        try:
+            self.connection.request(method, path, body, headers)
+            response = self.connection.getresponse()
+            content = response.read()
+        except (httplib.HTTPException, IOError):
+            self.connection.close()
+            self.errors[route] = self.errors.get(route, 0) + 1
+            return None
+        self.latencies.setdefault(route, []).append(time.time() - started)
+        if response.status >= 400:
+            self.errors[route] = self.errors.get(route, 0) + 1
+            return None
+        if route == "login":
+            match = AUTH_COOKIE.search(response.getheader("set-cookie", ""))
+            if match is not None:
+                self.cookie = "auth_tkt=%s" % match.group(1)
+            return {}
+        return json.loads(content) if content else {}
+
+    def login(self):
+        return self.request("login", "POST", "/api/post_login_credentials",
+                            {"login": self.username, "password": PASSWORD})
+
+    def list(self):
+        return self.request("list", "GET", "/api/get_todo_list_items")
+
+    def add(self):
+        reply = self.request("add", "POST", "/api/add_todo_list_item",
+                             {"item_value": "load test item",
+                              "category": "red"})
+        if reply:
+            self.item_ids.append(reply["id"])
+
+    def remove(self):
+        if not self.item_ids:
+            self.add()
+            return
+        self.request("remove", "POST", "/api/remove_item",
+                     {"id": self.item_ids.pop()})
+
+    def run(self):
+        self.login()
+        while time.time() < self.deadline:
+            for workload in self.workloads:
+                getattr(self, workload)()
+
+
+def percentile(durations, fraction):
+    """Get nearest-rank percentile of sorted durations."""
+    index = max(0, min(len(durations) - 1,
+                       int(round(fraction * len(durations))) - 1))
+    return durations[index]
+
+
+def summarize(latencies, errors, duration):
+    """Make report with req/s and percentiles in ms of each route."""
+    routes = {}
+    for route in sorted(set(latencies) | set(errors)):
+        durations = sorted(latencies.get(route, []))
+        report = {"requests": len(durations),
+                  "errors": errors.get(route, 0),
+                  "rps": round(len(durations) / duration, 1)}
+        if durations:
+            report.update(
+                ("p%d_ms" % (fraction * 100),
+                 round(percentile(durations, fraction) * 1e3, 3))
+                for fraction in (0.5, 0.95, 0.99))
+        routes[route] = report
+    total = sum(report["requests"] for report in routes.values())
+    return {"routes": routes,
+            "total": {"requests": total,
+                      "errors": sum(errors.values()),
+                      "rps": round(total / duration, 1)}}
+
+
+def run(args):
+    """Boot the app, run the clients and return the report."""
+    directory = tempfile.mkdtemp(prefix="td_load_test_")
+    patchers = []
+    try:
+        settings = dict(APP_SETTINGS)
+        settings["executor.threads"] = str(args.threads)
+        settings["users_store"] = args.users_store
+        if args.write_behind != "off":
+            settings["write_behind.enabled"] = "true"
+            settings["write_behind.durability"] = args.write_behind
+        app, patchers = make_app(directory, args.concurrency,
+                                 args.bcrypt_rounds, settings)
+        server = create_server(app, host="127.0.0.1", port=0,
+                               threads=args.threads)
+        server_thread = threading.Thread(target=server.run)
+        server_thread.daemon = True
+        server_thread.start()
+
+        per_client = [({}, {}) for _ in range(args.concurrency)]
+        started = time.time()
+        clients = [Client(server.effective_port, "user%d" % number,
+                          args.workload, started + args.duration,
+                          per_client[number])
+                   for number in range(args.concurrency)]
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        duration = time.time() - started
+        server.close()
+    finally:
+        for patcher in patchers:
+            patcher.stop()
+        shutil.rmtree(directory, ignore_errors=True)
+
+    latencies, errors = {}, {}
+    for client_latencies, client_errors in per_client:
+        for route, durations in client_latencies.items():
+            latencies.setdefault(route, []).extend(durations)
+        for route, count in client_errors.items():
+            errors[route] = errors.get(route, 0) + count
+    report = summarize(latencies, errors, duration)
+    report["config"] = {"concurrency": args.concurrency,
+                        "duration": round(duration, 3),
+                        "threads": args.threads,
+                        "workload": args.workload,
+                        "bcrypt_rounds": args.bcrypt_rounds,
+                        "users_store": args.users_store,
+                        "write_behind": args.write_behind}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Load test td app with local database stand-ins.")
+    parser.add_argument("--concurrency", type=int, default=4,
+                        help="count of clients, each logs in as own user")
+    parser.add_argument("--duration", type=float, default=10,
+                        help="seconds of load")
+    parser.add_argument("--threads", type=int, default=4,
+                        help="threads of waitress")
+    parser.add_argument("--workload", nargs="+", choices=WORKLOADS,
+                        default=["list", "add", "remove"])
+    parser.add_argument("--bcrypt-rounds", type=int, default=12,
+                        help="log2 of bcrypt rounds of users' passwords")
+    parser.add_argument("--users-store", choices=["sql", "mongo"],
+                        default="sql", help="users_store setting of the app")
+    parser.add_argument("--write-behind",
+                        choices=["off", "buffered", "acknowledged"],
+                        default="off",
+                        help="durability of write-behind queue of inserts")
+    parser.add_argument("--output", help="file to write JSON report to")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    report = json.dumps(run(args), indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(report + "\n")
+    print(report)
+
+
+if __name__ == "__main__":
+    main()
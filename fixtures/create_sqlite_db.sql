@@ -0,0 +1,13 @@
+-- Connector creates this table on the first connection to the file, the
+-- script is for creating the database by hand:
+--      sqlite3 <path to the file>/td.sqlite < create_sqlite_db.sql
+
+PRAGMA journal_mode=WAL;
+
+CREATE TABLE IF NOT EXISTS Users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ip VARCHAR(15),
+    username VARCHAR(64) NOT NULL UNIQUE,
+    password VARCHAR(256) NOT NULL,
+    groups VARCHAR(64) NOT NULL
+);
@@ -212,6 +212,10 @@ EOF
 
 _ "Your username is user and password is 1234.";
 
+_ "Download third-party scripts, stylesheets and fonts into td/static/vendor:";
+_ "td_fetch_vendor";
+td_fetch_vendor;
+
 _ "Compile stylesheets:";
 _ "sass td/static/sass:td/static/stylesheets";
 sass td/static/sass:td/static/stylesheets;
@@ -31,5 +31,14 @@ setup(name='td',
       entry_points="""\
       [paste.app_factory]
       main = td:main
+      [paste.server_runner]
+      waitress = td.servers.threaded:serve_paste
+      [console_scripts]
+      td_fetch_vendor = td.assets:fetch_vendor_main
+      td_serve_evented = td.servers.evented:main
+      td_serve_prefork = td.servers.prefork:main
+      td_migrate_users = td.migrations:migrate_users_main
+      td_profile_startup = td.startup:profile_startup_main
+      td_index_items = td.search:index_items_main
       """,
       )
@@ -0,0 +1,506 @@
+"""
+.. module:: app
+   :platform: Unix
+   :synopsis: Pyramid app factory of td.
+
+.. moduleauthor:: Mykola Radionov <moodaq@gmail.com>
+
+main doesn't connect to the databases. Their clients and pools are made on
+the first use, and the warm-up creates Mongo indexes and opens connections
+ahead of the first request: in main with startup.warm_up = inline, or in a
+daemon thread with startup.warm_up = background, so the app is served while
+the databases are still being reached.
+
+"""
+
+import atexit
+import logging
+import os
+import threading
+import time
+
+from pyramid.authorization import ACLAuthorizationPolicy
+from pyramid.config import Configurator
+from pyramid.security import Allow, Everyone
+
+from td.assessors.assessors import Connector
+from td.assessors.mongo_connector import MongoConnector
+from td.assets import AssetStore
+from td.auth import TicketAuthenticationPolicy
+from td.config import ConfigScanner, Settings
+from td.instrumentation import InstrumentedDatabase, QueryTracker
+from td.metrics import MetricsRegistry
+from td.mongo_client import (DEFAULT_MAX_STALENESS,
+                             LazyDatabase,
+                             create_indexes,
+                             make_read_preference)
+from td.password_master import PasswordMaster
+from td.ratelimit import (LoginLimiter,
+                          MemoryBucketStore,
+                          MongoBucketStore,
+                          TokenBucketLimiter)
+from td.resilience import (MONGO_TRANSIENT_ERRORS,
+                           Guard,
+                           GuardedConnector,
+                           GuardedDatabase,
+                           get_guard_settings)
+from td.search import create_search_index
+from td.servers import evented, prefork
+from td.startup import timer
+from td.versions import get_tickets_version
+from td.write_behind import WriteBehindQueue
+
+logger = logging.getLogger(__name__)
+
+# section of the ini file which settings are reloaded
+APP_SECTION = "app:main"
+WARM_UP_MODES = ("inline", "background")
+# the biggest delay between attempts of the background warm-up
+MAX_WARM_UP_DELAY = 60.0
+# defaults of the settings which are applied by apply_reloaded_config
+RELOADABLE_DEFAULTS = {"password_master.max_pending": 0,
+                       "password_master.queue_timeout": 1,
+                       "login_limit.user_rate": 0.1,
+                       "login_limit.user_burst": 5,
+                       "login_limit.ip_rate": 1,
+                       "login_limit.ip_burst": 20,
+                       "queries.slow_threshold": 0.1,
+                       "queries.repeat_threshold": 2,
+                       "write_behind.max_batch": 100,
+                       "write_behind.max_delay": 0,
+                       "write_behind.max_pending": 1000,
+                       "write_behind.queue_timeout": 1,
+                       "auth.refresh_interval": 300}
+
+
+class RootFactory(object):
+    """List of mappings from principal to permission."""
+    def __init__(self, request):
+        pass
+
+    def __acl__(self):
+        """Return list of mappings from principal to permission."""
+        return [(Allow, Everyone, "everybody"),
+                (Allow, "group:users", "entry")]
+
+
+def main(global_config, **settings):
+    """ This function returns a Pyramid WSGI application.
+    """
+    timer.start()
+    parser = ConfigScanner(global_config["__file__"])
+    app_settings = Settings(settings, RELOADABLE_DEFAULTS)
+    warm_up_mode = app_settings.get_str("startup.warm_up", "inline")
+    if warm_up_mode not in WARM_UP_MODES:
+        raise ValueError("Wrong startup.warm_up mode: %r." % (warm_up_mode,))
+
+    db_engine_type_in_use = app_settings.get_str("db_in_use")
+    db_creds = parser.get_subsection_in_section(db_engine_type_in_use,
+                                                "databases")
+    mongo_creds = parser.get_subsection_in_section("mongo", "databases")
+    timer.mark("config")
+
+    # client is made in each process which uses it, see td.servers.prefork
+    mongo_db = LazyDatabase(mongo_creds)
+
+    query_tracker = None
+    if app_settings.get_bool("queries.instrumented", False):
+        query_tracker = QueryTracker(
+            slow_threshold=app_settings.get_duration("queries.slow_threshold"),
+            repeat_threshold=app_settings.get_int("queries.repeat_threshold"))
+        mongo_db = InstrumentedDatabase(mongo_db, query_tracker)
+    # retries and circuit breaker of each backend, see td.resilience
+    mongo_guard = Guard("mongo", MONGO_TRANSIENT_ERRORS,
+                        **get_guard_settings(mongo_creds))
+    mongo_db = GuardedDatabase(mongo_db, mongo_guard)
+
+    # lists which weren't changed for items.max_staleness are read by
+    # items.read_preference, e.g. from secondaries of the replica set
+    secondary_items = None
+    items_read_preference = app_settings.get_str("items.read_preference",
+                                                 "primary")
+    if items_read_preference != "primary":
+        secondary_items = mongo_db.Items.with_options(
+            read_preference=make_read_preference(
+                items_read_preference,
+                app_settings.get_duration("items.max_staleness",
+                                          DEFAULT_MAX_STALENESS)))
+
+    # users are kept in the SQL database of db_in_use or next to their items
+    # in Mongo, see td_migrate_users command
+    users_in_mongo = app_settings.get_str("users_store", "sql") == "mongo"
+    sql_guard = None
+    if users_in_mongo:
+        db = MongoConnector(mongo_db)
+    else:
+        db = Connector(db_engine_type_in_use, db_creds)
+        if query_tracker is not None:
+            db.add_listener(query_tracker)
+        sql_guard = Guard(db_engine_type_in_use, db.transient_errors,
+                          **get_guard_settings(db_creds))
+        db = GuardedConnector(db, sql_guard)
+    timer.mark("databases")
+
+    # Under the evented server bcrypt runs inline in the executor threads,
+    # it releases the GIL, and pool of processes doesn't mix with gevent.
+    password_master = PasswordMaster(
+        workers=(0 if evented.is_evented() else
+                 app_settings.get_int("password_master.workers", 0)),
+        max_pending=app_settings.get_int("password_master.max_pending"),
+        queue_timeout=app_settings.get_duration(
+            "password_master.queue_timeout"))
+    # pool of processes is forked before the server starts it's threads
+    if prefork.is_supervisor():
+        prefork.register_after_fork(password_master.start)
+    else:
+        password_master.start()
+    atexit.register(password_master.close)
+
+    def get_login_limit(app_settings, key):
+        """Get rate and burst of login attempts from login_limit.* settings.
+
+        :param app_settings: settings of the app.
+        :type app_settings: td.config.Settings
+        :param key: 'user' or 'ip'.
+        :type key: str
+        :return: tuple (rate, burst).
+        :rtype: tuple
+        """
+        return (app_settings.get_float("login_limit.%s_rate" % key),
+                app_settings.get_float("login_limit.%s_burst" % key))
+
+    def make_login_limiter(key, rate, burst):
+        """Create limiter of login attempts.
+
+        :param key: 'user' or 'ip'.
+        :type key: str
+        :return: limiter or None if it's rate is 0.
+        :rtype: td.ratelimit.TokenBucketLimiter
+        """
+        if rate <= 0:
+            return None
+        if app_settings.get_str("login_limit.store", "memory") == "mongo":
+            store = MongoBucketStore(mongo_db.LoginBuckets)
+        else:
+            store = MemoryBucketStore()
+        return TokenBucketLimiter(rate, burst, store)
+
+    write_queue = None
+    if app_settings.get_bool("write_behind.enabled", False):
+        write_queue = WriteBehindQueue(
+            mongo_db.Items,
+            durability=app_settings.get_str("write_behind.durability",
+                                            "acknowledged"),
+            writers=app_settings.get_int("write_behind.writers", 2),
+            max_batch=app_settings.get_int("write_behind.max_batch"),
+            max_delay=app_settings.get_duration("write_behind.max_delay"),
+            max_pending=app_settings.get_int("write_behind.max_pending"),
+            queue_timeout=app_settings.get_duration(
+                "write_behind.queue_timeout"))
+        atexit.register(write_queue.close)
+
+    metrics = None
+    if app_settings.get_bool("metrics.enabled", False):
+        metrics = MetricsRegistry()
+        pool = db.pool
+        if pool is not None:
+            metrics.add_gauge("db_pool_in_use",
+                              "Checked out SQL connections.",
+                              lambda: pool.stats()["in_use"])
+            metrics.add_gauge("db_pool_idle", "Idle SQL connections.",
+                              lambda: pool.stats()["idle"])
+        for guard in (sql_guard, mongo_guard):
+            if guard is not None:
+                guard.add_gauges(metrics)
+        if write_queue is not None:
+            metrics.add_gauge("write_queue_depth",
+                              "Items waiting for the batch insert.",
+                              lambda: len(write_queue))
+
+    if evented.is_evented():
+        # C drivers and bcrypt would block all greenlets of the process
+        executor = evented.make_executor(app_settings.get_int(
+            "executor.threads", evented.DEFAULT_EXECUTOR_THREADS))
+        if not users_in_mongo:
+            # pymongo is cooperative already
+            db = evented.BlockingBridge(db, executor, context=query_tracker)
+        password_master = evented.BlockingBridge(password_master, executor)
+
+    login_limiter = LoginLimiter(
+        user_limiter=make_login_limiter(
+            "user", *get_login_limit(app_settings, "user")),
+        ip_limiter=make_login_limiter(
+            "ip", *get_login_limit(app_settings, "ip")))
+    if metrics is not None:
+        login_limiter.add_counters(metrics)
+    timer.mark("services")
+
+    def warm_up():
+        """Create indexes of Mongo and open connections of the databases
+        ahead of the first request.
+        """
+        started = time.time()
+        create_indexes(mongo_db)
+        create_search_index(mongo_db.Items)
+        if app_settings.get_str("login_limit.store", "memory") == "mongo":
+            MongoBucketStore(mongo_db.LoginBuckets).create_indexes()
+        if users_in_mongo:
+            db.create_indexes()
+        else:
+            db.pool.warm_up()
+        logger.info("Databases are warmed up in %.3f s.",
+                    time.time() - started)
+
+    def warm_up_in_background():
+        """Run warm-up in daemon thread until it succeeds, with growing
+        delay between attempts.
+        """
+        def run():
+            delay = 1.0
+            while True:
+                try:
+                    return warm_up()
+                except Exception:
+                    logger.warning("Warm-up failed, retrying in %.0f s.",
+                                   delay, exc_info=True)
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_WARM_UP_DELAY)
+
+        thread = threading.Thread(target=run, name="td-warm-up")
+        thread.daemon = True
+        thread.start()
+
+    start_warm_up = (warm_up_in_background if warm_up_mode == "background"
+                     else warm_up)
+    if prefork.is_supervisor():
+        # only workers connect, after fork
+        prefork.register_after_fork(start_warm_up)
+    else:
+        start_warm_up()
+    timer.mark("warm_up")
+
+    def connect_db_to_view(view_to_wrap):
+        """Serve as decorator specified in config.add_view for db connections
+        creation.
+
+        Inserts Connector's instance, Mongodb Database instance,
+        PasswordMaster instance and LoginLimiter instance in
+        request.registry.settings
+
+        :param view_to_wrap: View func to extend.
+        :return: Wrapped view func with injected db instances in it's request.
+        """
+        def wrapper(context, request):
+            request.registry.settings["db"] = db
+            request.registry.settings["mongo_db"] = mongo_db
+            request.registry.settings["password_master"] = password_master
+            request.registry.settings["login_limiter"] = login_limiter
+            response = view_to_wrap(context, request)
+            return response
+        return wrapper
+
+    def apply_reloaded_config(parser):
+        """Apply pool sizes, timeouts and limits of the reloaded config to
+        the working app. The other settings need restart.
+
+        :param parser: scanner of the reloaded config.
+        :type parser: td.config.ConfigScanner
+        """
+        new_settings = Settings(parser.get_section(APP_SECTION),
+                                RELOADABLE_DEFAULTS)
+        new_db_creds = parser.get_subsection_in_section(db_engine_type_in_use,
+                                                        "databases")
+        db.configure_pool(new_db_creds)
+        if sql_guard is not None:
+            sql_guard.configure(**get_guard_settings(new_db_creds))
+        mongo_guard.configure(**get_guard_settings(
+            parser.get_subsection_in_section("mongo", "databases")))
+        password_master.configure(
+            max_pending=new_settings.get_int("password_master.max_pending"),
+            queue_timeout=new_settings.get_duration(
+                "password_master.queue_timeout"))
+        for key, attr in (("user", "user_limiter"), ("ip", "ip_limiter")):
+            rate, burst = get_login_limit(new_settings, key)
+            limiter = getattr(login_limiter, attr)
+            if limiter is not None and rate > 0:
+                # keep buckets of the working limiter
+                limiter.rate, limiter.burst = rate, burst
+            else:
+                setattr(login_limiter, attr,
+                        make_login_limiter(key, rate, burst))
+        if query_tracker is not None:
+            query_tracker.configure(
+                slow_threshold=new_settings.get_duration(
+                    "queries.slow_threshold"),
+                repeat_threshold=new_settings.get_int(
+                    "queries.repeat_threshold"))
+        if write_queue is not None:
+            write_queue.configure(
+                max_batch=new_settings.get_int("write_behind.max_batch"),
+                max_delay=new_settings.get_duration("write_behind.max_delay"),
+                max_pending=new_settings.get_int("write_behind.max_pending"),
+                queue_timeout=new_settings.get_duration(
+                    "write_behind.queue_timeout"))
+        authn_policy.refresh_interval = new_settings.get_duration(
+            "auth.refresh_interval")
+        config.registry.settings["app_settings"] = new_settings
+
+    def find_user(userid):
+        """Find id and groups of the user in the database.
+
+        :param userid: user's login name.
+        :type userid: str
+        :return: tuple (user_id, groups) or None if there is no such user.
+        :rtype: tuple
+        """
+        query_output = db.select_one("id, groups", "Users",
+                                     {"username": userid})
+        if query_output is None:
+            return None
+        groups_list = query_output[1].split(", ")
+        logger.debug("User %s is in groups: %s", userid, groups_list)
+        return query_output[0], groups_list
+
+    auth_timeout = app_settings.get_duration("auth.timeout", 0)
+    authn_policy = TicketAuthenticationPolicy(
+        secret=settings["auth.secret"],
+        find_user=find_user,
+        get_version=lambda user_id: get_tickets_version(mongo_db, user_id),
+        refresh_interval=app_settings.get_duration("auth.refresh_interval"),
+        timeout=auth_timeout or None)
+
+    authz_policy = ACLAuthorizationPolicy()
+
+    config = Configurator(settings=settings, root_factory=RootFactory)
+    config.registry.settings["app_settings"] = app_settings
+    config.registry.settings["metrics"] = metrics
+    config.registry.settings["query_tracker"] = query_tracker
+    config.registry.settings["write_queue"] = write_queue
+    config.registry.settings["secondary_items"] = secondary_items
+    config.registry.settings["assets"] = AssetStore(
+        os.path.join(os.path.dirname(__file__), "static")).load()
+    config.set_authentication_policy(authn_policy)
+    config.set_authorization_policy(authz_policy)
+    config.add_renderer("json", "td.renderers.FastJSONRenderer")
+
+    config.add_static_view(name="static",
+                           path="td:static",
+                           cache_max_age=3600)
+    config.add_forbidden_view(view="td.views.forbidden_view")
+    config.add_view(view="td.views.service_unavailable_view",
+                    context="td.exceptions.PoolExhaustedException")
+    config.add_view(view="td.views.service_unavailable_view",
+                    context="td.exceptions.PasswordMasterBusyException")
+    config.add_view(view="td.views.service_unavailable_view",
+                    context="td.exceptions.WriteQueueBusyException")
+    config.add_view(view="td.views.service_unavailable_view",
+                    context="td.exceptions.BackendUnavailableException")
+
+    config.add_view(view="td.views.home",
+                    route_name="home",
+                    permission="entry")
+    config.add_view(view="td.views.get_todo_list_page",
+                    route_name="todo_list",
+                    request_method="GET",
+                    permission="entry")
+    config.add_view(view="td.views.get_todo_list_items",
+                    route_name="get_todo_list_items",
+                    renderer="json",
+                    xhr=True,
+                    request_method="GET",
+                    decorator=connect_db_to_view,
+                    permission="entry")
+    config.add_view(view="td.views.search_items",
+                    route_name="search_items",
+                    renderer="json",
+                    xhr=True,
+                    request_method="GET",
+                    decorator=connect_db_to_view,
+                    permission="entry")
+    config.add_view(view="td.views.add_todo_list_item",
+                    route_name="add_todo_list_item",
+                    renderer="json",
+                    xhr=True,
+                    request_method="POST",
+                    decorator=connect_db_to_view,
+                    permission="entry")
+    config.add_view(view="td.views.add_todo_list_items",
+                    route_name="add_todo_list_items",
+                    renderer="json",
+                    xhr=True,
+                    request_method="POST",
+                    decorator=connect_db_to_view,
+                    permission="entry")
+    config.add_view(view="td.views.remove_items",
+                    route_name="remove_items",
+                    renderer="json",
+                    xhr=True,
+                    request_method="POST",
+                    decorator=connect_db_to_view,
+                    permission="entry")
+    config.add_view(view="td.views.get_item_changes",
+                    route_name="changes",
+                    renderer="json",
+                    xhr=True,
+                    request_method="GET",
+                    decorator=connect_db_to_view,
+                    permission="entry")
+    config.add_view(view="td.views.get_login_page",
+                    route_name="login",
+                    request_method="GET")
+    config.add_view(view="td.views.post_login_credentials",
+                    route_name="post_login_credentials",
+                    xhr=True,
+                    request_method="POST",
+                    decorator=connect_db_to_view)
+    config.add_view(view="td.views.get_asset",
+                    route_name="assets",
+                    request_method="GET")
+    config.add_view(view="td.views.logout",
+                    route_name="logout")
+    config.add_view(view="td.views.remove_item",
+                    route_name="remove_item",
+                    renderer="json",
+                    xhr=True,
+                    request_method="POST",
+                    decorator=connect_db_to_view,
+                    permission="entry")
+
+    config.add_route(name="home", path="/")
+    config.add_route(name="todo_list", path="/todo_list")
+    config.add_route(name="get_todo_list_items",
+                     path="/api/get_todo_list_items")
+    config.add_route(name="search_items", path="/api/search_items")
+    config.add_route(name="add_todo_list_item", path="/api/add_todo_list_item")
+    config.add_route(name="login", path="/login")
+    config.add_route(name="post_login_credentials",
+                     path="/api/post_login_credentials")
+    config.add_route(name="logout", path="/logout")
+    config.add_route(name="remove_item", path="/api/remove_item")
+    config.add_route(name="add_todo_list_items",
+                     path="/api/add_todo_list_items")
+    config.add_route(name="remove_items", path="/api/remove_items")
+    config.add_route(name="changes", path="/api/changes")
+    config.add_route(name="assets", path="/assets/*subpath")
+
+    if query_tracker is not None:
+        config.add_tween("td.instrumentation.query_tracker_tween_factory")
+    if metrics is not None:
+        config.add_tween("td.metrics.metrics_tween_factory")
+        config.add_view(view="td.views.get_metrics",
+                        route_name="metrics",
+                        request_method="GET")
+        config.add_route(name="metrics", path="/metrics")
+
+    parser.add_listener(apply_reloaded_config)
+    reload_interval = app_settings.get_duration("config.reload_interval", 0)
+    if reload_interval > 0:
+        parser.start_watching(reload_interval)
+        # threads don't survive fork into the workers of td_serve_prefork
+        prefork.register_after_fork(
+            lambda: parser.start_watching(reload_interval))
+
+    app = config.make_wsgi_app()
+    timer.mark("pyramid")
+    logger.info("App is made in %.3f s: %s.", timer.total(), timer.format())
+    return app
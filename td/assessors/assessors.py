@@ -5,14 +5,75 @@
 
 .. moduleauthor:: Mykola Radionov <moodaq@gmail.com>
 
+Drivers of the engines are imported by get_driver when the engine is used
+for the first time, so the app doesn't load drivers of the engines it
+doesn't use.
 
 """
 
 
-import MySQLdb
-import psycopg2
+import importlib
+import math
+import re
+import time
+
+from td.assessors.pool import ConnectionPool, ThreadConnectionPool
+from td.config import parse_duration
+from td.exceptions import (PoolExhaustedException,
+                           WrongEngineException,
+                           WrongQueryException)
+from td.instrumentation import QueryEvent
+
+
+IDENTIFIER_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+# tables of the sqlite engine, the same as in fixtures/create_*_db.sql
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS Users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ip VARCHAR(15),
+    username VARCHAR(64) NOT NULL UNIQUE,
+    password VARCHAR(256) NOT NULL,
+    groups VARCHAR(64) NOT NULL
+);
+"""
+# modules of the drivers by engine type
+DRIVERS = {"mysql": "MySQLdb",
+           "postgres": "psycopg2",
+           "sqlite": "sqlite3"}
+
 
-from td.exceptions import WrongEngineException
+def get_driver(engine_type):
+    """Import driver module of the engine.
+
+    :param engine_type: 'mysql', 'postgres' or 'sqlite'.
+    :type engine_type: str
+    :return: DB-API module of the engine.
+    :rtype: module
+    :raises: WrongEngineException, ImportError
+    """
+    if engine_type not in DRIVERS:
+        raise WrongEngineException("Wrong argument describing engine type. "
+                                   "Use 'mysql', 'postgres' or 'sqlite'.")
+    return importlib.import_module(DRIVERS[engine_type])
+
+
+def get_transient_errors(engine_type):
+    """Get errors of the driver which mean the database is unavailable, slow
+    or overloaded, not that the query is wrong.
+
+    :param engine_type: 'mysql', 'postgres' or 'sqlite'.
+    :type engine_type: str
+    :return: tuple of exception classes, empty for unknown engine.
+    :rtype: tuple
+    """
+    if engine_type not in DRIVERS:
+        return ()
+    return (get_driver(engine_type).OperationalError,)
+
+
+def _whole_seconds(timeout):
+    """Round timeout up to whole seconds for drivers which take them."""
+    return int(math.ceil(timeout))
 
 
 class Assessor:
@@ -40,7 +101,8 @@ class Assessor:
 
 class MySQLDbAssessor(Assessor):
     """Context-manager for MySQLdb connection to the database."""
-    def __init__(self, host, user, password, db_name):
+    def __init__(self, host, user, password, db_name, connect_timeout=None,
+                 statement_timeout=None):
         """Initialize context-manager call with credentials.
 
         :param host: hostname.
@@ -51,6 +113,12 @@ class MySQLDbAssessor(Assessor):
         :type: str
         :param db_name: database name to use.
         :type: str
+        :param connect_timeout: seconds to wait for connection, None - wait
+        as long as the OS does.
+        :type: float
+        :param statement_timeout: seconds to wait for reply of the server to
+        each statement, None - no limit.
+        :type: float
 
         """
         self.host = host
@@ -58,15 +126,23 @@ class MySQLDbAssessor(Assessor):
         self.password = password
         self.db_name = db_name
 
-        self.db = MySQLdb.connect(self.host,
-                                  self.user,
-                                  self.password,
-                                  self.db_name)
+        options = {}
+        if connect_timeout:
+            options["connect_timeout"] = _whole_seconds(connect_timeout)
+        if statement_timeout:
+            options["read_timeout"] = _whole_seconds(statement_timeout)
+            options["write_timeout"] = _whole_seconds(statement_timeout)
+        self.db = get_driver("mysql").connect(self.host,
+                                              self.user,
+                                              self.password,
+                                              self.db_name,
+                                              **options)
 
 
 class PgresDbAssessor(Assessor):
     """Context-manager for psycopg2 connection to the database."""
-    def __init__(self, db_name, user, host, password):
+    def __init__(self, db_name, user, host, password, connect_timeout=None,
+                 statement_timeout=None):
         """Initialize context-manager call with credentials.
 
         :param db_name: database name to use.
@@ -77,6 +153,12 @@ class PgresDbAssessor(Assessor):
         :type: str
         :param password: password for authentication to local Postgres server.
         :type: str
+        :param connect_timeout: seconds to wait for connection, None - wait
+        as long as the OS does.
+        :type: float
+        :param statement_timeout: seconds after which the server cancels the
+        statement, None - no limit.
+        :type: float
 
         """
         self.db_name = db_name
@@ -84,30 +166,101 @@ class PgresDbAssessor(Assessor):
         self.host = host
         self.password = password
 
-        self.db = psycopg2.connect(dbname=self.db_name,
-                                   user=self.user,
-                                   host=self.host,
-                                   password=self.password)
+        options = {}
+        if connect_timeout:
+            options["connect_timeout"] = _whole_seconds(connect_timeout)
+        if statement_timeout:
+            options["options"] = "-c statement_timeout=%d" % (
+                statement_timeout * 1000)
+        self.db = get_driver("postgres").connect(dbname=self.db_name,
+                                                 user=self.user,
+                                                 host=self.host,
+                                                 password=self.password,
+                                                 **options)
+
+
+class SQLiteDbAssessor(Assessor):
+    """Context-manager for sqlite3 connection to the database file."""
+    def __init__(self, db_name, timeout=5.0):
+        """Open the database file in WAL mode, so readers don't wait for the
+        writer and commits don't sync the file every time.
+
+        :param db_name: path of the database file, created if it's absent.
+        :type: str
+        :param timeout: seconds to wait for lock of the other writer.
+        :type: float
+
+        """
+        self.db_name = db_name
+
+        # connection can be closed by the other thread than the owner one
+        self.db = get_driver("sqlite").connect(self.db_name,
+                                               timeout=timeout,
+                                               check_same_thread=False)
+        # return str like the other drivers do
+        self.db.text_factory = str
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+
+
+class PooledAssessor(Assessor):
+    """Context-manager which borrows connection from the ConnectionPool and
+    gives it back on exit instead of closing it.
+    """
+    def __init__(self, pool):
+        """Check out connection from the pool.
+
+        :param pool: pool to borrow connection from.
+        :type pool: td.assessors.pool.ConnectionPool
+        :raises: PoolExhaustedException
+        """
+        self.pool = pool
+        self.db = pool.acquire()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Exit the context and return connection to the pool. Connection is
+        closed if any error was raised inside the context, because it's state
+        is unknown after that.
+        """
+        self.pool.release(self.db, discard=exc_type is not None)
 
 
 class Connector(object):
     """Connector to mysql or postgres databases with interface for select /
     insert queries.
 
-    Initialize class passing to it engine_type string ('mysql' or 'postgres')
-    and it's credentials and params in the dict like {'host': 'localhost',
-    'user': 'root', 'password': 1234, 'db_name': 'db'}.
+    Initialize class passing to it engine_type string ('mysql', 'postgres' or
+    'sqlite') and it's credentials and params in the dict like
+    {'host': 'localhost', 'user': 'root', 'password': 1234, 'db_name': 'db'}.
+    For sqlite db_name is the path of the database file and the other
+    credentials are not needed.
 
     Three public methods available: select_one, select_all and insert which
-    send queries to the database server establishing connection with it
-    using MySQLDbAssessor and PgresDbAssessor drivers as context managers for
-    each single request.
+    send queries to the database server using connections borrowed from the
+    pool with PooledAssessor context manager. Pool opens new connections with
+    MySQLDbAssessor and PgresDbAssessor drivers and keeps them between
+    requests. It's limits are taken from the optional pool_* params in the
+    creds dict (see ConnectionPool for their meaning): pool_min_size,
+    pool_max_size, pool_idle_timeout, pool_timeout and pool_ping_interval.
+    There is no server behind sqlite, so instead of the pool each thread
+    keeps it's own connection to the file and Users table is created on the
+    first connection if it's absent.
+
+    Optional connect_timeout and statement_timeout params (5 and 10 seconds
+    by default, 0 - no limit) bound opening of connections and execution of
+    statements on mysql and postgres. On sqlite connect_timeout is the time
+    to wait for the lock of the other writer. Errors of the driver which
+    mean the database is unavailable or slow are listed in
+    transient_errors, see td.resilience.
+
+    Every executed statement is reported as QueryEvent to the listeners added
+    with add_listener, e.g. to td.instrumentation.QueryTracker.
     """
 
     def __init__(self, engine_type, creds_dict):
         """Initialize Connector with provided as arg database type.
 
-        :param engine_type: Type of engine ('mysql' or 'postgres').
+        :param engine_type: Type of engine ('mysql', 'postgres' or 'sqlite').
         :type engine_type: str
         :param creds_dict: Dict with creds and params.
         :type creds_dict: dict
@@ -115,41 +268,136 @@ class Connector(object):
         self.engine_type = engine_type
         self.__credentials_dict = creds_dict
         self.ERROR_MESSAGE = ("Wrong argument describing engine type. Use "
-                              "'mysql' or 'postgres'.")
+                              "'mysql', 'postgres' or 'sqlite'.")
+        self.statement_cache_size = int(creds_dict.get("statement_cache_size",
+                                                       32))
+        # compiled query texts, keyed by the structure of the query
+        self.__queries = {}
+        self.__listeners = []
+        # sqlite3 uses qmark style of params
+        self.__placeholder = "?" if engine_type == "sqlite" else "%s"
+        self.__schema_created = False
+        self.connect_timeout = parse_duration(
+            creds_dict.get("connect_timeout", 5)) or None
+        self.statement_timeout = parse_duration(
+            creds_dict.get("statement_timeout", 10)) or None
+        self.transient_errors = (get_transient_errors(engine_type) +
+                                 (PoolExhaustedException,))
+        if engine_type == "sqlite":
+            self.pool = ThreadConnectionPool(connect=self.__connect)
+        else:
+            self.pool = ConnectionPool(connect=self.__connect,
+                                       ping=self.__ping,
+                                       **self.__get_pool_limits(creds_dict))
 
-    def select_one(self, column_names, table, where_clause=None):
+    def configure_pool(self, creds_dict):
+        """Apply pool_* params of the reloaded config to the working pool.
+
+        Credentials are not changed, already opened connections are kept.
+
+        :param creds_dict: Dict with creds and params.
+        :type creds_dict: dict
+        :raises: ValueError
+        """
+        self.pool.configure(**self.__get_pool_limits(creds_dict))
+
+    def add_listener(self, listener):
+        """Add callable which is called with QueryEvent after each statement.
+
+        :param listener: callable which takes td.instrumentation.QueryEvent.
+        :type listener: callable
+        """
+        self.__listeners.append(listener)
+
+    @staticmethod
+    def __get_pool_limits(creds_dict):
+        """Get keyword arguments of ConnectionPool from pool_* params."""
+        return {"min_size": int(creds_dict.get("pool_min_size", 1)),
+                "max_size": int(creds_dict.get("pool_max_size", 10)),
+                "idle_timeout": float(creds_dict.get("pool_idle_timeout",
+                                                     300)),
+                "timeout": float(creds_dict.get("pool_timeout", 5)),
+                "ping_interval": float(creds_dict.get("pool_ping_interval",
+                                                      30))}
+
+    def __connect(self):
+        """Open new connection to the database in autocommit mode.
+
+        :return: connection object of the engine's driver.
+        :raises: WrongEngineException
+        """
+        if self.engine_type == "mysql":
+            db = MySQLDbAssessor(self.__credentials_dict["host"],
+                                 self.__credentials_dict["user"],
+                                 self.__credentials_dict["password"],
+                                 self.__credentials_dict["db_name"],
+                                 self.connect_timeout,
+                                 self.statement_timeout).db
+            db.autocommit(True)
+        elif self.engine_type == "postgres":
+            db = PgresDbAssessor(self.__credentials_dict["db_name"],
+                                 self.__credentials_dict["user"],
+                                 self.__credentials_dict["host"],
+                                 self.__credentials_dict["password"],
+                                 self.connect_timeout,
+                                 self.statement_timeout).db
+            db.autocommit = True
+        elif self.engine_type == "sqlite":
+            db = SQLiteDbAssessor(self.__credentials_dict["db_name"],
+                                  self.connect_timeout or 5.0).db
+            db.isolation_level = None
+            if not self.__schema_created:
+                db.executescript(SQLITE_SCHEMA)
+                self.__schema_created = True
+        else:
+            raise WrongEngineException(self.ERROR_MESSAGE)
+        return db
+
+    def __ping(self, db):
+        """Check if pooled connection is still alive.
+
+        :param db: connection object of the engine's driver.
+        :return: True if connection can be used.
+        :rtype: bool
+        """
+        if self.engine_type == "mysql":
+            db.ping()
+            return True
+        if db.closed:
+            return False
+        cursor = db.cursor()
+        cursor.execute("SELECT 1")
+        cursor.fetchone()
+        return True
+
+    def select_one(self, column_names, table, where=None):
         """
         Execute select query and return from it's output first row.
 
         Returns a tuple including string elements in it: ('1', 'User1'). If no
         data in the table for executed query then return value is None.
 
+        Values of the where dict are never inserted into the query text, they
+        are sent to the server as bound parameters:
+        .select_one("id, groups", "Users", {"username": "Jonathan Swift"})
+
         :param column_names: column names in the table to select.
         :type column_names: str
-        :param table: table name in the db.in  t
+        :param table: table name in the db.
         :type table: str
-        :param where_clause: condition for sql where clause.
-        :type where_clause: str
+        :param where: mapping of column names to values which should be equal
+        in the selected rows.
+        :type where: dict
         :return: tuple representing single row or None if no data in db.
         :rtype: tuple
-        :raises: WrongEngineException
+        :raises: WrongEngineException, WrongQueryException
         """
-        if self.engine_type == "mysql":
-            output = self.__exec_mysql_selection(column_names,
-                                                 table,
-                                                 where_clause,
-                                                 how_many="one")
-            return output
-        elif self.engine_type == "postgres":
-            output = self.__exec_pgres_selection(column_names,
-                                                 table,
-                                                 where_clause,
-                                                 how_many="one")
-            return output
-        else:
-            raise WrongEngineException(self.ERROR_MESSAGE)
+        return self.__exec_selection(column_names,
+                                     table,
+                                     where,
+                                     how_many="one")
 
-    def select_all(self, column_names, table, where_clause=None):
+    def select_all(self, column_names, table, where=None):
         """
         Execute select query and return from it's output all rows.
 
@@ -161,82 +409,58 @@ class Connector(object):
         :type column_names: str
         :param table: table name in the db.
         :type table: str
-        :param where_clause: condition for sql where clause.
-        :type where_clause: str
+        :param where: mapping of column names to values which should be equal
+        in the selected rows.
+        :type where: dict
         :return: tuple with all rows as included elements-tuples in it.
         :rtype: tuple
-        :raises: WrongEngineException
-        """
-        if self.engine_type == "mysql":
-            output = self.__exec_mysql_selection(column_names,
-                                                 table,
-                                                 where_clause,
-                                                 how_many="all")
-            return output
-        elif self.engine_type == "postgres":
-            output = self.__exec_pgres_selection(column_names,
-                                                 table,
-                                                 where_clause,
-                                                 how_many="all")
-            return output
-        else:
-            raise WrongEngineException(self.ERROR_MESSAGE)
-
-    def __exec_mysql_selection(self,
-                               column_names,
-                               table,
-                               where_clause=None,
-                               how_many="all"):
+        :raises: WrongEngineException, WrongQueryException
         """
-        Execute select query in mysql database.
+        return self.__exec_selection(column_names,
+                                     table,
+                                     where,
+                                     how_many="all")
 
-        In case when how_many arg is equal to 'all' then function fetches all
-        rows from select query. Output is a tuple with included tuples in it
-        representing rows: (('1', 'User1'), ('2', 'User2')). If there is no
-        data in the table for executed query then function returns single
-        tuple ().
+    def insert(self, table, column_names, values):
+        """Execute insert statement into database.
 
-        For all other values of how_many arg only one first row is fetched as a
-        tuple including string elements in it: ('1', 'User1'). If no data in
-        the table for executed query then return value is None.
+        It is expected to have args in the next format:
+        .insert("Users", "id, name", (1, "Jonathan Swift"))
+        .insert("Users", "name", ("Jonathan Swift",))
 
-        :param column_names: column names in the table to select.
-        :type column_names: str
-        :param table: table name in the db.
+        :param table: table name in the db for insert operation.
         :type table: str
-        :param where_clause: condition for sql where clause.
-        :type where_clause: str
-        :param how_many: defines selection of only first row or all rows.
-        :type how_many: str
-        :return: tuple with fetched data from selected query.
-        :rtype: tuple
+        :param column_names: column names in the table to affect.
+        :type column_names: str
+        :param values: values to be inserted, one for each column.
+        :type values: tuple
+        :return: None
+        :rtype: None
+        :raises: WrongEngineException, WrongQueryException
         """
-        with MySQLDbAssessor(self.__credentials_dict["host"],
-                             self.__credentials_dict["user"],
-                             self.__credentials_dict["password"],
-                             self.__credentials_dict["db_name"]) as db:
-            cursor = db.cursor()
-            args = (column_names, table)
-            query_template = "SELECT %s FROM %s"
-
-            if where_clause is not None:
-                args += (where_clause,)
-                query_template += " WHERE %s"
-
-            cursor.execute(query_template % args)
-
-            if how_many == "all":
-                return cursor.fetchall()
-            else:
-                return cursor.fetchone()
-
-    def __exec_pgres_selection(self,
-                               column_names,
-                               table,
-                               where_clause=None,
-                               how_many="all"):
+        values = tuple(values)
+        key = ("insert", table, column_names)
+        query = self.__queries.get(key)
+        if query is None:
+            columns = self.__split_columns(column_names)
+            if len(columns) != len(values):
+                raise WrongQueryException("Count of values doesn't match "
+                                          "count of columns.")
+            query = "INSERT INTO %s (%s) VALUES (%s)" % (
+                self.__quote(table),
+                ", ".join(self.__quote(column) for column in columns),
+                ", ".join([self.__placeholder] * len(columns)))
+            self.__queries[key] = query
+
+        self.__run(query, values)
+
+    def __exec_selection(self,
+                         column_names,
+                         table,
+                         where=None,
+                         how_many="all"):
         """
-        Execute select query in postgres database.
+        Execute select query in the database.
 
         In case when how_many arg is equal to 'all' then function fetches all
         rows from select query. Output is a tuple with included tuples in it
@@ -250,73 +474,137 @@ class Connector(object):
 
         :param column_names: column names in the table to select.
         :type column_names: str
-        :param table: table name in the db to select from.
+        :param table: table name in the db.
         :type table: str
-        :param where_clause: condition for sql where clause.
-        :type where_clause: str
+        :param where: mapping of column names to values for sql where clause.
+        :type where: dict
         :param how_many: defines selection of only first row or all rows.
         :type how_many: str
         :return: tuple with fetched data from selected query.
         :rtype: tuple
         """
-        with PgresDbAssessor(self.__credentials_dict["db_name"],
-                             self.__credentials_dict["user"],
-                             self.__credentials_dict["host"],
-                             self.__credentials_dict["password"]) as db:
-            cursor = db.cursor()
-
-            args = (column_names, table)
-            query_template = 'SELECT %s FROM "%s"'
-
-            if where_clause is not None:
-                args += (where_clause,)
-                query_template += ' WHERE %s'
-
-            cursor.execute(query_template % args)
-
-            if how_many == "all":
-                return tuple(cursor.fetchall())
-            else:
-                return cursor.fetchone()
-
-    def insert(self, table, column_names, values):
-        """Execute insert statement into database.
-
-        It is expected to have args in the next format:
-        .insert("Users", "id, name", "1, Jonathan Swift")
-        .insert("Users", "name", "Jonathan Swift")
-
-        :param table: table name in the db for insert operation.
-        :type table: str
-        :param column_names: column names in the table to affect.
-        :type column_names: str
-        :param values: values to be inserted
-        :type values: str
-        :return: None
-        :rtype: None
-        :raises: WrongEngineException
+        where = where or {}
+        where_columns = tuple(sorted(where))
+        key = ("select", table, column_names, where_columns)
+        query = self.__queries.get(key)
+        if query is None:
+            query = "SELECT %s FROM %s" % (
+                ", ".join(self.__quote(column)
+                          for column in self.__split_columns(column_names)),
+                self.__quote(table))
+            if where_columns:
+                query += " WHERE " + " AND ".join(
+                    "%s = %s" % (self.__quote(column), self.__placeholder)
+                    for column in where_columns)
+            self.__queries[key] = query
+        params = tuple(where[column] for column in where_columns)
+
+        return self.__run(query, params, how_many)
+
+    def __run(self, query, params, how_many=None):
+        """Execute query on pooled connection and report it to listeners.
+
+        Reported duration includes time of waiting for the pool and of
+        opening new connection, which is also reported separately as wait.
+
+        :param query: query with placeholders for params.
+        :type query: str
+        :param params: values for placeholders.
+        :type params: tuple
+        :param how_many: 'all' or 'one' to fetch rows of select query, None
+        to commit other statements.
+        :type how_many: str
+        :return: fetched rows, see __exec_selection.
         """
-
+        started = time.time()
+        acquired = None
+        try:
+            with PooledAssessor(self.pool) as db:
+                acquired = time.time()
+                cursor = self.__execute(db, query, params)
+                if how_many == "all":
+                    return tuple(cursor.fetchall())
+                elif how_many == "one":
+                    return cursor.fetchone()
+                db.commit()
+        finally:
+            if self.__listeners:
+                finished = time.time()
+                event = QueryEvent("sql", query, params, finished - started,
+                                   (acquired or finished) - started)
+                for listener in self.__listeners:
+                    listener(event)
+
+    def __execute(self, db, query, params):
+        """Execute query with bound params on pooled connection.
+
+        On postgres every distinct query is prepared once per connection with
+        PREPARE statement and then only EXECUTE with params is sent to the
+        server, so it is not parsed and planned again. Prepare is sent in the
+        same round trip with the first execution. Names of prepared statements
+        are kept in db.statements, up to statement_cache_size of them. Name is
+        cached only after the execution succeeds, and the name of failed
+        attempt isn't used again, since PREPARE of it could succeed.
+
+        MySQLdb has no server-side prepared statements, so on mysql query is
+        executed with params bound by the driver. sqlite3 keeps it's own cache
+        of compiled statements per connection.
+
+        :param db: connection borrowed from the pool.
+        :type db: td.assessors.pool.PooledConnection
+        :param query: query with placeholders for params.
+        :type query: str
+        :param params: values for placeholders.
+        :type params: tuple
+        :return: cursor with executed query.
+        """
+        cursor = db.cursor()
+        if self.engine_type != "postgres":
+            cursor.execute(query, params)
+            return cursor
+
+        statement = db.statements.get(query)
+        prepare = ""
+        if statement is None:
+            if len(db.statements) >= self.statement_cache_size:
+                cursor.execute(query, params)
+                return cursor
+            statement = "td_stmt_%d" % db.prepared_count
+            db.prepared_count += 1
+            parts = query.split("%s")
+            numbered = parts[0] + "".join("$%d%s" % (number, part)
+                                          for number, part
+                                          in enumerate(parts[1:], 1))
+            prepare = "PREPARE %s AS %s; " % (statement, numbered)
+
+        execute = "EXECUTE %s" % statement
+        if params:
+            execute += "(%s)" % ", ".join(["%s"] * len(params))
+        cursor.execute(prepare + execute, params)
+        if prepare:
+            db.statements[query] = statement
+        return cursor
+
+    def __quote(self, identifier):
+        """Validate table or column name and quote it for the engine in use.
+
+        :param identifier: name of the table or column.
+        :type identifier: str
+        :return: quoted name.
+        :rtype: str
+        :raises: WrongEngineException, WrongQueryException
+        """
+        if not IDENTIFIER_PATTERN.match(identifier):
+            raise WrongQueryException("Wrong table or column name: %r." %
+                                      identifier)
         if self.engine_type == "mysql":
-            assessor = MySQLDbAssessor
-            query_template = "INSERT INTO %s(%s) VALUES %s"
-        elif self.engine_type == "postgres":
-            assessor = PgresDbAssessor
-            query_template = 'INSERT INTO "%s"(%s) VALUES %s'
+            return "`%s`" % identifier
+        elif self.engine_type in ("postgres", "sqlite"):
+            return '"%s"' % identifier
         else:
             raise WrongEngineException(self.ERROR_MESSAGE)
 
-        with assessor(db_name=self.__credentials_dict["db_name"],
-                      user=self.__credentials_dict["user"],
-                      host=self.__credentials_dict["host"],
-                      password=self.__credentials_dict["password"]) as db:
-            cursor = db.cursor()
-            tupled_values = tuple(values.split(", "))
-            if len(tupled_values) == 1:
-                values = str(tupled_values)[:-2] + ")"
-            else:
-                values = str(tupled_values)
-            cursor.execute(query_template % (table,
-                                             column_names,
-                                             values))
-            db.commit()
+    @staticmethod
+    def __split_columns(column_names):
+        """Split comma separated column names: 'id, name' -> ['id', 'name']."""
+        return [column.strip() for column in column_names.split(",")]
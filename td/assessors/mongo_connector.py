@@ -0,0 +1,164 @@
+"""
+.. module:: mongo_connector
+   :platform: Unix
+   :synopsis: Users table kept in Mongo collection.
+
+.. moduleauthor:: Mykola Radionov <moodaq@gmail.com>
+
+
+"""
+
+import pymongo
+
+from td.assessors.assessors import IDENTIFIER_PATTERN
+from td.exceptions import WrongQueryException
+
+
+# collection with the last integer id of each table
+COUNTERS_COLLECTION = "Counters"
+
+
+class MongoConnector(object):
+    """Connector with the same select_one, select_all and insert methods as
+    td.assessors.assessors.Connector, which keeps tables as collections of
+    Mongo database, so users and their items live in the same store.
+
+    Rows are documents with the same fields as columns of the table, integer
+    id column is kept as _id and is taken from Counters collection when it's
+    not given on insert. pymongo has it's own pool, so there is no pool here
+    and it doesn't block greenlets under the evented server.
+    """
+    pool = None
+
+    def __init__(self, mongo_db):
+        """Initialize connector.
+
+        :param mongo_db: Mongo database to keep tables in.
+        :type mongo_db: pymongo.database.Database
+        """
+        self.mongo_db = mongo_db
+
+    def create_indexes(self):
+        """Create unique index of usernames in Users collection."""
+        self.mongo_db.Users.create_index([("username", pymongo.ASCENDING)],
+                                         unique=True)
+
+    def configure_pool(self, creds_dict):
+        """Accept Connector.configure_pool call, there is no pool here."""
+
+    def select_one(self, column_names, table, where=None):
+        """Find first document and return it's fields as a tuple like
+        ('1', 'User1'), None if there is no such document. See
+        Connector.select_one.
+
+        :param column_names: comma separated names of fields.
+        :type column_names: str
+        :param table: name of the collection.
+        :type table: str
+        :param where: mapping of field names to values which should be equal
+        in the selected documents.
+        :type where: dict
+        :return: tuple representing single row or None.
+        :rtype: tuple
+        :raises: WrongQueryException
+        """
+        columns = self.__split_columns(column_names)
+        document = self.__collection(table).find_one(
+            self.__filter(where), self.__projection(columns))
+        if document is None:
+            return None
+        return self.__row(document, columns)
+
+    def select_all(self, column_names, table, where=None):
+        """Find all documents and return their fields as tuple of tuples
+        ordered by id. See Connector.select_all.
+
+        :param column_names: comma separated names of fields.
+        :type column_names: str
+        :param table: name of the collection.
+        :type table: str
+        :param where: mapping of field names to values which should be equal
+        in the selected documents.
+        :type where: dict
+        :return: tuple with all rows as included elements-tuples in it.
+        :rtype: tuple
+        :raises: WrongQueryException
+        """
+        columns = self.__split_columns(column_names)
+        cursor = self.__collection(table).find(
+            self.__filter(where), self.__projection(columns))
+        return tuple(self.__row(document, columns)
+                     for document in cursor.sort("_id", pymongo.ASCENDING))
+
+    def insert(self, table, column_names, values):
+        """Insert document with fields of the columns into the collection.
+
+        :param table: name of the collection.
+        :type table: str
+        :param column_names: comma separated names of fields.
+        :type column_names: str
+        :param values: values of the fields, one for each column.
+        :type values: tuple
+        :return: None
+        :rtype: None
+        :raises: WrongQueryException, pymongo.errors.DuplicateKeyError
+        """
+        columns = self.__split_columns(column_names)
+        values = tuple(values)
+        if len(columns) != len(values):
+            raise WrongQueryException("Count of values doesn't match count "
+                                      "of columns.")
+        document = dict(zip(columns, values))
+        counters = self.mongo_db[COUNTERS_COLLECTION]
+        if "id" in document:
+            document["_id"] = document.pop("id")
+            counters.update_one({"_id": table},
+                                {"$max": {"last_id": document["_id"]}},
+                                upsert=True)
+        else:
+            counter = counters.find_one_and_update(
+                {"_id": table}, {"$inc": {"last_id": 1}}, upsert=True,
+                return_document=pymongo.ReturnDocument.AFTER)
+            document["_id"] = counter["last_id"]
+        self.__collection(table).insert_one(document)
+
+    def __collection(self, table):
+        """Get collection of the table checking it's name."""
+        self.__check_identifier(table)
+        return self.mongo_db[table]
+
+    def __filter(self, where):
+        """Make query of the where dict with id renamed to _id."""
+        return dict(("_id" if column == "id" else
+                     self.__check_identifier(column), value)
+                    for column, value in (where or {}).items())
+
+    @staticmethod
+    def __projection(columns):
+        """Make projection which returns only fields of the columns."""
+        projection = dict((column, True) for column in columns
+                          if column != "id")
+        projection["_id"] = "id" in columns
+        return projection
+
+    @staticmethod
+    def __row(document, columns):
+        """Make row tuple of the document fields in order of columns."""
+        return tuple(document.get("_id" if column == "id" else column)
+                     for column in columns)
+
+    @staticmethod
+    def __check_identifier(identifier):
+        """Check table or field name the same way Connector does.
+
+        :raises: WrongQueryException
+        """
+        if not IDENTIFIER_PATTERN.match(identifier):
+            raise WrongQueryException("Wrong table or column name: %r." %
+                                      identifier)
+        return identifier
+
+    def __split_columns(self, column_names):
+        """Split comma separated column names: 'id, name' -> ['id', 'name']."""
+        return [self.__check_identifier(column.strip())
+                for column in column_names.split(",")]
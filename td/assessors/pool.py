@@ -0,0 +1,449 @@
+"""
+.. module:: pool
+   :platform: Unix
+   :synopsis: Thread-safe pool of database connections.
+
+.. moduleauthor:: Mykola Radionov <moodaq@gmail.com>
+
+
+"""
+
+
+import logging
+import os
+import threading
+import time
+
+from td.exceptions import PoolExhaustedException
+
+
+logger = logging.getLogger(__name__)
+
+
+class PooledConnection(object):
+    """Wrapper around driver's connection object which is kept in the
+    ConnectionPool between checkouts.
+
+    Exposes cursor() and commit() of the wrapped connection, so it can be used
+    in the same way as connection returned by the other assessors.
+    """
+    def __init__(self, db):
+        """Wrap opened driver connection.
+
+        :param db: connection object created by MySQLdb or psycopg2.
+        :type db: object
+        """
+        self.db = db
+        # query text -> name of the statement prepared on this connection
+        self.statements = {}
+        # count of sent PREPAREs, names of statements are never reused
+        self.prepared_count = 0
+        self.created_at = time.time()
+        self.last_used = self.created_at
+
+    def cursor(self):
+        """Return new cursor of the wrapped connection."""
+        return self.db.cursor()
+
+    def commit(self):
+        """Commit current transaction of the wrapped connection."""
+        self.db.commit()
+
+    def close(self):
+        """Close the wrapped connection ignoring errors of already broken
+        connections.
+        """
+        try:
+            self.db.close()
+        except Exception:
+            logger.debug("Failed to close broken connection.", exc_info=True)
+
+
+class ConnectionPool(object):
+    """Bounded pool of connections to a single database server.
+
+    Connections are opened lazily on checkout while there are less than
+    max_size of them. When all of them are in use the caller waits for a
+    released one up to timeout seconds and then PoolExhaustedException is
+    raised. Idle connections which were not used for more than idle_timeout
+    seconds are closed, but never less than min_size of them are kept open.
+    Connection which stayed idle for more than ping_interval seconds is checked
+    with ping function before it is handed out.
+
+    Pool copied into a forked process forgets connections of the parent and
+    opens it's own ones, see td.servers.prefork.
+    """
+
+    def __init__(self, connect, ping, min_size=1, max_size=10,
+                 idle_timeout=300.0, timeout=5.0, ping_interval=30.0):
+        """Initialize pool with connection factory and limits.
+
+        :param connect: callable without args which opens new connection.
+        :type connect: callable
+        :param ping: callable which takes connection and returns True if it is
+        still usable.
+        :type ping: callable
+        :param min_size: count of connections kept open while idle.
+        :type min_size: int
+        :param max_size: upper bound of simultaneously opened connections.
+        :type max_size: int
+        :param idle_timeout: seconds after which idle connection is closed.
+        :type idle_timeout: float
+        :param timeout: seconds to wait for free connection when pool is
+        exhausted.
+        :type timeout: float
+        :param ping_interval: seconds of idleness after which connection is
+        pinged on checkout (0 to ping it on every checkout).
+        :type ping_interval: float
+        """
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ValueError("Pool size bounds should satisfy "
+                             "0 <= min_size <= max_size and max_size >= 1.")
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+
+        self._connect = connect
+        self._ping = ping
+        self._cond = threading.Condition(threading.Lock())
+        # Idle connections are used as a stack: the most recently released
+        # connection is handed out first and the least recently used ones
+        # stay at the bottom where the reaper finds them.
+        self._idle = []
+        self._size = 0
+        self._pid = os.getpid()
+        self._counters = {"checkouts": 0,
+                          "waits": 0,
+                          "timeouts": 0,
+                          "wait_time": 0.0,
+                          "opened": 0,
+                          "closed": 0,
+                          "failed_pings": 0}
+
+    def acquire(self):
+        """Check out connection from the pool.
+
+        :return: healthy connection wrapped in PooledConnection.
+        :rtype: td.assessors.pool.PooledConnection
+        :raises: PoolExhaustedException
+        """
+        while True:
+            conn = self._checkout()
+            if conn is None:
+                return self._open()
+            if self._is_healthy(conn):
+                return conn
+            self._discard(conn)
+
+    def release(self, conn, discard=False):
+        """Return connection back to the pool.
+
+        :param conn: connection previously returned by acquire.
+        :type conn: td.assessors.pool.PooledConnection
+        :param discard: close connection instead of keeping it for reuse.
+        :type discard: bool
+        """
+        if discard:
+            self._discard(conn)
+            return
+        conn.last_used = time.time()
+        with self._cond:
+            if self._size > self.max_size:
+                # pool was shrunk while the connection was checked out
+                self._size -= 1
+                self._cond.notify()
+                shrunk = True
+            else:
+                shrunk = False
+        if shrunk:
+            self._close_all([conn])
+            return
+        with self._cond:
+            self._idle.append(conn)
+            expired = self._pop_expired(conn.last_used)
+            self._cond.notify()
+        self._close_all(expired)
+
+    def configure(self, min_size=None, max_size=None, idle_timeout=None,
+                  timeout=None, ping_interval=None):
+        """Change limits of the working pool, see __init__ for their meaning.
+
+        Limits which are None are kept. When max_size is lowered, extra
+        connections are closed as they are released; when it's raised,
+        waiting callers are woken up to open new connections.
+
+        :raises: ValueError
+        """
+        with self._cond:
+            min_size = self.min_size if min_size is None else min_size
+            max_size = self.max_size if max_size is None else max_size
+            if max_size < 1 or min_size < 0 or min_size > max_size:
+                raise ValueError("Pool size bounds should satisfy "
+                                 "0 <= min_size <= max_size and "
+                                 "max_size >= 1.")
+            self.min_size = min_size
+            self.max_size = max_size
+            if idle_timeout is not None:
+                self.idle_timeout = idle_timeout
+            if timeout is not None:
+                self.timeout = timeout
+            if ping_interval is not None:
+                self.ping_interval = ping_interval
+            self._cond.notify_all()
+
+    def warm_up(self):
+        """Open connections up to min_size ahead of the first checkout.
+
+        :raises: PoolExhaustedException, errors of the driver
+        """
+        connections = []
+        try:
+            while len(connections) < self.min_size:
+                connections.append(self.acquire())
+        finally:
+            for conn in connections:
+                self.release(conn)
+
+    def close(self):
+        """Close all idle connections. Checked out ones are closed on
+        release only if they are discarded.
+        """
+        self._check_pid()
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        self._close_all(idle)
+
+    def stats(self):
+        """Get snapshot of pool's state and exhaustion counters.
+
+        :return: dict with sizes and counters of the pool.
+        :rtype: dict
+        """
+        with self._cond:
+            stats = dict(self._counters)
+            stats.update(size=self._size,
+                         idle=len(self._idle),
+                         in_use=self._size - len(self._idle),
+                         min_size=self.min_size,
+                         max_size=self.max_size)
+        return stats
+
+    def _checkout(self):
+        """Take idle connection or reserve place for a new one.
+
+        :return: idle connection or None if caller should open new one.
+        :rtype: td.assessors.pool.PooledConnection
+        :raises: PoolExhaustedException
+        """
+        self._check_pid()
+        started = None
+        expired = []
+        with self._cond:
+            self._counters["checkouts"] += 1
+            while True:
+                expired.extend(self._pop_expired(time.time()))
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    conn = None
+                    break
+
+                now = time.time()
+                if started is None:
+                    started = now
+                    self._counters["waits"] += 1
+                    logger.warning("Connection pool is exhausted (%d in use), "
+                                   "waiting for released connection.",
+                                   self._size)
+                remaining = started + self.timeout - now
+                if remaining <= 0:
+                    self._counters["timeouts"] += 1
+                    self._counters["wait_time"] += now - started
+                    raise PoolExhaustedException(
+                        "No free connection in the pool after waiting %.2f "
+                        "seconds." % self.timeout)
+                self._cond.wait(remaining)
+
+            if started is not None:
+                self._counters["wait_time"] += time.time() - started
+
+        self._close_all(expired)
+        return conn
+
+    def _check_pid(self):
+        """Forget connections inherited from the parent process. They are
+        left open, closing them here would end sessions of the parent.
+        """
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._cond:
+            if self._pid != pid:
+                self._idle = []
+                self._size = 0
+                self._pid = pid
+
+    def _open(self):
+        """Open new connection for the place reserved by _checkout."""
+        try:
+            conn = PooledConnection(self._connect())
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._counters["opened"] += 1
+        return conn
+
+    def _is_healthy(self, conn):
+        """Ping connection if it was idle for too long."""
+        if time.time() - conn.last_used < self.ping_interval:
+            return True
+        try:
+            healthy = self._ping(conn.db)
+        except Exception:
+            logger.debug("Ping of pooled connection failed.", exc_info=True)
+            healthy = False
+        if not healthy:
+            with self._cond:
+                self._counters["failed_pings"] += 1
+        return healthy
+
+    def _discard(self, conn):
+        """Close connection and free it's place in the pool."""
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+        self._close_all([conn])
+
+    def _pop_expired(self, now):
+        """Remove from idle stack connections which exceeded idle_timeout.
+
+        Must be called with the lock held. Returned connections should be
+        closed by the caller after the lock is released.
+        """
+        expired = []
+        while (self._size > self.min_size and self._idle and
+               now - self._idle[0].last_used > self.idle_timeout):
+            expired.append(self._idle.pop(0))
+            self._size -= 1
+        return expired
+
+    def _close_all(self, connections):
+        """Close connections that were already removed from the pool."""
+        for conn in connections:
+            conn.close()
+        if connections:
+            with self._cond:
+                self._counters["closed"] += len(connections)
+
+
+class ThreadConnectionPool(object):
+    """Pool which keeps one connection per thread, for embedded databases
+    where opening connection is cheap and there is no server to limit.
+
+    Has the same interface as ConnectionPool: connection of the calling
+    thread is returned by acquire and kept on release, so consecutive
+    queries of the thread share it. Pool limits are ignored.
+    """
+    def __init__(self, connect):
+        """Initialize empty pool.
+
+        :param connect: callable without arguments which opens new driver
+        connection.
+        :type connect: callable
+        """
+        self._connect = connect
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = set()
+        self._pid = os.getpid()
+        self._counters = {"checkouts": 0, "opened": 0, "closed": 0}
+
+    def acquire(self):
+        """Get connection of the calling thread, open it on the first call.
+
+        :return: connection wrapped in PooledConnection.
+        :rtype: td.assessors.pool.PooledConnection
+        """
+        self._check_pid()
+        conn = getattr(self._local, "conn", None)
+        # connection could be closed by close() from the other thread
+        if conn is None or conn not in self._connections:
+            conn = self._local.conn = PooledConnection(self._connect())
+            with self._lock:
+                self._connections.add(conn)
+                self._counters["opened"] += 1
+        self._counters["checkouts"] += 1
+        return conn
+
+    def release(self, conn, discard=False):
+        """Keep connection for the next call of the thread or close it.
+
+        :param conn: connection previously returned by acquire.
+        :type conn: td.assessors.pool.PooledConnection
+        :param discard: close connection instead of keeping it for reuse.
+        :type discard: bool
+        """
+        conn.last_used = time.time()
+        if discard:
+            if getattr(self._local, "conn", None) is conn:
+                self._local.conn = None
+            self._forget([conn])
+
+    def configure(self, **limits):
+        """Accept limits of ConnectionPool.configure and ignore them."""
+
+    def warm_up(self):
+        """Open connection of the calling thread, the other threads open
+        their own ones on the first checkout.
+        """
+        self.release(self.acquire())
+
+    def close(self):
+        """Close connections of all threads."""
+        self._check_pid()
+        with self._lock:
+            connections = list(self._connections)
+        self._forget(connections)
+
+    def stats(self):
+        """Get count of opened connections, see ConnectionPool.stats.
+
+        :return: dict with sizes and counters of the pool.
+        :rtype: dict
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats.update(size=len(self._connections), idle=0,
+                         in_use=len(self._connections))
+        return stats
+
+    def _check_pid(self):
+        """Forget connections inherited from the parent process without
+        closing them, see ConnectionPool._check_pid.
+        """
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid != pid:
+                self._local = threading.local()
+                self._connections = set()
+                self._pid = pid
+
+    def _forget(self, connections):
+        """Close connections and remove them from the pool."""
+        for conn in connections:
+            conn.close()
+        with self._lock:
+            self._connections.difference_update(connections)
+            self._counters["closed"] += len(connections)
+
@@ -0,0 +1,311 @@
+"""
+.. module:: assets
+   :platform: Unix
+   :synopsis: In-memory, precompressed and fingerprinted static assets of td
+   app.
+
+.. moduleauthor:: Mykola Radionov <moodaq@gmail.com>
+
+Static files are read once at startup. Each of them gets fingerprinted URL
+like /assets/todo_list_script.3f786850e3.js which changes with it's content,
+so it can be cached by browsers forever. References to the other assets in
+HTML pages (src and href attributes starting with static/) and in
+stylesheets (url(...)) are replaced with fingerprinted URLs. Compressible
+assets keep gzip variant of their body.
+
+Third-party libraries which were loaded from CDNs are vendored into
+static/vendor with td_fetch_vendor command, see VENDOR_ASSETS.
+
+"""
+
+import base64
+import gzip
+import hashlib
+import logging
+import os
+import posixpath
+import re
+import sys
+import urllib2
+from cStringIO import StringIO
+
+
+logger = logging.getLogger(__name__)
+
+# content types of the served files by extension
+CONTENT_TYPES = {".html": "text/html",
+                 ".css": "text/css",
+                 ".js": "application/javascript",
+                 ".map": "application/json",
+                 ".svg": "image/svg+xml",
+                 ".png": "image/png",
+                 ".gif": "image/gif",
+                 ".jpg": "image/jpeg",
+                 ".ico": "image/x-icon",
+                 ".eot": "application/vnd.ms-fontobject",
+                 ".ttf": "font/ttf",
+                 ".otf": "font/otf",
+                 ".woff": "font/woff",
+                 ".woff2": "font/woff2"}
+# types which are worth compressing, the others are compressed already
+COMPRESSIBLE_TYPES = ("text/html", "text/css", "application/javascript",
+                      "application/json", "image/svg+xml", "image/x-icon",
+                      "application/vnd.ms-fontobject", "font/ttf",
+                      "font/otf")
+# count of hex digits of content hash in fingerprinted URLs
+FINGERPRINT_LENGTH = 10
+# references to assets in HTML pages
+HTML_REFERENCE = re.compile(r'''(?P<attr>\b(?:src|href)=)(?P<quote>["'])'''
+                            r'''static/(?P<path>[^"'?#]+)(?P=quote)''')
+# references to assets in stylesheets
+CSS_REFERENCE = re.compile(r'''url\((?P<quote>["']?)(?P<path>[^"')?#]+)'''
+                           r'''(?P<suffix>[?#][^"')]*)?(?P=quote)\)''')
+
+# path in static directory -> (URL, SRI hash or None), pages which fall back
+# to the URL get the hash in their integrity attribute
+VENDOR_ASSETS = {
+    "vendor/jquery/jquery-1.10.2.min.js": (
+        "https://oss.maxcdn.com/libs/jquery/1.10.2/jquery.min.js", None),
+    "vendor/jquery/jquery-3.1.1.min.js": (
+        "https://code.jquery.com/jquery-3.1.1.min.js", None),
+    "vendor/tether/tether.min.js": (
+        "https://cdnjs.cloudflare.com/ajax/libs/tether/1.4.0/js/tether.min.js",
+        "sha384-DztdAPBWPRXSA/3eYEEUWrWCy7G5KFbe8fFjk5JAIxUYHKkDx6Qin1DkWx51bBrb"),
+    "vendor/bootstrap/css/bootstrap.min.css": (
+        "https://maxcdn.bootstrapcdn.com/bootstrap/4.0.0-alpha.6/css/"
+        "bootstrap.min.css",
+        "sha384-rwoIResjU2yc3z8GV/NPeZWAv56rSmLldC3R/AZzGRnGxQQKnKkoFVhFQhNUwEyJ"),
+    "vendor/bootstrap/js/bootstrap.min.js": (
+        "https://maxcdn.bootstrapcdn.com/bootstrap/4.0.0-alpha.6/js/"
+        "bootstrap.min.js",
+        "sha384-vBWWzlZJ8ea9aCX4pEW3rVHjgjt7zpkNpZk+02D9phzyeVkE+jo0ieGizqPLForn"),
+}
+for _name in ("css/font-awesome.min.css",
+              "fonts/fontawesome-webfont.eot",
+              "fonts/fontawesome-webfont.svg",
+              "fonts/fontawesome-webfont.ttf",
+              "fonts/fontawesome-webfont.woff",
+              "fonts/fontawesome-webfont.woff2",
+              "fonts/FontAwesome.otf"):
+    VENDOR_ASSETS["vendor/font-awesome/" + _name] = (
+        "https://maxcdn.bootstrapcdn.com/font-awesome/4.7.0/" + _name, None)
+
+
+class Asset(object):
+    """Static file kept in memory with it's gzip variant and ETags."""
+
+    def __init__(self, path, body, content_type, url):
+        """Prepare asset for serving.
+
+        :param path: path of the file relative to the static directory.
+        :type path: str
+        :param body: content of the file after references are replaced.
+        :type body: str
+        :param content_type: MIME type of the content.
+        :type content_type: str
+        :param url: URL which the asset is served at.
+        :type url: str
+        """
+        self.path = path
+        self.body = body
+        self.content_type = content_type
+        self.url = url
+        self.etag = hashlib.sha1(body).hexdigest()[:FINGERPRINT_LENGTH]
+        self.gzip_body = None
+        self.gzip_etag = None
+        if content_type in COMPRESSIBLE_TYPES:
+            compressed = _gzip(body)
+            if len(compressed) < len(body):
+                self.gzip_body = compressed
+                self.gzip_etag = self.etag + "-gz"
+
+
+def _gzip(body):
+    """Compress body with the best level and constant mtime, so equal bodies
+    give equal results.
+    """
+    buf = StringIO()
+    with gzip.GzipFile(fileobj=buf, mode="wb", compresslevel=9,
+                       mtime=0) as gzip_file:
+        gzip_file.write(body)
+    return buf.getvalue()
+
+
+def _fingerprint_url(prefix, path, body):
+    """Make URL like /assets/stylesheets/login.3f786850e3.css."""
+    base, extension = posixpath.splitext(path)
+    digest = hashlib.sha1(body).hexdigest()[:FINGERPRINT_LENGTH]
+    return "%s%s.%s%s" % (prefix, base, digest, extension)
+
+
+class AssetStore(object):
+    """Static assets of the directory loaded into memory.
+
+    Assets are found by fingerprinted URL (get) or by their path in the
+    directory (get_by_path), e.g. to serve HTML pages at their own routes.
+    """
+
+    def __init__(self, directory, url_prefix="/assets/"):
+        """Initialize empty store.
+
+        :param directory: path of the directory with static files.
+        :type directory: str
+        :param url_prefix: path which fingerprinted URLs start with.
+        :type url_prefix: str
+        """
+        self.directory = directory
+        self.url_prefix = url_prefix
+        self._by_path = {}
+        self._by_url = {}
+
+    def load(self):
+        """Read files of the directory, replace references between them and
+        compute fingerprints, gzip variants and ETags.
+
+        Files are processed in order: stylesheets after fonts and images they
+        refer to, HTML pages after everything else. Files with unknown
+        extensions are skipped.
+
+        :return: the store itself.
+        :rtype: td.assets.AssetStore
+        """
+        files = {}
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                full_path = os.path.join(root, name)
+                path = os.path.relpath(full_path, self.directory).replace(
+                    os.sep, "/")
+                if posixpath.splitext(path)[1] in CONTENT_TYPES:
+                    with open(full_path, "rb") as static_file:
+                        files[path] = static_file.read()
+
+        def order(path):
+            return {".css": 1, ".html": 2}.get(posixpath.splitext(path)[1], 0)
+
+        for path in sorted(files, key=order):
+            self._add(path, files[path])
+        missing = [path for path in VENDOR_ASSETS if path not in files]
+        if missing:
+            logger.warning("Vendored assets are missing, CDN is used for "
+                           "them: %s. Run td_fetch_vendor to download them.",
+                           ", ".join(sorted(missing)))
+        logger.info("Loaded %d static assets from %s.", len(self._by_path),
+                    self.directory)
+        return self
+
+    def get(self, url):
+        """Get asset by it's fingerprinted URL.
+
+        :param url: URL path like /assets/login_script.3f786850e3.js.
+        :type url: str
+        :return: asset or None if there is no such asset.
+        :rtype: td.assets.Asset
+        """
+        return self._by_url.get(url)
+
+    def get_by_path(self, path):
+        """Get asset by it's path relative to the static directory.
+
+        :param path: path like 'base.html'.
+        :type path: str
+        :return: asset or None if there is no such asset.
+        :rtype: td.assets.Asset
+        """
+        return self._by_path.get(path)
+
+    def url(self, path):
+        """Get URL of the asset by it's path, CDN URL for missing vendored
+        assets.
+
+        :param path: path relative to the static directory.
+        :type path: str
+        :return: fingerprinted URL or None if there is no such asset.
+        :rtype: str
+        """
+        asset = self._by_path.get(path)
+        if asset is not None:
+            return asset.url
+        if path in VENDOR_ASSETS:
+            return VENDOR_ASSETS[path][0]
+        return None
+
+    def _add(self, path, body):
+        """Replace references in body and add asset to the store."""
+        extension = posixpath.splitext(path)[1]
+        if extension == ".html":
+            body = HTML_REFERENCE.sub(self._replace_html_reference, body)
+        elif extension == ".css":
+            body = CSS_REFERENCE.sub(
+                lambda match: self._replace_css_reference(path, match), body)
+        url = _fingerprint_url(self.url_prefix, path, body)
+        asset = Asset(path, body, CONTENT_TYPES[extension], url)
+        self._by_path[path] = asset
+        self._by_url[url] = asset
+
+    def _replace_html_reference(self, match):
+        """Replace static/... reference in HTML with fingerprinted URL, or
+        with CDN URL checked by it's SRI hash for missing vendored asset.
+        """
+        path = match.group("path")
+        url = self.url(path)
+        if url is None:
+            logger.warning("Page refers to unknown asset static/%s.", path)
+            return match.group(0)
+        reference = "%s%s%s%s" % (match.group("attr"), match.group("quote"),
+                                  url, match.group("quote"))
+        if path not in self._by_path and VENDOR_ASSETS[path][1] is not None:
+            reference += ' integrity="%s" crossorigin="anonymous"' % (
+                VENDOR_ASSETS[path][1])
+        return reference
+
+    def _replace_css_reference(self, css_path, match):
+        """Replace relative url(...) in stylesheet with fingerprinted URL."""
+        reference = match.group("path")
+        if reference.startswith(("data:", "/")) or "://" in reference:
+            return match.group(0)
+        path = posixpath.normpath(posixpath.join(posixpath.dirname(css_path),
+                                                 reference))
+        url = self.url(path)
+        if url is None:
+            logger.warning("Stylesheet %s refers to unknown asset %s.",
+                           css_path, path)
+            return match.group(0)
+        return "url(%s%s%s%s)" % (match.group("quote"), url,
+                                  match.group("suffix") or "",
+                                  match.group("quote"))
+
+
+def _check_integrity(body, integrity):
+    """Check body against SRI hash like 'sha384-<base64 digest>'."""
+    algorithm, digest = integrity.split("-", 1)
+    return base64.b64encode(hashlib.new(algorithm, body).digest()) == digest
+
+
+def fetch_vendor_assets(directory, timeout=30):
+    """Download VENDOR_ASSETS into the static directory.
+
+    :param directory: path of the static directory.
+    :type directory: str
+    :param timeout: seconds to wait for each response.
+    :type timeout: float
+    :raises: IOError if download fails or SRI hash doesn't match.
+    """
+    for path, (url, integrity) in sorted(VENDOR_ASSETS.items()):
+        body = urllib2.urlopen(url, timeout=timeout).read()
+        if integrity is not None and not _check_integrity(body, integrity):
+            raise IOError("Integrity check of %s failed." % url)
+        full_path = os.path.join(directory, *path.split("/"))
+        if not os.path.isdir(os.path.dirname(full_path)):
+            os.makedirs(os.path.dirname(full_path))
+        with open(full_path, "wb") as vendor_file:
+            vendor_file.write(body)
+        print("%s -> %s" % (url, full_path))
+
+
+def fetch_vendor_main(argv=sys.argv):
+    """Entry point of td_fetch_vendor command which vendors third-party
+    assets into td/static/vendor.
+    """
+    directory = argv[1] if len(argv) > 1 else os.path.join(
+        os.path.dirname(__file__), "static")
+    fetch_vendor_assets(directory)
@@ -0,0 +1,202 @@
+"""
+.. module:: auth
+   :platform: Unix
+   :synopsis: Authentication policy which keeps user's id and groups in the
+   signed auth ticket.
+
+.. moduleauthor:: Mykola Radionov <moodaq@gmail.com>
+
+Ticket tokens carry integer id of the user, their groups and version of their
+tickets, so authenticated requests don't look the user up in Users table.
+Tokens are trusted for refresh_interval seconds after the ticket is issued,
+then the user is looked up again and the ticket is reissued with fresh
+tokens. All tickets of the user are revoked at once by revoke_tickets in
+td.versions, which is checked on every request by cheap lookup of
+Versions document by it's key.
+
+"""
+
+import binascii
+import logging
+import time
+
+from pyramid.authentication import AuthTktAuthenticationPolicy
+
+
+logger = logging.getLogger(__name__)
+
+# key of the validated identity in request.environ
+IDENTITY_KEY = "td.auth.identity"
+# prefixes of ticket tokens, tokens can't contain ':' of group names, so
+# groups are hex encoded
+USER_ID_TOKEN = "uid"
+VERSION_TOKEN = "ver"
+GROUP_TOKEN = "grp"
+
+
+def encode_tokens(user_id, groups, version):
+    """Make tokens of auth ticket.
+
+    :param user_id: integer id of the user.
+    :type user_id: int
+    :param groups: groups of the user like ['group:users'].
+    :type groups: list
+    :param version: version of user's tickets.
+    :type version: int
+    :return: tokens allowed by AuthTktCookieHelper.
+    :rtype: tuple
+    """
+    return (("%s%d" % (USER_ID_TOKEN, user_id),
+             "%s%d" % (VERSION_TOKEN, version)) +
+            tuple(GROUP_TOKEN + binascii.hexlify(group) for group in groups))
+
+
+def decode_tokens(tokens):
+    """Get user's id, version and groups from tokens of auth ticket.
+
+    :param tokens: tokens made by encode_tokens.
+    :type tokens: list
+    :return: tuple (user_id, version, groups) or None if tokens don't have
+    them, e.g. in tickets issued before tokens were added.
+    :rtype: tuple
+    """
+    user_id = version = None
+    groups = []
+    try:
+        for token in tokens:
+            if token.startswith(USER_ID_TOKEN):
+                user_id = int(token[len(USER_ID_TOKEN):])
+            elif token.startswith(VERSION_TOKEN):
+                version = int(token[len(VERSION_TOKEN):])
+            elif token.startswith(GROUP_TOKEN):
+                groups.append(binascii.unhexlify(token[len(GROUP_TOKEN):]))
+    except (ValueError, TypeError):
+        return None
+    if user_id is None or version is None:
+        return None
+    return user_id, version, groups
+
+
+def get_user_id(request):
+    """Get integer id of the user authenticated by TicketAuthenticationPolicy.
+
+    :param request: instance-object which represents HTTP request.
+    :type request: pyramid.request.Request
+    :return: user's id or None if the request wasn't authenticated by the
+    ticket with id.
+    :rtype: int
+    """
+    identity = request.environ.get(IDENTITY_KEY)
+    if identity is None:
+        return None
+    return identity["user_id"]
+
+
+class TicketAuthenticationPolicy(AuthTktAuthenticationPolicy):
+    """AuthTktAuthenticationPolicy which keeps user's id, groups and version
+    of their tickets in the ticket tokens.
+
+    Identity is validated once per request and kept in
+    request.environ[IDENTITY_KEY].
+    """
+
+    def __init__(self, secret, find_user, get_version=None,
+                 refresh_interval=300, **kwargs):
+        """Initialize policy.
+
+        :param secret: secret of the ticket signature.
+        :type secret: str
+        :param find_user: callable which takes username and returns tuple
+        (user_id, groups) or None if there is no such user.
+        :type find_user: callable
+        :param get_version: callable which takes user's id and returns
+        current version of their tickets, None - tickets aren't revoked.
+        :type get_version: callable
+        :param refresh_interval: seconds after which tokens of the ticket are
+        checked against the user in the database.
+        :type refresh_interval: float
+        :param kwargs: the other arguments of AuthTktAuthenticationPolicy
+        except callback.
+        """
+        super(TicketAuthenticationPolicy, self).__init__(
+            secret, callback=self._get_groups, **kwargs)
+        self.find_user = find_user
+        self.get_version = get_version
+        self.refresh_interval = refresh_interval
+
+    def identity(self, request):
+        """Get validated identity of the request.
+
+        :param request: instance-object which represents HTTP request.
+        :type request: pyramid.request.Request
+        :return: dict with username as userid, user_id and groups or None if
+        there is no valid ticket.
+        :rtype: dict
+        """
+        environ = request.environ
+        if IDENTITY_KEY not in environ:
+            environ[IDENTITY_KEY] = self._validate(request)
+        return environ[IDENTITY_KEY]
+
+    def unauthenticated_userid(self, request):
+        """Username of the valid ticket."""
+        identity = self.identity(request)
+        if identity is not None:
+            return identity["userid"]
+
+    def remember(self, request, userid, user_id=None, groups=(), **kw):
+        """Return headers which set the ticket cookie, see
+        AuthTktAuthenticationPolicy.remember.
+
+        :param user_id: integer id of the user to keep in the ticket, without
+        it the user is looked up on the next request.
+        :type user_id: int
+        :param groups: groups of the user to keep in the ticket.
+        :type groups: list
+        """
+        if user_id is not None:
+            version = self.get_version(user_id) if self.get_version else 0
+            kw["tokens"] = encode_tokens(user_id, groups, version)
+        return super(TicketAuthenticationPolicy, self).remember(
+            request, userid, **kw)
+
+    def _get_groups(self, userid, request):
+        """Callback of the policy which returns groups of the identity."""
+        identity = self.identity(request)
+        if identity is not None:
+            return identity["groups"]
+
+    def _validate(self, request):
+        """Check the ticket and refresh it's tokens if they are too old."""
+        ticket = self.cookie.identify(request)
+        if not ticket:
+            return None
+        userid = ticket["userid"]
+        decoded = decode_tokens(ticket["tokens"])
+        fresh = time.time() - ticket["timestamp"] < self.refresh_interval
+        if decoded is not None:
+            user_id, version, groups = decoded
+            if (self.get_version is not None and
+                    self.get_version(user_id) != version):
+                logger.info("Revoked ticket of user %s is rejected.", userid)
+                return None
+            if fresh:
+                return {"userid": userid, "user_id": user_id,
+                        "groups": groups}
+
+        user = self.find_user(userid)
+        if user is None:
+            logger.info("Ticket of unknown user %s is rejected.", userid)
+            return None
+        user_id, groups = user
+        headers = self.remember(request, userid, user_id=user_id,
+                                groups=groups)
+
+        def reissue_ticket(request, response):
+            # forget() during the request cancels the reissue
+            if not hasattr(request, "_authtkt_reissue_revoked"):
+                response.headerlist.extend(headers)
+
+        request.add_response_callback(reissue_ticket)
+        logger.debug("Ticket of user %s is refreshed.", userid)
+        return {"userid": userid, "user_id": user_id, "groups": groups}
@@ -7,44 +7,222 @@
 
 
 """
-from ConfigParser import SafeConfigParser
+import atexit
+import collections
+import logging
+import os
+import re
+import threading
+from ConfigParser import (InterpolationError,
+                          NoSectionError,
+                          SafeConfigParser)
+
+
+logger = logging.getLogger(__name__)
+
+TRUE_VALUES = ("true", "yes", "on", "1")
+FALSE_VALUES = ("false", "no", "off", "0", "")
+# seconds in each unit of duration, value without unit is in seconds
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600, "d": 86400}
+DURATION_PATTERN = re.compile(r"^\s*(\d+(?:\.\d*)?|\.\d+)\s*(ms|s|m|h|d)?\s*$")
+
+
+def parse_bool(value):
+    """Convert string from config to bool.
+
+    :param value: one of true/yes/on/1 or false/no/off/0 in any case.
+    :type value: str
+    :return: converted value.
+    :rtype: bool
+    :raises: ValueError
+    """
+    if isinstance(value, bool):
+        return value
+    lowered = str(value).strip().lower()
+    if lowered in TRUE_VALUES:
+        return True
+    if lowered in FALSE_VALUES:
+        return False
+    raise ValueError("Wrong boolean value: %r" % (value,))
+
+
+def parse_duration(value):
+    """Convert duration string from config to seconds.
+
+    '250ms' -> 0.25, '30' -> 30.0, '5m' -> 300.0, '1h' -> 3600.0
+
+    :param value: number with optional ms, s, m, h or d unit.
+    :type value: str
+    :return: duration in seconds.
+    :rtype: float
+    :raises: ValueError
+    """
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = DURATION_PATTERN.match(value)
+    if match is None:
+        raise ValueError("Wrong duration value: %r" % (value,))
+    number, unit = match.groups()
+    return float(number) * DURATION_UNITS[unit or "s"]
+
+
+class Settings(collections.Mapping):
+    """Immutable mapping of string settings with typed accessors.
+
+    Values are taken from values dict and then from defaults dict. Each value
+    is converted once and the result is cached, so repeated lookups are just
+    dict lookups.
+    """
+    CONVERTERS = {"str": str,
+                  "int": int,
+                  "float": float,
+                  "bool": parse_bool,
+                  "duration": parse_duration,
+                  "list": lambda value: tuple(value.replace(",", " ").split())}
+
+    def __init__(self, values=None, defaults=None):
+        """Initialize settings.
+
+        :param values: settings read from the config.
+        :type values: dict
+        :param defaults: values of the settings absent in the config.
+        :type defaults: dict
+        """
+        self._values = dict(defaults or {})
+        self._values.update(values or {})
+        # (key, type) -> converted value
+        self._typed = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, key):
+        return self._values[key]
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __repr__(self):
+        return "Settings(%r)" % (self._values,)
+
+    def get_str(self, key, default=None):
+        """Get setting as string, default if it's absent."""
+        return self._get_typed(key, "str", default)
+
+    def get_int(self, key, default=None):
+        """Get setting as int, default if it's absent.
+
+        :raises: ValueError
+        """
+        return self._get_typed(key, "int", default)
+
+    def get_float(self, key, default=None):
+        """Get setting as float, default if it's absent.
+
+        :raises: ValueError
+        """
+        return self._get_typed(key, "float", default)
+
+    def get_bool(self, key, default=None):
+        """Get setting as bool, see parse_bool, default if it's absent.
+
+        :raises: ValueError
+        """
+        return self._get_typed(key, "bool", default)
+
+    def get_duration(self, key, default=None):
+        """Get setting as seconds, see parse_duration, default if it's
+        absent.
+
+        :raises: ValueError
+        """
+        return self._get_typed(key, "duration", default)
+
+    def get_list(self, key, default=None):
+        """Get setting as tuple of words separated by spaces, commas or new
+        lines, default if it's absent.
+        """
+        return self._get_typed(key, "list", default)
+
+    def _get_typed(self, key, kind, default):
+        """Convert setting with the converter of kind and cache the result.
+
+        Default is returned as is when the setting is absent.
+        """
+        try:
+            return self._typed[(key, kind)]
+        except KeyError:
+            pass
+        if key not in self._values:
+            return default
+        value = self.CONVERTERS[kind](self._values[key])
+        with self._lock:
+            self._typed[(key, kind)] = value
+        return value
 
 
 class ConfigScanner:
     """Scan configs by sections and subsections.
 
-    Initialize class passing to it config location path as string.
+    Initialize class passing to it config location path as string. The file
+    is read once and sections are cached as Settings objects. Call
+    reload_if_changed or start_watching to re-read it after it's modification
+    and notify listeners added with add_listener.
 
-    Two public methods availble: parse_section and get_subsection_in_section.
+    Public methods: parse_section, get_section, get_subsection_in_section,
+    reload_if_changed, add_listener and start_watching.
     """
     def __init__(self, config_location):
         self.config_location = config_location
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._watcher = None
+        self._load()
 
     def parse_section(self, section_name):
         """Get dict of params for each unique key in the section.
 
         [('mysql.user', 'root'), ('mysql.password', '1234'),
-         ('postgres.host', 'localhost')] ->
+         ('postgres.host', 'localhost'), ('mongo.options.w', '1')] ->
          {'mysql': {'user': 'root', 'password': '1234'},
-          'postgres': {'host': 'localhost'}}
+          'postgres': {'host': 'localhost'},
+          'mongo': {'options.w': '1'}}
+
+        Keys are split on the first dot only. Keys without dot are skipped.
 
         :param section_name: section name taken from square brackets.
         :type param: str
-        :return: dictionary with params for each unique key.
+        :return: dictionary with Settings for each unique key.
         :rtype: dict
         """
-        parser = SafeConfigParser()
-        parser.read(self.config_location)
-        section_items = dict(parser.items(section_name))
+        sections, parsed = self._sections, self._parsed
+        if section_name not in parsed:
+            if section_name not in sections:
+                raise NoSectionError(section_name)
+            result = {}
+            for key, value in sections[section_name].items():
+                if "." not in key:
+                    continue
+                prefix, true_key = key.split(".", 1)
+                result.setdefault(prefix, {})[true_key] = value
+            parsed[section_name] = dict((prefix, Settings(values))
+                                        for prefix, values in result.items())
+        return parsed[section_name]
 
-        result = {}
+    def get_section(self, section_name):
+        """Get all params of the section.
 
-        for key in section_items.keys():
-            prefix, true_key = key.split('.')
-            result.setdefault(prefix, {})
-            result[prefix][true_key] = section_items.get(key)
-
-        return result
+        :param section_name: section name taken from square brackets.
+        :type section_name: str
+        :return: settings of the section.
+        :rtype: td.config.Settings
+        :raises: ConfigParser.NoSectionError
+        """
+        try:
+            return self._sections[section_name]
+        except KeyError:
+            raise NoSectionError(section_name)
 
     def get_subsection_in_section(self, subsection_name, section_name):
         """ Get dict of params for one single key (subsection) in the section.
@@ -53,15 +231,105 @@ class ConfigScanner:
         :type subsection_name: str
         :param section_name: section name taken from square brackets.
         :type section_name: str
-        :return: dictionary with items for single unique key in section.
-        :rtype: dict
+        :return: settings for single unique key in section.
+        :rtype: td.config.Settings
         """
         section = self.parse_section(section_name)
         return section.get(subsection_name)
 
+    def add_listener(self, listener):
+        """Add callable which is called with the scanner after config file
+        is reloaded.
+
+        :param listener: callable with one argument.
+        :type listener: callable
+        """
+        self._listeners.append(listener)
+
+    def reload_if_changed(self):
+        """Re-read config file if it's modification time changed and notify
+        listeners. Errors of reading and of listeners are logged and the
+        previous config is kept.
 
-    #second method for db:
-    #def get_engine_creds(self, engine):
-    #   raise error if engine isn't proper
-    #   self.parse_section('databases').get(engine)
-    # is it hardcoded?
+        :return: True if config was reloaded.
+        :rtype: bool
+        """
+        try:
+            mtime = os.path.getmtime(self.config_location)
+        except OSError:
+            logger.warning("Can't stat config %s.", self.config_location)
+            return False
+        if mtime == self.mtime:
+            return False
+        with self._lock:
+            try:
+                self._load()
+            except Exception:
+                logger.exception("Failed to reload config %s.",
+                                 self.config_location)
+                self.mtime = mtime
+                return False
+        logger.info("Config %s is reloaded.", self.config_location)
+        for listener in self._listeners:
+            try:
+                listener(self)
+            except Exception:
+                logger.exception("Failed to apply reloaded config.")
+        return True
+
+    def start_watching(self, interval):
+        """Start daemon thread which calls reload_if_changed every interval
+        seconds. Does nothing if it's already started in this process.
+
+        :param interval: seconds between checks of the file.
+        :type interval: float
+        """
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+        stopped = threading.Event()
+
+        def watch():
+            while not stopped.wait(interval):
+                self.reload_if_changed()
+
+        self._watcher = threading.Thread(target=watch,
+                                         name="config-watcher")
+        self._watcher.daemon = True
+        self._watcher.stopped = stopped
+        self._watcher.start()
+        # daemon thread which wakes up during shutdown of the interpreter
+        # fails on it's cleared modules
+        atexit.register(self.stop_watching)
+
+    def stop_watching(self, timeout=1.0):
+        """Stop thread started by start_watching and wait for it.
+
+        :param timeout: seconds to wait for the thread.
+        :type timeout: float
+        """
+        watcher, self._watcher = self._watcher, None
+        if watcher is not None:
+            watcher.stopped.set()
+            if watcher is not threading.current_thread():
+                watcher.join(timeout)
+
+    def _load(self):
+        """Read config file and replace cached sections."""
+        mtime = os.path.getmtime(self.config_location)
+        here = os.path.dirname(os.path.abspath(self.config_location))
+        parser = SafeConfigParser()
+        if not parser.read(self.config_location):
+            raise IOError("Can't read config %s." % self.config_location)
+        sections = {}
+        for section_name in parser.sections():
+            try:
+                items = parser.items(section_name, vars={"here": here})
+            except InterpolationError:
+                # e.g. logging formats which are interpolated by logging
+                items = parser.items(section_name, raw=True)
+            sections[section_name] = Settings(
+                (key, value) for key, value in items if key != "here")
+        # readers use whatever pair of caches was current when they looked
+        self._sections = sections
+        self._parsed = {}
+        self.mtime = mtime
@@ -16,3 +16,48 @@ class WrongEngineException(Exception):
     def __init__(self, message, *args):
         self.message = message
         super(WrongEngineException, self).__init__(message, *args)
+
+
+class WrongQueryException(Exception):
+    """Class for exceptions which should trigger when query can't be built
+    from provided args (e.g. wrong table or column name).
+    """
+    def __init__(self, message, *args):
+        self.message = message
+        super(WrongQueryException, self).__init__(message, *args)
+
+
+class PoolExhaustedException(Exception):
+    """Class for exceptions which should trigger when all connections of the
+    pool are in use and none of them was released in time.
+    """
+    def __init__(self, message, *args):
+        self.message = message
+        super(PoolExhaustedException, self).__init__(message, *args)
+
+
+class PasswordMasterBusyException(Exception):
+    """Class for exceptions which should trigger when password can't be
+    hashed or checked in time because of too many waiting calls.
+    """
+    def __init__(self, message, *args):
+        self.message = message
+        super(PasswordMasterBusyException, self).__init__(message, *args)
+
+
+class WriteQueueBusyException(Exception):
+    """Class for exceptions which should trigger when document can't be
+    queued or written in time because of too many queued writes.
+    """
+    def __init__(self, message, *args):
+        self.message = message
+        super(WriteQueueBusyException, self).__init__(message, *args)
+
+
+class BackendUnavailableException(Exception):
+    """Class for exceptions which should trigger when calls of the database
+    are rejected without trying because it's circuit breaker is open.
+    """
+    def __init__(self, message, *args):
+        self.message = message
+        super(BackendUnavailableException, self).__init__(message, *args)
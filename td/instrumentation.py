@@ -0,0 +1,344 @@
+"""
+.. module:: instrumentation
+   :platform: Unix
+   :synopsis: Timing of SQL and Mongo queries, slow query log and per-request
+   query counts.
+
+.. moduleauthor:: Mykola Radionov <moodaq@gmail.com>
+
+Connector reports every SQL statement as QueryEvent to it's listeners and
+Mongo calls are reported the same way by InstrumentedDatabase which wraps
+pymongo database (pymongo 2.9 has no command listeners). QueryTracker is
+such a listener: it logs statements slower than slow_threshold with their
+params redacted and counts queries of the current request. Request is
+started and finished by query_tracker_tween_factory which logs requests
+with repeated identical queries.
+
+Queries of streamed responses which run after the tween has finished are
+only checked for slowness.
+
+"""
+
+import collections
+import functools
+import inspect
+import logging
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+# kind is 'sql' or 'mongo', duration and wait (for pooled connection) are in
+# seconds
+QueryEvent = collections.namedtuple("QueryEvent",
+                                    "kind statement params duration wait")
+# placeholder of redacted values
+REDACTED = "?"
+
+
+def redact(value):
+    """Replace values in params with placeholders keeping their structure,
+    i.e. keys of Mongo queries and count of SQL params.
+
+    :param value: params of query.
+    :return: params with REDACTED instead of values.
+    """
+    if isinstance(value, dict):
+        return dict((key, redact(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return type(value)(redact(item) for item in value)
+    if value is None:
+        return None
+    return REDACTED
+
+
+class RequestQueries(object):
+    """Counts and durations of queries issued by one request."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.wait = 0.0
+        # (kind, statement, repr of params) -> count of executions
+        self._executions = {}
+
+    def record(self, event):
+        """Add query to the counters.
+
+        :param event: finished query.
+        :type event: td.instrumentation.QueryEvent
+        """
+        self.count += 1
+        self.duration += event.duration
+        self.wait += event.wait
+        key = (event.kind, event.statement, repr(event.params))
+        self._executions[key] = self._executions.get(key, 0) + 1
+
+    def repeated(self, threshold=2):
+        """Get queries which were executed with the same params at least
+        threshold times.
+
+        :param threshold: the smallest count of executions to report.
+        :type threshold: int
+        :return: list of tuples (kind, statement, count).
+        :rtype: list
+        """
+        return sorted((kind, statement, count)
+                      for (kind, statement, _), count
+                      in self._executions.items()
+                      if count >= threshold)
+
+
+class QueryTracker(object):
+    """Listener of QueryEvent which logs slow queries and counts queries of
+    the current request.
+
+    Current request is kept in thread local storage, which is greenlet local
+    when threading is patched by gevent.
+    """
+
+    def __init__(self, slow_threshold=0.1, repeat_threshold=2):
+        """Initialize tracker.
+
+        :param slow_threshold: seconds after which query is logged as slow.
+        :type slow_threshold: float
+        :param repeat_threshold: count of identical queries of one request
+        after which request is logged, 0 - don't check.
+        :type repeat_threshold: int
+        """
+        self.slow_threshold = slow_threshold
+        self.repeat_threshold = repeat_threshold
+        self._local = threading.local()
+
+    def configure(self, slow_threshold=None, repeat_threshold=None):
+        """Change thresholds of the working tracker, None keeps the value."""
+        if slow_threshold is not None:
+            self.slow_threshold = slow_threshold
+        if repeat_threshold is not None:
+            self.repeat_threshold = repeat_threshold
+
+    def current(self):
+        """Get queries of the request handled by this thread.
+
+        :return: queries of the request or None outside of request.
+        :rtype: td.instrumentation.RequestQueries
+        """
+        return getattr(self._local, "queries", None)
+
+    def activate(self, queries):
+        """Make queries current for this thread.
+
+        :param queries: queries of the request or None.
+        :type queries: td.instrumentation.RequestQueries
+        :return: previously current queries.
+        :rtype: td.instrumentation.RequestQueries
+        """
+        previous = getattr(self._local, "queries", None)
+        self._local.queries = queries
+        return previous
+
+    def __call__(self, event):
+        """Record finished query.
+
+        :param event: finished query.
+        :type event: td.instrumentation.QueryEvent
+        """
+        if event.duration >= self.slow_threshold:
+            logger.warning("Slow %s query took %.1f ms (%.1f ms waiting for "
+                           "connection): %s params %r", event.kind,
+                           event.duration * 1e3, event.wait * 1e3,
+                           event.statement, redact(event.params))
+        queries = self.current()
+        if queries is not None:
+            queries.record(event)
+
+    def report(self, name, queries):
+        """Log counters of finished request and it's repeated queries.
+
+        :param name: description of the request, e.g. it's path.
+        :type name: str
+        :param queries: queries of the request.
+        :type queries: td.instrumentation.RequestQueries
+        """
+        logger.debug("Request %s issued %d queries in %.1f ms.", name,
+                     queries.count, queries.duration * 1e3)
+        if self.repeat_threshold <= 0:
+            return
+        for kind, statement, count in queries.repeated(self.repeat_threshold):
+            logger.warning("Request %s issued identical %s query %d times: "
+                           "%s", name, kind, count, statement)
+
+
+def query_tracker_tween_factory(handler, registry):
+    """Make tween which counts queries of every request with QueryTracker
+    kept in registry.settings['query_tracker'].
+
+    Queries of the request are available as request.queries.
+    """
+    tracker = registry.settings["query_tracker"]
+
+    def query_tracker_tween(request):
+        queries = request.queries = RequestQueries()
+        previous = tracker.activate(queries)
+        try:
+            return handler(request)
+        finally:
+            tracker.activate(previous)
+            tracker.report(request.path, queries)
+
+    return query_tracker_tween
+
+
+def _is_cursor(value):
+    """Check if value is cursor returned by find of the collection."""
+    return hasattr(value, "next") and hasattr(value, "sort")
+
+
+def is_method(value):
+    """Check if value is method (or method of the other proxy), not
+    collection or attribute, it's shared with the proxies of td.resilience.
+    """
+    return inspect.isroutine(value)
+
+
+class InstrumentedDatabase(object):
+    """Proxy of Mongo database which gives out InstrumentedCollection."""
+
+    def __init__(self, database, listener):
+        """Wrap database.
+
+        :param database: Mongo database.
+        :type database: pymongo.database.Database
+        :param listener: callable which takes QueryEvent.
+        :type listener: callable
+        """
+        self._database = database
+        self._listener = listener
+
+    def __getattr__(self, name):
+        attribute = getattr(self._database, name)
+        if name.startswith("_") or is_method(attribute):
+            return attribute
+        return InstrumentedCollection(attribute, self._listener)
+
+    def __getitem__(self, name):
+        return InstrumentedCollection(self._database[name], self._listener)
+
+    def __repr__(self):
+        return "InstrumentedDatabase(%r)" % (self._database,)
+
+
+class InstrumentedCollection(object):
+    """Proxy of Mongo collection which reports it's method calls as
+    QueryEvent like 'Items.find_one'. Cursors are reported when they are
+    exhausted or closed with time of fetching all batches.
+    """
+
+    def __init__(self, collection, listener):
+        """Wrap collection.
+
+        :param collection: Mongo collection.
+        :type collection: pymongo.collection.Collection
+        :param listener: callable which takes QueryEvent.
+        :type listener: callable
+        """
+        self._collection = collection
+        self._listener = listener
+
+    def __getattr__(self, name):
+        attribute = getattr(self._collection, name)
+        if name.startswith("_") or not is_method(attribute):
+            return attribute
+        statement = "%s.%s" % (self._collection.name, name)
+
+        @functools.wraps(attribute)
+        def call(*args, **kwargs):
+            params = args[0] if args and isinstance(args[0], dict) else None
+            started = time.time()
+            try:
+                result = attribute(*args, **kwargs)
+            except Exception:
+                self._listener(QueryEvent("mongo", statement, params,
+                                          time.time() - started, 0.0))
+                raise
+            if _is_cursor(result):
+                return InstrumentedCursor(result, self._listener, statement,
+                                          params, time.time() - started)
+            self._listener(QueryEvent("mongo", statement, params,
+                                      time.time() - started, 0.0))
+            return result
+        return call
+
+    def with_options(self, *args, **kwargs):
+        """Get the same collection with other options, instrumented too."""
+        return InstrumentedCollection(
+            self._collection.with_options(*args, **kwargs), self._listener)
+
+    def __repr__(self):
+        return "InstrumentedCollection(%r)" % (self._collection,)
+
+
+class InstrumentedCursor(object):
+    """Proxy of Mongo cursor which sums up time of fetching documents."""
+
+    def __init__(self, cursor, listener, statement, params, duration=0.0):
+        """Wrap cursor.
+
+        :param cursor: Mongo cursor.
+        :type cursor: pymongo.cursor.Cursor
+        :param listener: callable which takes QueryEvent.
+        :type listener: callable
+        :param statement: name of the query like 'Items.find'.
+        :type statement: str
+        :param params: filter of the query.
+        :type params: dict
+        :param duration: seconds spent before the first fetch.
+        :type duration: float
+        """
+        self._cursor = cursor
+        self._listener = listener
+        self._statement = statement
+        self._params = params
+        self._duration = duration
+        self._reported = False
+
+    def __getattr__(self, name):
+        attribute = getattr(self._cursor, name)
+        if name.startswith("_") or not is_method(attribute):
+            return attribute
+
+        @functools.wraps(attribute)
+        def call(*args, **kwargs):
+            result = attribute(*args, **kwargs)
+            # sort, limit and the like return the cursor itself
+            return self if result is self._cursor else result
+        return call
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        started = time.time()
+        try:
+            document = self._cursor.next()
+        except StopIteration:
+            self._duration += time.time() - started
+            self._report()
+            raise
+        self._duration += time.time() - started
+        return document
+
+    __next__ = next
+
+    def close(self):
+        """Close the cursor and report it."""
+        self._cursor.close()
+        self._report()
+
+    def _report(self):
+        """Report the query once."""
+        if not self._reported:
+            self._reported = True
+            self._listener(QueryEvent("mongo", self._statement, self._params,
+                                      self._duration, 0.0))
@@ -0,0 +1,238 @@
+"""
+.. module:: metrics
+   :platform: Unix
+   :synopsis: Request metrics of td app in Prometheus text format.
+
+.. moduleauthor:: Mykola Radionov <moodaq@gmail.com>
+
+metrics_tween_factory records count of requests by route and status,
+latency histogram by route and count of requests in flight. Each thread
+writes into it's own shard without locks and shards are summed up only when
+/metrics is scraped. Gauges like waitress queue depth or size of connection
+pool are callables which are asked for the value on scrape, and so are
+counters kept by other services like login limiters.
+
+"""
+
+import bisect
+import sys
+import threading
+import time
+
+
+# upper bounds of latency histogram buckets in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+# route of requests which didn't match any route
+NOT_FOUND_ROUTE = "not_found"
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+def _make_local():
+    """Create thread local storage which is shared by greenlets of one OS
+    thread when threading is patched by gevent.
+    """
+    monkey = sys.modules.get("gevent.monkey")
+    if monkey is not None and monkey.is_module_patched("threading"):
+        return monkey.get_original("threading", "local")()
+    return threading.local()
+
+
+class _Shard(object):
+    """Counters written by a single thread."""
+
+    def __init__(self, buckets_count):
+        # (route, status) -> count of requests
+        self.requests = {}
+        # route -> counts of latencies in each bucket, the last one is +Inf,
+        # followed by the sum of latencies
+        self.latencies = {}
+        self.in_flight = 0
+        self.buckets_count = buckets_count
+
+
+class MetricsRegistry(object):
+    """Per-thread shards of request counters and registered gauges."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS, prefix="td"):
+        """Initialize empty registry.
+
+        :param buckets: sorted upper bounds of latency buckets in seconds.
+        :type buckets: tuple
+        :param prefix: prefix of metric names.
+        :type prefix: str
+        """
+        self.buckets = tuple(buckets)
+        self.prefix = prefix
+        self._local = _make_local()
+        self._shards = []
+        self._gauges = []
+        self._counters = []
+        self._lock = threading.Lock()
+
+    def shard(self):
+        """Get shard of the current thread, create it on the first call."""
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = _Shard(len(self.buckets) + 1)
+            with self._lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+            return shard
+
+    def observe(self, route, status, duration, shard=None):
+        """Record finished request.
+
+        :param route: name of the matched route.
+        :type route: str
+        :param status: status code of the response.
+        :type status: int
+        :param duration: seconds spent in the request.
+        :type duration: float
+        :param shard: shard of the current thread if it's known already.
+        :type shard: td.metrics._Shard
+        """
+        if shard is None:
+            shard = self.shard()
+        key = (route, status)
+        requests = shard.requests
+        requests[key] = requests.get(key, 0) + 1
+        latencies = shard.latencies.get(route)
+        if latencies is None:
+            latencies = shard.latencies[route] = [0] * (
+                shard.buckets_count + 1)
+        latencies[bisect.bisect_left(self.buckets, duration)] += 1
+        latencies[-1] += duration
+
+    def add_gauge(self, name, help_text, func):
+        """Register gauge which value is taken from func on every scrape.
+
+        :param name: metric name without prefix.
+        :type name: str
+        :param help_text: description of the metric.
+        :type help_text: str
+        :param func: callable without args which returns number.
+        :type func: callable
+        """
+        with self._lock:
+            self._gauges.append((name, help_text, func))
+
+    def add_counter(self, name, help_text, func, label):
+        """Register counter which values are taken from func on every
+        scrape.
+
+        :param name: metric name without prefix, ending with _total.
+        :type name: str
+        :param help_text: description of the metric.
+        :type help_text: str
+        :param func: callable without args which returns dict of label
+        value -> count.
+        :type func: callable
+        :param label: name of the label.
+        :type label: str
+        """
+        with self._lock:
+            self._counters.append((name, help_text, func, label))
+
+    def collect(self):
+        """Sum up shards of all threads.
+
+        :return: tuple (dict of (route, status) -> count, dict of route ->
+        cumulative bucket counts with the sum of latencies, count of
+        requests in flight).
+        :rtype: tuple
+        """
+        with self._lock:
+            shards = list(self._shards)
+        requests = {}
+        latencies = {}
+        in_flight = 0
+        for shard in shards:
+            # copies are made by C code, so they don't see half updates
+            for key, count in dict(shard.requests).items():
+                requests[key] = requests.get(key, 0) + count
+            for route, counts in dict(shard.latencies).items():
+                total = latencies.setdefault(route, [0] * len(counts))
+                for index, count in enumerate(list(counts)):
+                    total[index] += count
+            in_flight += shard.in_flight
+        for counts in latencies.values():
+            for index in range(1, len(counts) - 1):
+                counts[index] += counts[index - 1]
+        return requests, latencies, in_flight
+
+    def render(self):
+        """Render all metrics in Prometheus text format.
+
+        :return: text of the metrics.
+        :rtype: str
+        """
+        requests, latencies, in_flight = self.collect()
+        prefix = self.prefix
+        lines = ["# HELP %s_requests_total Count of requests by route and "
+                 "status." % prefix,
+                 "# TYPE %s_requests_total counter" % prefix]
+        for (route, status), count in sorted(requests.items()):
+            lines.append('%s_requests_total{route="%s",status="%d"} %d' %
+                         (prefix, route, status, count))
+
+        name = "%s_request_duration_seconds" % prefix
+        lines.extend(["# HELP %s Latency of requests by route." % name,
+                      "# TYPE %s histogram" % name])
+        bounds = ["%g" % bound for bound in self.buckets] + ["+Inf"]
+        for route, counts in sorted(latencies.items()):
+            for bound, count in zip(bounds, counts):
+                lines.append('%s_bucket{route="%s",le="%s"} %d' %
+                             (name, route, bound, count))
+            lines.append('%s_sum{route="%s"} %.6f' % (name, route,
+                                                      counts[-1]))
+            lines.append('%s_count{route="%s"} %d' % (name, route,
+                                                      counts[-2]))
+
+        lines.extend(["# HELP %s_requests_in_flight Count of requests being "
+                      "handled." % prefix,
+                      "# TYPE %s_requests_in_flight gauge" % prefix,
+                      "%s_requests_in_flight %d" % (prefix, in_flight)])
+        with self._lock:
+            gauges = list(self._gauges)
+        for name, help_text, func in gauges:
+            lines.extend(["# HELP %s_%s %s" % (prefix, name, help_text),
+                          "# TYPE %s_%s gauge" % (prefix, name),
+                          "%s_%s %s" % (prefix, name, func())])
+        with self._lock:
+            counters = list(self._counters)
+        for name, help_text, func, label in counters:
+            lines.extend(["# HELP %s_%s %s" % (prefix, name, help_text),
+                          "# TYPE %s_%s counter" % (prefix, name)])
+            for value, count in sorted(func().items()):
+                lines.append('%s_%s{%s="%s"} %d' % (prefix, name, label,
+                                                    value, count))
+        return "\n".join(lines) + "\n"
+
+
+def metrics_tween_factory(handler, registry):
+    """Make tween which records metrics of every request into
+    MetricsRegistry kept in registry.settings['metrics'].
+
+    Time of streaming app_iter of the response isn't included.
+    """
+    metrics = registry.settings["metrics"]
+
+    def metrics_tween(request):
+        shard = metrics.shard()
+        shard.in_flight += 1
+        started = time.time()
+        status = 500
+        try:
+            response = handler(request)
+            status = response.status_int
+            return response
+        finally:
+            duration = time.time() - started
+            shard.in_flight -= 1
+            route = getattr(request, "matched_route", None)
+            metrics.observe(NOT_FOUND_ROUTE if route is None else route.name,
+                            status, duration, shard)
+
+    return metrics_tween
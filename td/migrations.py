@@ -0,0 +1,85 @@
+"""
+.. module:: migrations
+   :platform: Unix
+   :synopsis: Moving of users between SQL database and Mongo.
+
+.. moduleauthor:: Mykola Radionov <moodaq@gmail.com>
+
+td_migrate_users command copies Users table from the SQL database of
+db_in_use to Mongo collection for users_store = mongo, or back:
+
+    td_migrate_users development.ini --to mongo
+
+Users keep their ids, because items refer to them by owner_id. Users which
+already exist in the target store (by username) are skipped, so the command
+can be run again after a failure. On postgres target sequence of the id
+column isn't moved, reset it after migration:
+
+    SELECT setval('"Users_id_seq"', MAX(id)) FROM "Users";
+
+"""
+
+import argparse
+import logging
+import sys
+
+from td.assessors.assessors import Connector
+from td.assessors.mongo_connector import MongoConnector
+from td.config import ConfigScanner
+from td.mongo_client import make_client
+
+
+logger = logging.getLogger(__name__)
+
+# columns of Users table in the order of fixtures/create_*_db.sql
+USER_COLUMNS = "id, ip, username, password, groups"
+
+
+def copy_users(source, target):
+    """Copy users which are absent in the target store.
+
+    :param source: Connector or MongoConnector of the store to copy from.
+    :type source: td.assessors.assessors.Connector
+    :param target: Connector or MongoConnector of the store to copy to.
+    :type target: td.assessors.mongo_connector.MongoConnector
+    :return: tuple (count of copied users, count of skipped ones).
+    :rtype: tuple
+    """
+    copied = skipped = 0
+    for row in source.select_all(USER_COLUMNS, "Users"):
+        username = row[2]
+        if target.select_one("id", "Users", {"username": username}):
+            skipped += 1
+            continue
+        target.insert("Users", USER_COLUMNS, row)
+        copied += 1
+    logger.info("Copied %d users, %d users exist already.", copied, skipped)
+    return copied, skipped
+
+
+def migrate_users_main(argv=sys.argv):
+    """Entry point of td_migrate_users command."""
+    parser = argparse.ArgumentParser(
+        description="Copy users between SQL database and Mongo.")
+    parser.add_argument("config", help="path to the ini file")
+    parser.add_argument("--to", choices=["mongo", "sql"], default="mongo",
+                        help="store to copy users to")
+    args = parser.parse_args(argv[1:])
+
+    logging.basicConfig(level=logging.INFO)
+    config = ConfigScanner(args.config)
+    engine_type = config.get_section("app:main").get_str("db_in_use")
+    sql = Connector(engine_type, config.get_subsection_in_section(
+        engine_type, "databases"))
+    mongo_creds = config.get_subsection_in_section("mongo", "databases")
+    client = make_client(mongo_creds)
+    mongo = MongoConnector(client[mongo_creds["db_name"]])
+    mongo.create_indexes()
+    try:
+        if args.to == "mongo":
+            copy_users(sql, mongo)
+        else:
+            copy_users(mongo, sql)
+    finally:
+        sql.pool.close()
+        client.close()
@@ -0,0 +1,239 @@
+"""
+.. module:: mongo_client
+   :platform: Unix
+   :synopsis: Mongo client and read preferences made of td settings.
+
+.. moduleauthor:: Mykola Radionov <moodaq@gmail.com>
+
+Client is made of mongo.* settings of [databases] section. mongo.uri takes
+precedence over mongo.host and mongo.port and may carry any option of the
+driver, e.g. a replica set:
+
+    mongo.uri = mongodb://db1,db2,db3/?replicaSet=rs0&readPreference=primary
+
+The most used options can be given as separate settings too, see
+CLIENT_OPTIONS. Durations are given in the usual td format (like 250ms) and
+are passed to the driver in milliseconds.
+
+MongoClient must not be copied into forked processes, so td.main uses
+LazyDatabase which makes the client on the first use in each process.
+
+"""
+
+import inspect
+import logging
+import os
+import threading
+
+import pymongo
+from pymongo import read_preferences
+from pymongo.database import Database
+
+
+logger = logging.getLogger(__name__)
+
+# seconds of lag of secondaries by default, the least one drivers accept
+DEFAULT_MAX_STALENESS = 90
+
+# setting -> (option of MongoClient, type of the setting, default)
+CLIENT_OPTIONS = {
+    "max_pool_size": ("maxPoolSize", "int", None),
+    "wait_queue_timeout": ("waitQueueTimeoutMS", "duration", None),
+    "wait_queue_multiple": ("waitQueueMultiple", "int", None),
+    "connect_timeout": ("connectTimeoutMS", "duration", 5),
+    "socket_timeout": ("socketTimeoutMS", "duration", 10),
+    "replica_set": ("replicaSet", "str", None),
+    "read_preference": ("readPreference", "str", None),
+    "local_threshold": ("localThresholdMS", "duration", None),
+    "w": ("w", "str", None),
+    "journal": ("j", "bool", None),
+    "write_timeout": ("wtimeout", "duration", None),
+}
+# modes of read preferences by their names in URI
+READ_PREFERENCES = {"primary": read_preferences.Primary,
+                    "primaryPreferred": read_preferences.PrimaryPreferred,
+                    "secondary": read_preferences.Secondary,
+                    "secondaryPreferred": read_preferences.SecondaryPreferred,
+                    "nearest": read_preferences.Nearest}
+
+
+def get_client_options(creds):
+    """Get keyword arguments of MongoClient from mongo.* settings.
+
+    :param creds: settings of mongo from [databases] section.
+    :type creds: td.config.Settings
+    :return: dict of options, durations of 0 are left out (no limit).
+    :rtype: dict
+    """
+    options = {}
+    for key, (option, kind, default) in CLIENT_OPTIONS.items():
+        if kind == "duration":
+            value = creds.get_duration(key, default)
+            if value:
+                options[option] = int(value * 1000)
+            continue
+        value = getattr(creds, "get_" + kind)(key, default)
+        if value is None:
+            continue
+        if option == "w" and value.isdigit():
+            value = int(value)
+        options[option] = value
+    return options
+
+
+def make_client(creds):
+    """Create MongoClient of mongo.* settings.
+
+    :param creds: settings of mongo from [databases] section.
+    :type creds: td.config.Settings
+    :return: client connected to the server or the replica set.
+    :rtype: pymongo.MongoClient
+    """
+    options = get_client_options(creds)
+    uri = creds.get_str("uri")
+    if uri:
+        return pymongo.MongoClient(uri, **options)
+    return pymongo.MongoClient(creds["host"], creds.get_int("port"),
+                               **options)
+
+
+def make_read_preference(mode, max_staleness=None, tag_sets=None):
+    """Create read preference which routes reads to replica set members.
+
+    Drivers before pymongo 3.4 can't skip secondaries by their lag, for them
+    max_staleness is left out with a warning.
+
+    :param mode: name of the mode like 'secondaryPreferred'.
+    :type mode: str
+    :param max_staleness: seconds of the biggest lag of secondary to read
+    from, at least DEFAULT_MAX_STALENESS, None - any lag.
+    :type max_staleness: float
+    :param tag_sets: list of dicts with tags of members to read from.
+    :type tag_sets: list
+    :return: read preference for with_options of the collection.
+    :rtype: pymongo.read_preferences.ServerMode
+    :raises: ValueError
+    """
+    if mode not in READ_PREFERENCES:
+        raise ValueError("Wrong read preference: %r." % (mode,))
+    preference_class = READ_PREFERENCES[mode]
+    if mode == "primary":
+        return preference_class()
+    kwargs = {"tag_sets": tag_sets}
+    if max_staleness:
+        if "max_staleness" in inspect.getargspec(
+                preference_class.__init__).args:
+            kwargs["max_staleness"] = max(int(max_staleness),
+                                          DEFAULT_MAX_STALENESS)
+        else:
+            logger.warning("pymongo %s doesn't support max staleness of "
+                           "secondaries.", pymongo.version)
+    return preference_class(**kwargs)
+
+
+def create_indexes(mongo_db):
+    """Create indexes of item pages and changes, it's done by the warm-up of
+    td.main.
+
+    :param mongo_db: Mongo database of td.
+    :type mongo_db: pymongo.database.Database
+    """
+    mongo_db.Items.create_index([("owner_id", pymongo.ASCENDING),
+                                 ("_id", pymongo.DESCENDING)])
+    mongo_db.Items.create_index([("owner_id", pymongo.ASCENDING),
+                                 ("category", pymongo.ASCENDING),
+                                 ("_id", pymongo.DESCENDING)])
+    mongo_db.Changes.create_index([("owner_id", pymongo.ASCENDING),
+                                   ("version", pymongo.ASCENDING)])
+
+
+class LazyDatabase(object):
+    """Proxy of Mongo database which makes it's client on the first use in
+    each process. Collections are given out as LazyCollection, so they can
+    be kept by the services created before fork.
+    """
+
+    def __init__(self, creds):
+        """Initialize proxy without connecting.
+
+        :param creds: settings of mongo from [databases] section.
+        :type creds: td.config.Settings
+        """
+        self._creds = creds
+        self._lock = threading.Lock()
+        self._database = None
+        self._pid = None
+
+    def get(self):
+        """Get database of the client of this process.
+
+        :return: Mongo database named by mongo.db_name.
+        :rtype: pymongo.database.Database
+        """
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    # client of the parent process is left to it
+                    self._database = make_client(self._creds)[
+                        self._creds["db_name"]]
+                    self._pid = pid
+        return self._database
+
+    def __getattr__(self, name):
+        # other names are collections, like in pymongo Database
+        if name.startswith("_") or hasattr(Database, name):
+            return getattr(self.get(), name)
+        return LazyCollection(self, name)
+
+    def __getitem__(self, name):
+        return LazyCollection(self, name)
+
+    def __repr__(self):
+        return "LazyDatabase(%r)" % (self._creds.get("db_name"),)
+
+
+class LazyCollection(object):
+    """Proxy of the collection of LazyDatabase which is looked up in the
+    database of the calling process.
+    """
+
+    def __init__(self, database, name, options=None):
+        """Initialize proxy.
+
+        :param database: lazy database of the collection.
+        :type database: LazyDatabase
+        :param name: name of the collection.
+        :type name: str
+        :param options: keyword arguments of with_options of the collection.
+        :type options: dict
+        """
+        self._database = database
+        self._name = name
+        self._options = options or {}
+        self._collection = None
+        self._pid = None
+
+    def get(self):
+        """Get the collection of this process.
+
+        :rtype: pymongo.collection.Collection
+        """
+        pid = os.getpid()
+        if self._pid != pid:
+            collection = self._database.get()[self._name]
+            if self._options:
+                collection = collection.with_options(**self._options)
+            self._collection, self._pid = collection, pid
+        return self._collection
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+    def with_options(self, **kwargs):
+        """Get the same collection with other options, lazy too."""
+        options = dict(self._options, **kwargs)
+        return LazyCollection(self._database, self._name, options)
+
+    def __repr__(self):
+        return "LazyCollection(%r)" % (self._name,)
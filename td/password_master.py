@@ -7,11 +7,74 @@
 
 
 """
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+
 import bcrypt
 
+from td.exceptions import PasswordMasterBusyException
+
+
+logger = logging.getLogger(__name__)
+
+
+def _hash_password(password):
+    """Hash password with new salt, see PasswordMaster.hash_password."""
+    salt = bcrypt.gensalt()
+    return bcrypt.hashpw(password.encode("utf8"), salt)
+
+
+def _check_password(password, hashed_password):
+    """Compare password with hash, see PasswordMaster.check_password."""
+    return bcrypt.checkpw(password.encode("utf8"), hashed_password)
+
+
+def _ignore_sigint():
+    """Leave handling of Ctrl+C to the parent process."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
 
 class PasswordMaster(object):
-    """Provide work with passwords hashing and checking."""
+    """Provide work with passwords hashing and checking.
+
+    By default bcrypt runs inline in the calling thread. If workers count is
+    provided then it runs in the pool of that many processes, so it doesn't
+    hold the GIL of the web server process and uses all the cores. No more
+    than max_pending calls are sent to the pool at once, the others wait for
+    their turn up to queue_timeout seconds and then
+    PasswordMasterBusyException is raised, as well as for calls which aren't
+    done in RESULT_TIMEOUT seconds.
+
+    The pool should be started with start before the server starts it's
+    threads (in each worker after fork for pre-fork server), fork of the
+    process with running threads can copy locks held by them into the pool
+    processes.
+    """
+    # seconds to wait for result of the call already sent to the pool
+    RESULT_TIMEOUT = 30
+
+    def __init__(self, workers=0, max_pending=None, queue_timeout=1.0):
+        """Initialize password master.
+
+        :param workers: count of processes in the pool, 0 to run inline.
+        :type workers: int
+        :param max_pending: the biggest count of calls in the pool, twice the
+        count of workers by default.
+        :type max_pending: int
+        :param queue_timeout: seconds to wait for the turn to use the pool.
+        :type queue_timeout: float
+        """
+        self.workers = workers
+        self.max_pending = max_pending or workers * 2
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition(threading.Lock())
+        self._pending = 0
+        self._pool = None
+        self._pool_pid = None
 
     def hash_password(self, password):
         """ Hash password.
@@ -20,10 +83,9 @@ class PasswordMaster(object):
         :type password: str
         :return: hashed password in string
         :rtype: str
+        :raises: PasswordMasterBusyException
         """
-        salt = bcrypt.gensalt()
-        hashed_password = bcrypt.hashpw(password.encode("utf8"), salt)
-        return hashed_password
+        return self._call(_hash_password, password)
 
     def check_password(self, password, hashed_password):
         """Check if args are equal and return True if yes, False if no.
@@ -34,6 +96,87 @@ class PasswordMaster(object):
         :type hashed_password: str
         :return: True or False on passwords comparison.
         :rtype: bool
+        :raises: PasswordMasterBusyException
+        """
+        return self._call(_check_password, password, hashed_password)
+
+    def configure(self, max_pending=None, queue_timeout=None):
+        """Change limits of the working password master, see __init__ for
+        their meaning. Limits which are None are kept. Count of workers can't
+        be changed without restart.
+        """
+        with self._cond:
+            if max_pending is not None:
+                self.max_pending = max_pending or self.workers * 2
+            if queue_timeout is not None:
+                self.queue_timeout = queue_timeout
+            self._cond.notify_all()
+
+    def start(self):
+        """Start pool of processes in this process if workers are used and
+        it's not started yet.
+        """
+        if self.workers:
+            self._get_pool()
+
+    def close(self):
+        """Terminate processes of the pool if it was started."""
+        with self._cond:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    def _call(self, func, *args):
+        """Run func inline or in the pool of processes."""
+        if not self.workers:
+            return func(*args)
+        self._acquire_slot()
+        try:
+            result = self._get_pool().apply_async(func, args)
+            return result.get(self.RESULT_TIMEOUT)
+        except multiprocessing.TimeoutError:
+            logger.error("Password master didn't answer in %d seconds.",
+                         self.RESULT_TIMEOUT)
+            raise PasswordMasterBusyException(
+                "Password isn't checked in %d seconds." % self.RESULT_TIMEOUT)
+        finally:
+            self._release_slot()
+
+    def _acquire_slot(self):
+        """Wait for the turn to send call to the pool.
+
+        :raises: PasswordMasterBusyException
+        """
+        deadline = time.time() + self.queue_timeout
+        with self._cond:
+            while self._pending >= self.max_pending:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    logger.warning("Password master is busy with %d calls.",
+                                   self._pending)
+                    raise PasswordMasterBusyException(
+                        "No turn to check password in %.2f seconds." %
+                        self.queue_timeout)
+                self._cond.wait(remaining)
+            self._pending += 1
+
+    def _release_slot(self):
+        """Give the turn to the next waiting call."""
+        with self._cond:
+            self._pending -= 1
+            self._cond.notify()
+
+    def _get_pool(self):
+        """Get pool of processes, start it in this process if it wasn't
+        started by start.
         """
-        result = bcrypt.checkpw(password.encode("utf8"), hashed_password)
-        return result
+        with self._cond:
+            if self._pool is None or self._pool_pid != os.getpid():
+                if threading.active_count() > 1:
+                    logger.warning("Pool of password master is started "
+                                   "while other threads run.")
+                self._pool = multiprocessing.Pool(self.workers,
+                                                  initializer=_ignore_sigint)
+                self._pool_pid = os.getpid()
+            return self._pool
@@ -0,0 +1,247 @@
+"""
+.. module:: ratelimit
+   :platform: Unix
+   :synopsis: Token bucket limiters of login attempts for td app.
+
+.. moduleauthor:: Mykola Radionov <moodaq@gmail.com>
+
+
+"""
+
+
+import datetime
+import logging
+import threading
+import time
+
+from pymongo.errors import DuplicateKeyError
+
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryBucketStore(object):
+    """Keep token buckets in the memory of the process.
+
+    Buckets are dicts of key -> (tokens, time of update). Full buckets are
+    the same as absent ones, so they are dropped when count of buckets
+    exceeds max_keys.
+    """
+
+    def __init__(self, max_keys=100000):
+        """Initialize empty store.
+
+        :param max_keys: count of buckets after which full ones are dropped.
+        :type max_keys: int
+        """
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def consume(self, key, rate, burst, now):
+        """Refill the bucket for the time passed since it's update and take
+        one token from it.
+
+        :param key: key of the bucket.
+        :type key: str
+        :param rate: tokens added to the bucket per second.
+        :type rate: float
+        :param burst: capacity of the bucket.
+        :type burst: float
+        :param now: current timestamp.
+        :type now: float
+        :return: True if token was taken, False if the bucket is empty.
+        :rtype: bool
+        """
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._drop_full(rate, burst, now)
+        return allowed
+
+    def _drop_full(self, rate, burst, now):
+        """Remove buckets which are refilled up to burst by now."""
+        for key, (tokens, updated) in self._buckets.items():
+            if tokens + (now - updated) * rate >= burst:
+                del self._buckets[key]
+
+
+class MongoBucketStore(object):
+    """Keep token buckets in Mongo collection shared by all app processes
+    and nodes.
+
+    Bucket is updated only if nobody updated it since it was read, otherwise
+    it's read again. Buckets which are not touched for expire_after seconds
+    are removed by TTL index.
+    """
+    RETRIES = 3
+
+    def __init__(self, collection, expire_after=3600):
+        """Initialize store.
+
+        :param collection: collection to keep buckets in.
+        :type collection: pymongo.collection.Collection
+        :param expire_after: seconds after which unused bucket is removed.
+        :type expire_after: int
+        """
+        self.collection = collection
+        self.expire_after = expire_after
+
+    def create_indexes(self):
+        """Create TTL index which removes expired buckets."""
+        self.collection.create_index("expire_at", expireAfterSeconds=0)
+
+    def consume(self, key, rate, burst, now):
+        """Refill the bucket for the time passed since it's update and take
+        one token from it, see MemoryBucketStore.consume.
+        """
+        for _ in range(self.RETRIES):
+            document = self.collection.find_one({"_id": key})
+            if document is None:
+                tokens, updated = burst, None
+            else:
+                updated = document["updated"]
+                tokens = min(burst,
+                             document["tokens"] + (now - updated) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            expire_at = (datetime.datetime.utcfromtimestamp(now) +
+                         datetime.timedelta(seconds=self.expire_after))
+            try:
+                reply = self.collection.update_one(
+                    {"_id": key, "updated": updated},
+                    {"$set": {"tokens": tokens,
+                              "updated": now,
+                              "expire_at": expire_at}},
+                    upsert=updated is None)
+            except DuplicateKeyError:
+                # bucket was created by the concurrent attempt
+                continue
+            if updated is None or reply.matched_count:
+                return allowed
+        logger.warning("Bucket %s is too contended, attempt is rejected.", key)
+        return False
+
+
+class TokenBucketLimiter(object):
+    """Allow rate attempts per second for each key with bursts up to burst
+    attempts, and count allowed and shed attempts.
+    """
+
+    def __init__(self, rate, burst, store=None):
+        """Initialize limiter.
+
+        :param rate: attempts per second allowed for each key.
+        :type rate: float
+        :param burst: attempts allowed at once after a pause.
+        :type burst: float
+        :param store: store of buckets, MemoryBucketStore by default.
+        :type store: td.ratelimit.MemoryBucketStore
+        """
+        self.rate = rate
+        self.burst = burst
+        self.store = store if store is not None else MemoryBucketStore()
+        self.allowed = 0
+        self.shed = 0
+
+    def allow(self, key):
+        """Take token for the attempt with the key.
+
+        :param key: key of the attempt (e.g. username or ip).
+        :type key: str
+        :return: True if attempt is allowed.
+        :rtype: bool
+        """
+        allowed = self.store.consume(key, self.rate, self.burst, time.time())
+        # counters are approximate, races between threads are tolerated
+        if allowed:
+            self.allowed += 1
+        else:
+            self.shed += 1
+        return allowed
+
+    def stats(self):
+        """Get counters of allowed and shed attempts.
+
+        :return: dict like {'allowed': 10, 'shed': 2}.
+        :rtype: dict
+        """
+        return {"allowed": self.allowed, "shed": self.shed}
+
+
+class LoginLimiter(object):
+    """Limit login attempts per username and per client's ip.
+
+    Attempt is allowed only if both limiters allow it. Limiter which is None
+    allows all attempts.
+    """
+
+    def __init__(self, user_limiter=None, ip_limiter=None):
+        """Initialize limiter.
+
+        :param user_limiter: limiter of attempts for the same username.
+        :type user_limiter: td.ratelimit.TokenBucketLimiter
+        :param ip_limiter: limiter of attempts from the same ip.
+        :type ip_limiter: td.ratelimit.TokenBucketLimiter
+        """
+        self.user_limiter = user_limiter
+        self.ip_limiter = ip_limiter
+
+    def allow(self, username, ip):
+        """Check if login attempt is allowed.
+
+        Ip is checked first, so attempts from the blocked ip don't take
+        tokens of the usernames they try.
+
+        :param username: login name from the attempt.
+        :type username: str
+        :param ip: client's address.
+        :type ip: str
+        :return: True if attempt is allowed.
+        :rtype: bool
+        """
+        if self.ip_limiter is not None and not self.ip_limiter.allow(
+                "ip:%s" % ip):
+            return False
+        if self.user_limiter is not None and not self.user_limiter.allow(
+                u"user:%s" % username):
+            return False
+        return True
+
+    def stats(self):
+        """Get counters of allowed and shed attempts of each limiter.
+
+        :return: dict like {'user': {'allowed': 10, 'shed': 2},
+                            'ip': {'allowed': 12, 'shed': 0}}.
+        :rtype: dict
+        """
+        stats = {}
+        if self.user_limiter is not None:
+            stats["user"] = self.user_limiter.stats()
+        if self.ip_limiter is not None:
+            stats["ip"] = self.ip_limiter.stats()
+        return stats
+
+    def add_counters(self, metrics):
+        """Register counters of allowed and rejected attempts by scope
+        (user or ip) in metrics.
+
+        :param metrics: metrics of the app.
+        :type metrics: td.metrics.MetricsRegistry
+        """
+        for name, key, help_text in (
+                ("ratelimit_allowed_total", "allowed",
+                 "Login attempts allowed by the limiter."),
+                ("ratelimit_rejected_total", "shed",
+                 "Login attempts rejected by the limiter.")):
+            metrics.add_counter(
+                name, help_text,
+                lambda key=key: dict((scope, stats[key]) for scope, stats in
+                                     self.stats().items()),
+                "scope")
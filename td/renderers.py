@@ -0,0 +1,188 @@
+"""
+.. module:: renderers
+   :platform: Unix
+   :synopsis: Fast JSON renderer with streamed encoding for td app.
+
+.. moduleauthor:: Mykola Radionov <moodaq@gmail.com>
+
+
+"""
+
+import datetime
+
+from bson import ObjectId
+
+try:
+    # C-accelerated encoder is used when it's installed
+    import simplejson as json
+except ImportError:
+    import json
+
+
+# count of array elements encoded into one chunk of the streamed response
+DEFAULT_CHUNK_SIZE = 500
+
+
+def _default(value):
+    """Encode values which json module doesn't know.
+
+    :raises: TypeError
+    """
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    raise TypeError("%r is not JSON serializable" % (value,))
+
+
+# Helpers for hand-made encoders of hot paths (see views._encode_items):
+# quote_string encodes str or unicode into JSON string and object_id_str
+# converts ObjectId into hex, both raise TypeError for values of other types.
+quote_string = json.encoder.encode_basestring_ascii
+object_id_str = ObjectId.__str__
+
+# one encoder is reused, json.dumps with arguments builds new one every call
+_encoder = json.JSONEncoder(default=_default, separators=(",", ":"))
+
+
+def dumps(value):
+    """Encode value into JSON string, ObjectId and datetime included.
+
+    :param value: value to encode.
+    :type value: object
+    :return: JSON string.
+    :rtype: str
+    :raises: TypeError
+    """
+    return _encoder.encode(value)
+
+
+def encode_chunk(elements):
+    """Encode list of elements into comma separated JSON values.
+
+    :param elements: list of values to encode.
+    :type elements: list
+    :return: JSON text without brackets of the array.
+    :rtype: str
+    """
+    return _encoder.encode(elements)[1:-1]
+
+
+class StreamedArray(object):
+    """Iterable (e.g. Mongo cursor) which is encoded into JSON array chunk by
+    chunk, so neither the whole list nor the whole string is kept in memory.
+
+    Array without elements is encoded as empty_value.
+    """
+
+    def __init__(self, iterable, chunk_size=DEFAULT_CHUNK_SIZE,
+                 empty_value=(), encode_chunk=encode_chunk):
+        """Wrap iterable.
+
+        :param iterable: elements of the array.
+        :type iterable: iterable
+        :param chunk_size: count of elements in one chunk.
+        :type chunk_size: int
+        :param empty_value: value to encode instead of empty array.
+        :type empty_value: object
+        :param encode_chunk: function which encodes list of elements into
+        comma separated JSON values, see encode_chunk.
+        :type encode_chunk: callable
+        """
+        self.iterable = iterable
+        self.chunk_size = chunk_size
+        self.empty_value = empty_value
+        self.encode_chunk = encode_chunk
+
+    def iter_chunks(self):
+        """Encode elements and yield JSON text of the array in chunks."""
+        opening = "["
+        chunk = []
+        for element in self.iterable:
+            chunk.append(element)
+            if len(chunk) >= self.chunk_size:
+                yield opening + self.encode_chunk(chunk)
+                opening = ","
+                chunk = []
+        if chunk:
+            yield opening + self.encode_chunk(chunk)
+            opening = ","
+        yield "]" if opening == "," else dumps(self.empty_value)
+
+
+class Deferred(object):
+    """Value which is computed when encoder reaches it, after all plain and
+    streamed values of the same dict are encoded (e.g. the next page cursor
+    which is known only after the page is streamed).
+    """
+
+    def __init__(self, func):
+        """Wrap func without args which returns the value."""
+        self.func = func
+
+
+def _is_streamed(value):
+    """Check if dict has values which should be encoded lazily."""
+    return isinstance(value, dict) and any(
+        isinstance(element, (StreamedArray, Deferred))
+        for element in value.values())
+
+
+def iter_encode(value):
+    """Encode value into JSON text yielding it in chunks.
+
+    Values of the top-level dict are encoded in order: plain values first,
+    then StreamedArray values and then Deferred values.
+
+    :param value: value to encode.
+    :type value: object
+    :return: iterator of JSON text chunks.
+    :rtype: iterator
+    """
+    if isinstance(value, StreamedArray):
+        for chunk in value.iter_chunks():
+            yield chunk
+    elif isinstance(value, Deferred):
+        yield dumps(value.func())
+    elif _is_streamed(value):
+        order = {StreamedArray: 1, Deferred: 2}
+        keys = sorted(value, key=lambda key: order.get(type(value[key]), 0))
+        separator = "{"
+        for key in keys:
+            yield separator + dumps(key) + ":"
+            for chunk in iter_encode(value[key]):
+                yield chunk
+            separator = ","
+        yield "}"
+    else:
+        yield dumps(value)
+
+
+class FastJSONRenderer(object):
+    """Pyramid renderer factory which encodes view's value into JSON.
+
+    ObjectId and datetime values are encoded natively. Dicts with
+    StreamedArray values are streamed into response's app_iter instead of
+    being encoded into one string.
+
+    Register it with config.add_renderer('json', FastJSONRenderer).
+    """
+
+    def __init__(self, info):
+        """Initialize renderer for the renderer info given by Pyramid."""
+        self.info = info
+
+    def __call__(self, value, system):
+        """Render value returned by the view.
+
+        :return: JSON string or iterator of JSON chunks.
+        :rtype: str or iterator
+        """
+        request = system.get("request")
+        if request is not None:
+            response = request.response
+            if response.content_type == response.default_content_type:
+                response.content_type = "application/json"
+        if _is_streamed(value):
+            return iter_encode(value)
+        return dumps(value)
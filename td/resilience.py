@@ -0,0 +1,476 @@
+"""
+.. module:: resilience
+   :platform: Unix
+   :synopsis: Circuit breakers and retries of database calls.
+
+.. moduleauthor:: Mykola Radionov <moodaq@gmail.com>
+
+Each backend (SQL database of db_in_use and Mongo) gets Guard with it's own
+CircuitBreaker. When share of failed calls in the last breaker_window seconds
+reaches breaker_failure_ratio (and there were at least breaker_min_calls of
+them) the breaker opens and calls are rejected with
+BackendUnavailableException, which is answered with 503, instead of waiting
+for timeouts of the slow database in every request. After
+breaker_open_timeout seconds one trial call is let through, the breaker is
+closed again if it succeeds.
+
+Only transient errors of the backend (lost connections, timeouts, exhausted
+pool) are failures, errors of the query itself mean the database is alive.
+Idempotent reads are retried up to retries times with random (full jitter)
+exponential delays starting at retry_delay, no retry is started after
+deadline seconds since the first attempt. Writes are never retried.
+
+Settings are taken from the backend's keys of [databases] section:
+
+    postgres.retries = 2
+    postgres.retry_delay = 50ms
+    postgres.deadline = 3s
+    postgres.breaker_failure_ratio = 0.5
+    postgres.breaker_min_calls = 20
+    postgres.breaker_window = 10s
+    postgres.breaker_open_timeout = 30s
+
+"""
+
+import functools
+import logging
+import random
+import threading
+import time
+
+from pymongo.errors import ConnectionFailure, ExecutionTimeout
+
+from td.exceptions import BackendUnavailableException
+from td.instrumentation import is_method
+
+
+logger = logging.getLogger(__name__)
+
+# values of the state gauge of the breaker
+STATE_VALUES = {"closed": 0, "half_open": 1, "open": 2}
+# errors of pymongo which mean Mongo is unavailable or slow, AutoReconnect
+# and it's timeouts are ConnectionFailure
+MONGO_TRANSIENT_ERRORS = (ConnectionFailure, ExecutionTimeout)
+# methods of Mongo collection which don't change documents and are retried
+MONGO_READ_METHODS = frozenset(["find_one", "count", "count_documents",
+                                "distinct"])
+# methods of Mongo collection which return cursor without sending the query,
+# the first fetch of the cursor is retried and recorded by GuardedCursor
+MONGO_CURSOR_METHODS = frozenset(["find"])
+
+
+def get_guard_settings(settings):
+    """Get keyword arguments of Guard from the backend's settings.
+
+    :param settings: settings of the backend from [databases] section.
+    :type settings: td.config.Settings
+    :return: dict of arguments of Guard.configure.
+    :rtype: dict
+    """
+    return {"retries": settings.get_int("retries", 2),
+            "retry_delay": settings.get_duration("retry_delay", 0.05),
+            "deadline": settings.get_duration("deadline", 3),
+            "failure_ratio": settings.get_float("breaker_failure_ratio", 0.5),
+            "min_calls": settings.get_int("breaker_min_calls", 20),
+            "window": settings.get_duration("breaker_window", 10),
+            "open_timeout": settings.get_duration("breaker_open_timeout", 30)}
+
+
+class CircuitBreaker(object):
+    """Breaker which counts results of the calls in per second buckets of
+    the rolling window and rejects calls while it's open.
+
+    closed -> open when share of failures in the window is too big,
+    open -> half_open after open_timeout, half_open -> closed when the trial
+    call succeeds or back to open when it fails.
+    """
+
+    def __init__(self, name, failure_ratio=0.5, min_calls=20, window=10.0,
+                 open_timeout=30.0, clock=time.time):
+        """Initialize closed breaker.
+
+        :param name: name of the backend for logs and errors.
+        :type name: str
+        :param failure_ratio: share of failed calls which opens the breaker,
+        0 - never open it.
+        :type failure_ratio: float
+        :param min_calls: the least count of calls in the window to judge.
+        :type min_calls: int
+        :param window: seconds of the calls to judge.
+        :type window: float
+        :param open_timeout: seconds to reject calls before the trial one.
+        :type open_timeout: float
+        :param clock: callable which returns current time in seconds.
+        :type clock: callable
+        """
+        self.name = name
+        self.failure_ratio = failure_ratio
+        self.min_calls = min_calls
+        self.window = window
+        self.open_timeout = open_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = "closed"
+        self._opened_at = None
+        self._trial = False
+        # lists [second, calls, failures], the oldest first
+        self._buckets = []
+
+    @property
+    def state(self):
+        """'closed', 'open' or 'half_open'."""
+        with self._lock:
+            if (self._state == "open" and
+                    self._clock() - self._opened_at >= self.open_timeout):
+                return "half_open"
+            return self._state
+
+    def before_call(self):
+        """Check if the call may be sent to the backend.
+
+        :raises: BackendUnavailableException
+        """
+        with self._lock:
+            if self._state == "closed":
+                return
+            if (self._state == "open" and
+                    self._clock() - self._opened_at >= self.open_timeout):
+                self._state = "half_open"
+                self._trial = False
+            if self._state == "half_open" and not self._trial:
+                self._trial = True
+                logger.info("Trial call to %s after it's breaker was open.",
+                            self.name)
+                return
+        raise BackendUnavailableException(
+            "Calls to %s are rejected, it's circuit breaker is open." %
+            self.name)
+
+    def record(self, success):
+        """Count result of the call let through by before_call.
+
+        :param success: False if the call failed with transient error.
+        :type success: bool
+        """
+        with self._lock:
+            now = self._clock()
+            if self._state == "half_open":
+                if success:
+                    self._close()
+                else:
+                    self._open(now)
+                return
+            if self._state == "open":
+                # result of the call started before the breaker opened
+                return
+            second = int(now)
+            if self._buckets and self._buckets[-1][0] == second:
+                bucket = self._buckets[-1]
+            else:
+                bucket = [second, 0, 0]
+                self._buckets.append(bucket)
+                while (self._buckets[0] is not bucket and
+                       self._buckets[0][0] <= now - self.window):
+                    del self._buckets[0]
+            bucket[1] += 1
+            if success:
+                return
+            bucket[2] += 1
+            calls = sum(bucket[1] for bucket in self._buckets)
+            failures = sum(bucket[2] for bucket in self._buckets)
+            if (self.failure_ratio > 0 and calls >= self.min_calls and
+                    failures >= calls * self.failure_ratio):
+                self._open(now)
+                logger.error("Circuit breaker of %s is open after %d failed "
+                             "calls of %d.", self.name, failures, calls)
+
+    def check(self):
+        """Check if the breaker lets calls through without taking the trial
+        call of the half open breaker.
+
+        :raises: BackendUnavailableException
+        """
+        if self.state == "open":
+            raise BackendUnavailableException(
+                "Calls to %s are rejected, it's circuit breaker is open." %
+                self.name)
+
+    def stats(self):
+        """Get state and counts of the calls in the window for monitoring.
+
+        :return: dict with state, calls and failures.
+        :rtype: dict
+        """
+        state = self.state
+        with self._lock:
+            since = self._clock() - self.window
+            buckets = [bucket for bucket in self._buckets
+                       if bucket[0] > since]
+            return {"state": state,
+                    "calls": sum(bucket[1] for bucket in buckets),
+                    "failures": sum(bucket[2] for bucket in buckets)}
+
+    def _open(self, now):
+        self._state = "open"
+        self._opened_at = now
+        self._trial = False
+        self._buckets = []
+
+    def _close(self):
+        logger.info("Circuit breaker of %s is closed.", self.name)
+        self._state = "closed"
+        self._opened_at = None
+        self._trial = False
+        self._buckets = []
+
+
+class Guard(object):
+    """Circuit breaker and retry policy of one backend."""
+
+    def __init__(self, name, transient_errors, sleep=time.sleep, **settings):
+        """Initialize guard.
+
+        :param name: name of the backend.
+        :type name: str
+        :param transient_errors: exception classes which mean the backend is
+        unavailable, slow or overloaded.
+        :type transient_errors: tuple
+        :param sleep: callable which waits given seconds.
+        :type sleep: callable
+        :param settings: see configure.
+        """
+        self.name = name
+        self.transient_errors = tuple(transient_errors)
+        self.breaker = CircuitBreaker(name)
+        self.retries = 2
+        self.retry_delay = 0.05
+        self.deadline = 3.0
+        self._sleep = sleep
+        self.configure(**settings)
+
+    def configure(self, retries=None, retry_delay=None, deadline=None,
+                  failure_ratio=None, min_calls=None, window=None,
+                  open_timeout=None):
+        """Change settings of the working guard, the ones which are None are
+        kept. State of the breaker is kept too.
+
+        :param retries: the biggest count of repeated attempts of reads.
+        :type retries: int
+        :param retry_delay: seconds of the first delay, each next one is up
+        to twice longer.
+        :type retry_delay: float
+        :param deadline: seconds since the first attempt after which no
+        retry is started.
+        :type deadline: float
+        :param failure_ratio: see CircuitBreaker.
+        :param min_calls: see CircuitBreaker.
+        :param window: see CircuitBreaker.
+        :param open_timeout: see CircuitBreaker.
+        """
+        for attr, value in (("retries", retries),
+                            ("retry_delay", retry_delay),
+                            ("deadline", deadline)):
+            if value is not None:
+                setattr(self, attr, value)
+        for attr, value in (("failure_ratio", failure_ratio),
+                            ("min_calls", min_calls),
+                            ("window", window),
+                            ("open_timeout", open_timeout)):
+            if value is not None:
+                setattr(self.breaker, attr, value)
+
+    def call(self, func, *args, **kwargs):
+        """Call func once through the breaker.
+
+        :raises: BackendUnavailableException, errors of func
+        """
+        self.breaker.before_call()
+        try:
+            result = func(*args, **kwargs)
+        except self.transient_errors:
+            self.breaker.record(False)
+            raise
+        except Exception:
+            # the backend answered, the error is about the call itself
+            self.breaker.record(True)
+            raise
+        self.breaker.record(True)
+        return result
+
+    def call_idempotent(self, func, *args, **kwargs):
+        """Call func through the breaker, retrying it after transient
+        errors.
+
+        :raises: BackendUnavailableException, errors of func
+        """
+        started = time.time()
+        attempt = 0
+        while True:
+            try:
+                return self.call(func, *args, **kwargs)
+            except self.transient_errors as error:
+                if attempt >= self.retries:
+                    raise
+                delay = random.uniform(0, self.retry_delay * 2 ** attempt)
+                if time.time() + delay - started > self.deadline:
+                    raise
+                attempt += 1
+                logger.warning("Retry %d of call to %s in %.3f seconds "
+                               "after: %s", attempt, self.name, delay, error)
+                self._sleep(delay)
+
+    def add_gauges(self, metrics):
+        """Register state of the breaker in metrics.
+
+        :param metrics: metrics of the app.
+        :type metrics: td.metrics.MetricsRegistry
+        """
+        metrics.add_gauge(
+            "%s_breaker_state" % self.name,
+            "Circuit breaker of %s: 0 closed, 1 half open, 2 open." %
+            self.name,
+            lambda: STATE_VALUES[self.breaker.state])
+
+
+class GuardedConnector(object):
+    """Proxy of Connector or MongoConnector which calls it through the guard.
+
+    select_one and select_all are retried, insert is not.
+    """
+
+    def __init__(self, connector, guard):
+        self._connector = connector
+        self._guard = guard
+
+    def __getattr__(self, name):
+        return getattr(self._connector, name)
+
+    def select_one(self, *args, **kwargs):
+        return self._guard.call_idempotent(self._connector.select_one,
+                                           *args, **kwargs)
+
+    def select_all(self, *args, **kwargs):
+        return self._guard.call_idempotent(self._connector.select_all,
+                                           *args, **kwargs)
+
+    def insert(self, *args, **kwargs):
+        return self._guard.call(self._connector.insert, *args, **kwargs)
+
+    def __repr__(self):
+        return "GuardedConnector(%r)" % (self._connector,)
+
+
+class GuardedDatabase(object):
+    """Proxy of Mongo database which gives out GuardedCollection."""
+
+    def __init__(self, database, guard):
+        """Wrap database.
+
+        :param database: Mongo database.
+        :type database: pymongo.database.Database
+        :param guard: guard of Mongo.
+        :type guard: Guard
+        """
+        self._database = database
+        self._guard = guard
+
+    def __getattr__(self, name):
+        attribute = getattr(self._database, name)
+        if name.startswith("_") or is_method(attribute):
+            return attribute
+        return GuardedCollection(attribute, self._guard)
+
+    def __getitem__(self, name):
+        return GuardedCollection(self._database[name], self._guard)
+
+    def __repr__(self):
+        return "GuardedDatabase(%r)" % (self._database,)
+
+
+class GuardedCollection(object):
+    """Proxy of Mongo collection which calls it's methods through the guard,
+    methods of MONGO_READ_METHODS are retried. Cursors of find are checked
+    by the breaker when they are created, and their query is sent through
+    the guard by GuardedCursor.
+    """
+
+    def __init__(self, collection, guard):
+        self._collection = collection
+        self._guard = guard
+
+    def __getattr__(self, name):
+        attribute = getattr(self._collection, name)
+        if name.startswith("_") or not is_method(attribute):
+            return attribute
+        if name in MONGO_CURSOR_METHODS:
+            @functools.wraps(attribute)
+            def make_cursor(*args, **kwargs):
+                self._guard.breaker.check()
+                return GuardedCursor(attribute(*args, **kwargs), self._guard)
+            return make_cursor
+        guarded = (self._guard.call_idempotent if name in MONGO_READ_METHODS
+                   else self._guard.call)
+
+        @functools.wraps(attribute)
+        def call(*args, **kwargs):
+            result = guarded(attribute, *args, **kwargs)
+            if hasattr(result, "next") and hasattr(result, "sort"):
+                return GuardedCursor(result, self._guard)
+            return result
+        return call
+
+    def with_options(self, *args, **kwargs):
+        """Get the same collection with other options, guarded too."""
+        return GuardedCollection(
+            self._collection.with_options(*args, **kwargs), self._guard)
+
+    def __repr__(self):
+        return "GuardedCollection(%r)" % (self._collection,)
+
+
+class GuardedCursor(object):
+    """Proxy of Mongo cursor which sends it's query through the guard: the
+    first fetch is retried after transient errors, with the cursor rewound
+    before each retry, and it's outcome is recorded in the breaker. Later
+    fetches (getMore) are neither retried nor recorded.
+    """
+
+    def __init__(self, cursor, guard):
+        self._cursor = cursor
+        self._guard = guard
+        self._fetched = False
+        self._attempts = 0
+
+    def __getattr__(self, name):
+        attribute = getattr(self._cursor, name)
+        if name.startswith("_") or not is_method(attribute):
+            return attribute
+
+        @functools.wraps(attribute)
+        def call(*args, **kwargs):
+            result = attribute(*args, **kwargs)
+            # sort, limit and the like return the cursor itself
+            return self if result is self._cursor else result
+        return call
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        if self._fetched:
+            return self._cursor.next()
+        try:
+            return self._guard.call_idempotent(self._fetch_first)
+        finally:
+            self._fetched = True
+
+    __next__ = next
+
+    def _fetch_first(self):
+        """Fetch the first document, from the start of the query again if
+        the previous attempt failed.
+        """
+        if self._attempts:
+            self._cursor.rewind()
+        self._attempts += 1
+        return self._cursor.next()
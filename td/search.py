@@ -0,0 +1,188 @@
+"""
+.. module:: search
+   :platform: Unix
+   :synopsis: Search of the user's items by words and their prefixes.
+
+.. moduleauthor:: Mykola Radionov <moodaq@gmail.com>
+
+Items keep item_tokens, lowercase prefixes of the words of their
+item_value from MIN_PREFIX to MAX_PREFIX characters long. Text index
+SEARCH_INDEX covers (owner_id, item_value, item_tokens), so each search
+reads index entries of one user only. The index is made with language
+'none', words are neither stemmed nor dropped as stop words, and 'mil'
+finds 'milk' by it's prefix token. Whole words of item_value weigh more
+than prefixes, so items which contain the searched words are ranked before
+items which only start with them.
+
+Items added before the search have no tokens and are found by whole words
+until td_index_items command fills their tokens:
+
+    td_index_items development.ini
+
+"""
+
+import argparse
+import logging
+import re
+import sys
+
+import pymongo
+from pymongo import UpdateOne
+
+from td.config import ConfigScanner
+from td.mongo_client import make_client
+
+
+logger = logging.getLogger(__name__)
+
+SEARCH_INDEX = "items_search"
+MIN_PREFIX = 2
+MAX_PREFIX = 20
+# tokens of one item, the rest of long values is found by whole words
+MAX_TOKENS = 200
+# whole words are ranked above prefixes
+TEXT_WEIGHTS = {"item_value": 10, "item_tokens": 1}
+WORD_PATTERN = re.compile(r"[^\W_]+", re.UNICODE)
+
+
+def get_words(text):
+    """Split text into unique lowercase words in the order of appearance.
+
+    :param text: item_value or search query.
+    :type text: unicode
+    :rtype: list
+    """
+    words = []
+    for word in WORD_PATTERN.findall(text.lower()):
+        if word not in words:
+            words.append(word)
+    return words
+
+
+def make_tokens(item_value):
+    """Make prefix tokens of the item for the search index.
+
+    :param item_value: text of the item, other values have no tokens.
+    :type item_value: unicode
+    :return: list of unique prefixes like ['mi', 'mil', 'milk'].
+    :rtype: list
+    """
+    if not isinstance(item_value, basestring):
+        return []
+    tokens = []
+    known = set()
+    for word in get_words(item_value):
+        for length in range(MIN_PREFIX, min(len(word), MAX_PREFIX) + 1):
+            prefix = word[:length]
+            if prefix in known:
+                continue
+            if len(tokens) == MAX_TOKENS:
+                return tokens
+            known.add(prefix)
+            tokens.append(prefix)
+    return tokens
+
+
+def get_search_terms(query):
+    """Get terms of the search query, words longer than MAX_PREFIX are cut
+    to the longest token.
+
+    :param query: text typed by the user.
+    :type query: unicode
+    :rtype: list
+    """
+    terms = []
+    for word in get_words(query):
+        if word[:MAX_PREFIX] not in terms:
+            terms.append(word[:MAX_PREFIX])
+    return terms
+
+
+def create_search_index(collection):
+    """Create text index of the items, it's done by the warm-up of
+    td.app.main.
+
+    :param collection: Items collection.
+    :type collection: pymongo.collection.Collection
+    """
+    collection.create_index([("owner_id", pymongo.ASCENDING),
+                             ("item_value", pymongo.TEXT),
+                             ("item_tokens", pymongo.TEXT)],
+                            name=SEARCH_INDEX,
+                            weights=TEXT_WEIGHTS,
+                            default_language="none")
+
+
+def find_items(collection, owner_id, terms, categories=None, offset=0,
+               limit=50):
+    """Find owner's items which match any of the terms, the most relevant
+    first and the newest first among equally relevant ones.
+
+    :param collection: Items collection.
+    :type collection: pymongo.collection.Collection
+    :param owner_id: integer id of the user.
+    :type owner_id: int
+    :param terms: terms from get_search_terms.
+    :type terms: list
+    :param categories: names of the categories to include or None for all.
+    :type categories: list
+    :param offset: count of the matched items to skip.
+    :type offset: int
+    :param limit: count of items to return.
+    :type limit: int
+    :return: cursor of documents with item_value, category and score.
+    :rtype: pymongo.cursor.Cursor
+    """
+    query = {"owner_id": owner_id, "$text": {"$search": " ".join(terms)}}
+    if categories:
+        query["category"] = {"$in": categories}
+    score = {"$meta": "textScore"}
+    reply = collection.find(query, {"item_value": 1, "category": 1,
+                                    "score": score})
+    return reply.sort([("score", score),
+                       ("_id", pymongo.DESCENDING)]).skip(offset).limit(limit)
+
+
+def fill_tokens(collection, batch_size=1000):
+    """Set item_tokens of the items which don't have them.
+
+    :param collection: Items collection.
+    :type collection: pymongo.collection.Collection
+    :param batch_size: count of items updated with single bulk write.
+    :type batch_size: int
+    :return: count of updated items.
+    :rtype: int
+    """
+    updated = 0
+    while True:
+        documents = list(collection.find({"item_tokens": {"$exists": False}},
+                                         {"item_value": 1}).limit(batch_size))
+        if not documents:
+            break
+        collection.bulk_write([UpdateOne(
+            {"_id": document["_id"]},
+            {"$set": {"item_tokens": make_tokens(document.get("item_value"))}})
+            for document in documents], ordered=False)
+        updated += len(documents)
+        logger.info("Filled tokens of %d items.", updated)
+    return updated
+
+
+def index_items_main(argv=sys.argv):
+    """Entry point of td_index_items command."""
+    parser = argparse.ArgumentParser(
+        description="Create search index and fill tokens of the old items.")
+    parser.add_argument("config", help="path to the ini file")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args(argv[1:])
+
+    logging.basicConfig(level=logging.INFO)
+    config = ConfigScanner(args.config)
+    mongo_creds = config.get_subsection_in_section("mongo", "databases")
+    client = make_client(mongo_creds)
+    try:
+        items = client[mongo_creds["db_name"]].Items
+        create_search_index(items)
+        fill_tokens(items, args.batch_size)
+    finally:
+        client.close()
@@ -0,0 +1,9 @@
+"""
+.. module:: servers
+   :platform: Unix
+   :synopsis: Alternative server entry points for td app.
+
+.. moduleauthor:: Mykola Radionov <moodaq@gmail.com>
+
+
+"""
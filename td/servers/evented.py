@@ -0,0 +1,161 @@
+"""
+.. module:: evented
+   :platform: Unix
+   :synopsis: Evented (gevent) server entry point for td app.
+
+.. moduleauthor:: Mykola Radionov <moodaq@gmail.com>
+
+Serves the same Pyramid app as pserve with waitress, but each connection is
+handled by a greenlet instead of an OS thread, so thousands of idle or
+long-polling connections cost only memory of their greenlets.
+
+Sockets, sleeps and locks are patched by gevent, so pymongo waits for the
+server cooperatively. Calls of the C drivers of Postgres and MySQL and of
+bcrypt hold the process, so td.main wraps Connector and PasswordMaster into
+BlockingBridge which runs them in the bounded pool of OS threads. A service
+which gets a cooperative driver later is simply not wrapped.
+
+Run it with the same ini file:
+
+    td_serve_evented development.ini --port 6543 --max-connections 10000
+
+gevent is an optional dependency, it's imported only by this entry point.
+
+"""
+
+import argparse
+import functools
+import logging
+import sys
+
+
+logger = logging.getLogger(__name__)
+
+# count of OS threads running blocking calls by default
+DEFAULT_EXECUTOR_THREADS = 20
+
+
+def is_evented():
+    """Check if the process runs with sockets patched by gevent.
+
+    :return: True if blocking calls should be bridged to the executor.
+    :rtype: bool
+    """
+    monkey = sys.modules.get("gevent.monkey")
+    return monkey is not None and monkey.is_module_patched("socket")
+
+
+def make_executor(threads=DEFAULT_EXECUTOR_THREADS):
+    """Create bounded pool of OS threads for blocking calls.
+
+    :param threads: the biggest count of simultaneous blocking calls.
+    :type threads: int
+    :return: pool of threads.
+    :rtype: gevent.threadpool.ThreadPool
+    """
+    from gevent.threadpool import ThreadPool
+    return ThreadPool(threads)
+
+
+class BlockingBridge(object):
+    """Proxy which runs methods of the wrapped object in the executor, so the
+    calling greenlet waits for the result without blocking the others.
+
+    Attributes which are not callable are returned as is.
+    """
+
+    def __init__(self, target, executor, context=None):
+        """Wrap blocking object.
+
+        :param target: object with blocking methods (e.g. Connector).
+        :type target: object
+        :param executor: pool of threads to run the methods in.
+        :type executor: gevent.threadpool.ThreadPool
+        :param context: object with current() and activate(value) methods
+        like QueryTracker, value of the calling greenlet is activated in the
+        executor thread during the call.
+        :type context: td.instrumentation.QueryTracker
+        """
+        self._target = target
+        self._executor = executor
+        self._context = context
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        if not callable(attribute):
+            return attribute
+
+        context = self._context
+        if context is None:
+            @functools.wraps(attribute)
+            def call(*args, **kwargs):
+                return self._executor.apply(attribute, args, kwargs)
+            return call
+
+        def call_in_context(value, args, kwargs):
+            previous = context.activate(value)
+            try:
+                return attribute(*args, **kwargs)
+            finally:
+                context.activate(previous)
+
+        @functools.wraps(attribute)
+        def call(*args, **kwargs):
+            return self._executor.apply(call_in_context,
+                                        (context.current(), args, kwargs))
+        return call
+
+    def __repr__(self):
+        return "BlockingBridge(%r)" % (self._target,)
+
+
+def serve(app, host, port, max_connections=None):
+    """Serve WSGI app with gevent until the process is stopped.
+
+    :param app: WSGI application.
+    :type app: callable
+    :param host: interface to listen on.
+    :type host: str
+    :param port: port to listen on.
+    :type port: int
+    :param max_connections: the biggest count of simultaneously handled
+    connections, the others wait in the listen backlog.
+    :type max_connections: int
+    """
+    from gevent.pool import Pool
+    from gevent.pywsgi import WSGIServer
+    spawn = Pool(max_connections) if max_connections else "default"
+    server = WSGIServer((host, port), app, spawn=spawn, log=None,
+                        error_log=logger)
+    logger.info("Serving on http://%s:%d with gevent.", host, port)
+    server.serve_forever()
+
+
+def main(argv=sys.argv):
+    """Entry point of td_serve_evented command.
+
+    gevent patches the standard library before the app is loaded, so
+    clients and locks created by td.main are cooperative.
+    """
+    from gevent import monkey
+    monkey.patch_all()
+
+    from pyramid.paster import get_app, setup_logging
+    from td.config import ConfigScanner
+
+    parser = argparse.ArgumentParser(
+        description="Serve td app with gevent.")
+    parser.add_argument("config", help="path to the ini file")
+    parser.add_argument("--host", help="host from [server:main] by default")
+    parser.add_argument("--port", type=int,
+                        help="port from [server:main] by default")
+    parser.add_argument("--max-connections", type=int, default=10000)
+    args = parser.parse_args(argv[1:])
+
+    setup_logging(args.config)
+    server_settings = ConfigScanner(args.config).get_section("server:main")
+    app = get_app(args.config)
+    serve(app,
+          args.host or server_settings.get_str("host", "127.0.0.1"),
+          args.port or server_settings.get_int("port", 6543),
+          max_connections=args.max_connections)
@@ -0,0 +1,438 @@
+"""
+.. module:: prefork
+   :platform: Unix
+   :synopsis: Pre-fork server entry point which serves td app with several
+   waitress processes.
+
+.. moduleauthor:: Mykola Radionov <moodaq@gmail.com>
+
+Supervisor binds the listening socket, loads the app once and forks
+--workers processes which accept connections of the shared socket, each one
+with it's own waitress threads, so a node uses all of it's cores despite
+the GIL. Database clients and pools of the app are made lazily on the first
+use in each worker (see td.mongo_client.LazyDatabase and
+td.assessors.pool), threads of the app are restarted and databases are
+warmed up by the hooks added with register_after_fork.
+
+Workers are recycled gracefully: a worker which served --max-requests
+requests (plus random jitter, so they don't restart at once) or got SIGTERM
+stops accepting, finishes requests in progress for up to
+--graceful-timeout seconds and exits. The supervisor starts a new worker in
+place of each exited or crashed one, with growing delay if they crash right
+after the start.
+
+Signals of the supervisor:
+
+    SIGTERM, SIGINT  stop workers gracefully and exit.
+    SIGHUP           replace all workers gracefully, with --no-preload new
+                     workers load the changed code and config.
+
+Run it with the same ini file, waitress settings like threads are taken
+from [server:main] section:
+
+    td_serve_prefork development.ini --workers 4 --max-requests 10000
+
+Metrics and memory stores (like login_limit.store = memory) are kept by
+each worker separately.
+
+"""
+
+import argparse
+import atexit
+import errno
+import logging
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import sys
+import time
+
+from waitress import wasyncore
+from waitress.server import create_server
+
+
+logger = logging.getLogger(__name__)
+
+# settings of [server:main] section which are not waitress adjustments
+SERVER_SECTION_KEYS = ("use", "host", "port", "listen")
+# worker which exits sooner than this after the start is counted as crashed
+# on start and the next one is started after growing delay
+MIN_WORKER_LIFETIME = 1.0
+MAX_RESPAWN_DELAY = 10.0
+
+_after_fork_hooks = []
+_supervisor_pid = None
+
+
+def is_supervisor():
+    """Check if the app is preloaded by the supervisor, which only forks the
+    workers and shouldn't connect to databases itself.
+
+    :rtype: bool
+    """
+    return _supervisor_pid == os.getpid()
+
+
+def register_after_fork(hook):
+    """Add callable which is called without arguments in each worker right
+    after fork, e.g. to restart threads of the app.
+
+    :param hook: callable without arguments.
+    :type hook: callable
+    """
+    _after_fork_hooks.append(hook)
+
+
+def run_after_fork_hooks():
+    """Call hooks added with register_after_fork in the forked worker."""
+    for hook in _after_fork_hooks:
+        try:
+            hook()
+        except Exception:
+            logger.exception("After fork hook %r failed.", hook)
+
+
+def bind_socket(host, port, backlog=1024):
+    """Open listening socket which is shared by all workers.
+
+    :param host: interface to listen on.
+    :type host: str
+    :param port: port to listen on.
+    :type port: int
+    :param backlog: size of the queue of not accepted connections.
+    :type backlog: int
+    :return: listening socket.
+    :rtype: socket.socket
+    """
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    return sock
+
+
+class Worker(object):
+    """Waitress server of the forked process which serves app on the shared
+    socket until it's stopped or recycled.
+    """
+
+    def __init__(self, app, sock, server_settings=None, max_requests=0,
+                 graceful_timeout=30.0):
+        """Initialize worker.
+
+        :param app: WSGI application.
+        :type app: callable
+        :param sock: listening socket of the supervisor.
+        :type sock: socket.socket
+        :param server_settings: waitress adjustments like threads.
+        :type server_settings: dict
+        :param max_requests: count of requests after which the worker is
+        recycled (0 - never).
+        :type max_requests: int
+        :param graceful_timeout: seconds to finish requests in progress on
+        stop.
+        :type graceful_timeout: float
+        """
+        self.app = app
+        self.sock = sock
+        self.server_settings = server_settings or {}
+        self.max_requests = max_requests
+        self.graceful_timeout = graceful_timeout
+        self.requests = 0
+        self.stopping = False
+        self._server = None
+        self._parent_pid = os.getppid()
+
+    def stop(self, *args):
+        """Stop accepting connections and exit after requests in progress,
+        it's also handler of SIGTERM.
+        """
+        self.stopping = True
+        if self._server is not None:
+            self._server.pull_trigger()
+
+    def serve(self, environ, start_response):
+        """WSGI app which counts requests before they are handled."""
+        self.requests += 1
+        if self.max_requests and self.requests >= self.max_requests:
+            logger.info("Worker %d served %d requests, recycling it.",
+                        os.getpid(), self.requests)
+            self.stop()
+        return self.app(environ, start_response)
+
+    def run(self):
+        """Serve until stopped, then drain connections.
+
+        :return: exit code.
+        :rtype: int
+        """
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        socket_map = {}
+        self._server = create_server(self.serve, map=socket_map,
+                                     sockets=[self.sock],
+                                     **self.server_settings)
+        adj = self._server.adj
+        logger.info("Worker %d is serving.", os.getpid())
+        while not self.stopping:
+            wasyncore.loop(timeout=adj.asyncore_loop_timeout, map=socket_map,
+                           use_poll=adj.asyncore_use_poll, count=1)
+            if os.getppid() != self._parent_pid:
+                logger.warning("Supervisor of worker %d is gone.",
+                               os.getpid())
+                self.stopping = True
+        self._drain(socket_map)
+        return 0
+
+    def _drain(self, socket_map):
+        """Finish requests in progress and close idle connections."""
+        server = self._server
+        # the other workers accept connections of the shared socket
+        server.accepting = False
+        deadline = time.time() + self.graceful_timeout
+        while server.active_channels and time.time() < deadline:
+            for channel in list(server.active_channels.values()):
+                if not channel.requests and channel.request is None:
+                    channel.will_close = True
+            wasyncore.loop(timeout=0.1, map=socket_map,
+                           use_poll=server.adj.asyncore_use_poll, count=1)
+        if server.active_channels:
+            logger.warning("Worker %d drops %d connections after %.1f "
+                           "seconds.", os.getpid(),
+                           len(server.active_channels), self.graceful_timeout)
+        server.task_dispatcher.shutdown(cancel_pending=True, timeout=1)
+
+
+class Supervisor(object):
+    """Parent process which forks workers, starts new ones in place of
+    exited ones and stops them on signals.
+    """
+
+    def __init__(self, load_app, sock, workers, server_settings=None,
+                 max_requests=0, max_requests_jitter=0, graceful_timeout=30.0,
+                 preload=True):
+        """Initialize supervisor.
+
+        :param load_app: callable without arguments which returns WSGI app.
+        :type load_app: callable
+        :param sock: listening socket.
+        :type sock: socket.socket
+        :param workers: count of worker processes.
+        :type workers: int
+        :param server_settings: waitress adjustments of each worker.
+        :type server_settings: dict
+        :param max_requests: requests after which worker is recycled
+        (0 - never).
+        :type max_requests: int
+        :param max_requests_jitter: the biggest random count added to
+        max_requests of each worker.
+        :type max_requests_jitter: int
+        :param graceful_timeout: seconds which stopping worker has to finish
+        requests in progress.
+        :type graceful_timeout: float
+        :param preload: load app once in the supervisor before fork, or in
+        each worker after fork.
+        :type preload: bool
+        """
+        self.load_app = load_app
+        self.sock = sock
+        self.workers = workers
+        self.server_settings = server_settings or {}
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.graceful_timeout = graceful_timeout
+        self.preload = preload
+        self.app = None
+        # pid -> time of the start, of serving and retiring workers
+        self._workers = {}
+        self._retiring = set()
+        self._respawn_delay = 0.0
+        self._respawn_at = 0.0
+        self._stopping = False
+        self._replace = False
+
+    def run(self):
+        """Supervise workers until SIGTERM or SIGINT.
+
+        :return: exit code.
+        :rtype: int
+        """
+        global _supervisor_pid
+        _supervisor_pid = os.getpid()
+        if self.preload:
+            self.app = self.load_app()
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        signal.signal(signal.SIGHUP, self._handle_replace)
+        logger.info("Supervisor %d starts %d workers.", os.getpid(),
+                    self.workers)
+        try:
+            while not self._stopping:
+                self._reap()
+                if self._replace:
+                    self._replace = False
+                    self._retire(set(self._workers) - self._retiring)
+                self._spawn_missing()
+                time.sleep(0.2)
+        finally:
+            self._stop_all()
+        return 0
+
+    def _handle_stop(self, signum, frame):
+        self._stopping = True
+
+    def _handle_replace(self, signum, frame):
+        logger.info("Replacing workers.")
+        self._replace = True
+
+    def _spawn_missing(self):
+        """Fork workers up to the configured count."""
+        while len(self._workers) - len(self._retiring) < self.workers:
+            if time.time() < self._respawn_at:
+                return
+            self._spawn()
+
+    def _spawn(self):
+        """Fork worker, it never returns in the child."""
+        max_requests = self.max_requests
+        if max_requests and self.max_requests_jitter:
+            max_requests += random.randint(0, self.max_requests_jitter)
+        pid = os.fork()
+        if pid:
+            self._workers[pid] = time.time()
+            return
+        code = 1
+        try:
+            random.seed()
+            run_after_fork_hooks()
+            app = self.app if self.app is not None else self.load_app()
+            code = Worker(app, self.sock, self.server_settings, max_requests,
+                          self.graceful_timeout).run()
+        except Exception:
+            logger.exception("Worker %d failed.", os.getpid())
+        finally:
+            # frames of the supervisor must not be unwound in the worker
+            try:
+                atexit._run_exitfuncs()
+            finally:
+                os._exit(code)
+
+    def _reap(self):
+        """Forget exited workers and delay the next start if they crashed
+        right after the start.
+        """
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except OSError as error:
+                if error.errno == errno.ECHILD:
+                    return
+                raise
+            if not pid:
+                return
+            started = self._workers.pop(pid, None)
+            retired = pid in self._retiring
+            self._retiring.discard(pid)
+            if started is None or retired:
+                continue
+            if os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0:
+                logger.info("Worker %d exited.", pid)
+            else:
+                logger.error("Worker %d crashed with status %d.", pid,
+                             status)
+            if time.time() - started < MIN_WORKER_LIFETIME:
+                self._respawn_delay = min(max(self._respawn_delay * 2, 0.1),
+                                          MAX_RESPAWN_DELAY)
+                self._respawn_at = time.time() + self._respawn_delay
+            else:
+                self._respawn_delay = 0.0
+
+    def _retire(self, pids):
+        """Ask workers to stop gracefully, new ones are started in their
+        place right away.
+        """
+        for pid in pids:
+            self._retiring.add(pid)
+            self._kill(pid, signal.SIGTERM)
+
+    def _stop_all(self):
+        """Stop workers gracefully and kill the ones which don't stop in
+        graceful_timeout.
+        """
+        self._retire(set(self._workers) - self._retiring)
+        deadline = time.time() + self.graceful_timeout + 1
+        while self._workers and time.time() < deadline:
+            self._reap()
+            time.sleep(0.05)
+        for pid in list(self._workers):
+            logger.warning("Killing worker %d.", pid)
+            self._kill(pid, signal.SIGKILL)
+            try:
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+            self._workers.pop(pid, None)
+        logger.info("Supervisor %d stopped.", os.getpid())
+
+    @staticmethod
+    def _kill(pid, signum):
+        try:
+            os.kill(pid, signum)
+        except OSError as error:
+            if error.errno != errno.ESRCH:
+                raise
+
+
+def get_server_settings(server_section):
+    """Get waitress adjustments of [server:main] section.
+
+    :param server_section: settings of [server:main] section.
+    :type server_section: td.config.Settings
+    :return: dict of adjustments without host and port.
+    :rtype: dict
+    """
+    return dict((key, value) for key, value in server_section.items()
+                if key not in SERVER_SECTION_KEYS)
+
+
+def main(argv=sys.argv):
+    """Entry point of td_serve_prefork command."""
+    from pyramid.paster import get_app, setup_logging
+    from td.config import ConfigScanner
+
+    parser = argparse.ArgumentParser(
+        description="Serve td app with several waitress processes.")
+    parser.add_argument("config", help="path to the ini file")
+    parser.add_argument("--host", help="host from [server:main] by default")
+    parser.add_argument("--port", type=int,
+                        help="port from [server:main] by default")
+    parser.add_argument("--workers", type=int,
+                        default=multiprocessing.cpu_count())
+    parser.add_argument("--max-requests", type=int, default=0,
+                        help="recycle worker after this count of requests")
+    parser.add_argument("--max-requests-jitter", type=int, default=0)
+    parser.add_argument("--graceful-timeout", type=float, default=30)
+    parser.add_argument("--no-preload", dest="preload",
+                        action="store_false",
+                        help="load app in each worker after fork")
+    args = parser.parse_args(argv[1:])
+
+    setup_logging(args.config)
+    server_section = ConfigScanner(args.config).get_section("server:main")
+    host = args.host or server_section.get_str("host", "127.0.0.1")
+    port = args.port or server_section.get_int("port", 6543)
+    sock = bind_socket(host, port)
+    logger.info("Serving on http://%s:%d with %d workers.", host, port,
+                args.workers)
+    supervisor = Supervisor(lambda: get_app(args.config), sock, args.workers,
+                            server_settings=get_server_settings(
+                                server_section),
+                            max_requests=args.max_requests,
+                            max_requests_jitter=args.max_requests_jitter,
+                            graceful_timeout=args.graceful_timeout,
+                            preload=args.preload)
+    return supervisor.run()
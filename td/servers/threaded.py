@@ -0,0 +1,62 @@
+"""
+.. module:: threaded
+   :platform: Unix
+   :synopsis: waitress server runner of td app which exposes it's queue
+   depth.
+
+.. moduleauthor:: Mykola Radionov <moodaq@gmail.com>
+
+Runs waitress the same way egg:waitress#main does and, if metrics of the
+app are enabled, registers gauge of requests waiting for a free thread of
+waitress. Use it in [server:main] section of the ini file:
+
+    use = egg:td#waitress
+
+"""
+
+import logging
+
+from waitress.server import create_server
+
+
+logger = logging.getLogger(__name__)
+
+
+def add_queue_gauge(app, server):
+    """Register waitress_queue_depth gauge in metrics of the app.
+
+    :param app: WSGI application served by the server.
+    :type app: pyramid.router.Router
+    :param server: waitress server.
+    :type server: waitress.server.BaseWSGIServer
+    :return: True if the gauge was registered.
+    :rtype: bool
+    """
+    registry = getattr(app, "registry", None)
+    metrics = registry.settings.get("metrics") if registry else None
+    if metrics is None:
+        return False
+    queue = server.task_dispatcher.queue
+    metrics.add_gauge("waitress_queue_depth",
+                      "Requests waiting for a free thread of waitress.",
+                      lambda: len(queue))
+    return True
+
+
+def serve_paste(app, global_conf, **kw):
+    """Paste server runner which serves app with waitress until the process
+    is stopped.
+
+    :param app: WSGI application.
+    :type app: callable
+    :param global_conf: defaults of the ini file.
+    :type global_conf: dict
+    :param kw: waitress settings of [server:main] section.
+    :return: exit code.
+    :rtype: int
+    """
+    server = create_server(app, **kw)
+    add_queue_gauge(app, server)
+    server.print_listen("Serving on http://{}:{}")
+    server.run()
+    return 0
@@ -0,0 +1,158 @@
+"""
+.. module:: startup
+   :platform: Unix
+   :synopsis: Timing of imports and initialization of td app.
+
+.. moduleauthor:: Mykola Radionov <moodaq@gmail.com>
+
+td.app.main marks it's phases with timer.mark and logs them once the app
+is made. td_profile_startup command loads the app like pserve does and
+reports time of the first import of each module and time of each phase:
+
+    td_profile_startup development.ini --top 20
+
+Self time of the module is the time of executing it's own code, without
+modules it imports, cumulative time includes them.
+
+"""
+
+import __builtin__
+import argparse
+import sys
+import time
+
+
+class PhaseTimer(object):
+    """Durations of consecutive phases of the initialization, each one
+    lasts from the previous mark.
+    """
+
+    def __init__(self):
+        self.phases = []
+        self._last = time.time()
+
+    def start(self):
+        """Forget phases of the previous initialization and start the first
+        phase.
+        """
+        self.phases = []
+        self._last = time.time()
+
+    def mark(self, name):
+        """End the current phase and start the next one.
+
+        :param name: name of the ended phase like 'mongo'.
+        :type name: str
+        """
+        now = time.time()
+        self.phases.append((name, now - self._last))
+        self._last = now
+
+    def total(self):
+        """Get seconds of all recorded phases.
+
+        :rtype: float
+        """
+        return sum(duration for _, duration in self.phases)
+
+    def format(self):
+        """Format phases as 'name 0.012 s' separated by commas."""
+        return ", ".join("%s %.3f s" % phase for phase in self.phases)
+
+
+# timer of td.app.main
+timer = PhaseTimer()
+
+
+class ImportProfiler(object):
+    """Replaces __import__ while it's started and records time of the first
+    import of each module.
+    """
+
+    def __init__(self):
+        # name of the module -> [cumulative seconds, self seconds]
+        self.modules = {}
+        self._stack = []
+        self._original_import = None
+
+    def start(self):
+        """Start recording imports."""
+        self._original_import = __builtin__.__import__
+        __builtin__.__import__ = self._import
+
+    def stop(self):
+        """Stop recording imports."""
+        if self._original_import is not None:
+            __builtin__.__import__ = self._original_import
+            self._original_import = None
+
+    def top(self, count, key="self"):
+        """Get the slowest imports.
+
+        :param count: count of modules.
+        :type count: int
+        :param key: 'self' or 'cumulative'.
+        :type key: str
+        :return: list of tuples (name, cumulative seconds, self seconds).
+        :rtype: list
+        """
+        index = 1 if key == "self" else 0
+        ordered = sorted(self.modules.items(),
+                         key=lambda item: item[1][index], reverse=True)
+        return [(name, times[0], times[1]) for name, times in
+                ordered[:count]]
+
+    def _import(self, name, *args, **kwargs):
+        known = len(sys.modules)
+        # time of the nested imports is subtracted from self time
+        self._stack.append(0.0)
+        started = time.time()
+        try:
+            return self._original_import(name, *args, **kwargs)
+        finally:
+            duration = time.time() - started
+            nested = self._stack.pop()
+            if self._stack:
+                self._stack[-1] += duration
+            if len(sys.modules) > known:
+                self._record(name, duration, duration - nested)
+
+    def _record(self, name, duration, own):
+        """Add time of the import to the module, relative imports of
+        Python 2 are recorded under their own name.
+        """
+        times = self.modules.setdefault(name, [0.0, 0.0])
+        times[0] += duration
+        times[1] += own
+
+
+def profile_startup_main(argv=sys.argv):
+    """Entry point of td_profile_startup command."""
+    parser = argparse.ArgumentParser(
+        description="Report time of imports and initialization of td app.")
+    parser.add_argument("config", help="path to the ini file")
+    parser.add_argument("--top", type=int, default=20,
+                        help="count of the slowest imports to report")
+    parser.add_argument("--sort", choices=["self", "cumulative"],
+                        default="self")
+    args = parser.parse_args(argv[1:])
+
+    profiler = ImportProfiler()
+    started = time.time()
+    profiler.start()
+    try:
+        from pyramid.paster import get_app
+        get_app(args.config)
+    finally:
+        profiler.stop()
+    total = time.time() - started
+
+    print("%-40s %10s %10s" % ("module", "cumul, ms", "self, ms"))
+    for name, cumulative, own in profiler.top(args.top, args.sort):
+        print("%-40s %10.1f %10.1f" % (name, cumulative * 1000, own * 1000))
+    print("")
+    print("%-40s %10s" % ("phase of td.app.main", "ms"))
+    for name, duration in timer.phases:
+        print("%-40s %10.1f" % (name, duration * 1000))
+    print("")
+    print("%-40s %10.1f" % ("total", total * 1000))
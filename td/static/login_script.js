@@ -28,6 +28,8 @@ function post_login_credentials() {
                 // When 401 unauthorized comes throw a message about wrong credentials, otherwise inform that server is dead.
                 if (xhr.status == 401) {
                 alert("Wrong login or password.");
+                } else if (xhr.status == 429) {
+                alert("Too many login attempts, try again later.");
                 } else {
                 alert("Something went wrong on the server.")
                 }
@@ -4,34 +4,123 @@ function escape_html_tag_syntax(text) {
 }
 
 
-function get_items() {
-    // Get JSON repsonse with array of existing items and their category, and
-    // then create html elements for their representation on the web-page.
+// Version of the list rendered on the page, it is used to ask the server
+// only for the changes made after it.
+var list_version = null;
+
+
+function get_active_categories() {
+    // Return array of categories which are checked in #category_checkboxes.
     var selected_chboxes_objs_list = $("#category_checkboxes")
                                         .find("input:checkbox:checked");
     var active_categories_list = [];
     selected_chboxes_objs_list.map(function(index, item) {
             active_categories_list.push(item.value);
         });
+    return active_categories_list;
+}
 
-    $.get("/api/get_todo_list_items", function(response) {
+
+function make_item_li(item) {
+    // Create li element for item object with id, item_value and category.
+    var li = $(`<li data-id=${item.id}></li>`)
+        .html(escape_html_tag_syntax(item.item_value));
+    li.toggleClass(`${item.category}_li`);
+    return li;
+}
+
+
+function get_items(after) {
+    // Get JSON repsonse with page of existing items of checked categories,
+    // and then create html elements for their representation on the web-page.
+    // Without after argument the list is redrawn from the first page,
+    // otherwise page of items older than item with after id is appended to it.
+    var active_categories_list = get_active_categories();
+    if (active_categories_list.length == 0) {
+        // nothing to show, don't ask the server for items of all categories
         $("#tasks_list").empty();
+        $("#load_more_btn").hide();
+        return;
+    }
+    var params = {"category": active_categories_list};
+    if (after) {
+        params.after = after;
+    }
+
+    // traditional serialization gives ?category=red&category=green
+    $.get("/api/get_todo_list_items?" + $.param(params, true), function(response) {
+        if (!after) {
+            $("#tasks_list").empty();
+            list_version = response.version;
+        }
         if (response.items === null) {
             append_initial_info();
         } else {
-            for (var i=response.items.length-1; i>-1; i--) {
-                // append item if it's category is in allowed active_categories_list
-                if ($.inArray(response.items[i].category, active_categories_list) != -1) {
-                    var li = $(`<li data-id=${response.items[i].id}></li>`)
-                        .html(escape_html_tag_syntax(response.items[i].item_value));
-                    li.toggleClass(`${response.items[i].category}_li`);
-                    li.appendTo("#tasks_list");
-                }
+            // items come from the newest to the oldest one
+            for (var i=0; i<response.items.length; i++) {
+                make_item_li(response.items[i]).appendTo("#tasks_list");
             }
         }
+        // show "more" button while there are older pages
+        $("#load_more_btn").off()
+            .toggle(response.next !== null)
+            .on("click", function() {
+                get_items(response.next);
+            });
     });
 }
 
+function sync_items() {
+    // Apply to the rendered list only the changes made since list_version,
+    // or redraw the whole list if the server doesn't have them anymore.
+    if (list_version === null) {
+        get_items();
+        return;
+    }
+    $.get("/api/changes", {"since": list_version}, function(response) {
+        if (response.reset) {
+            get_items();
+            return;
+        }
+        var active_categories_list = get_active_categories();
+        for (var i=0; i<response.changes.length; i++) {
+            apply_change(response.changes[i], active_categories_list);
+        }
+        list_version = response.version;
+    });
+}
+
+
+function apply_change(change, active_categories_list) {
+    // Insert new item on top of the list or remove deleted one from it.
+    if (change.op == "insert") {
+        if ($.inArray(change.item.category, active_categories_list) != -1 &&
+                $(`#tasks_list li[data-id=${change.item.id}]`).length == 0) {
+            $("#initial_info").remove();
+            make_item_li(change.item).prependTo("#tasks_list");
+        }
+    } else {
+        $(`#tasks_list li[data-id=${change.id}]`).remove();
+    }
+}
+
+
+function after_change(version, change) {
+    // Apply own change to the list right away if nothing else was changed
+    // since list_version, otherwise ask the server for all the changes.
+    // Version is null for buffered item, it's change comes later with the
+    // other changes.
+    if (version === null) {
+        apply_change(change, get_active_categories());
+    } else if (list_version !== null && version == list_version + 1) {
+        apply_change(change, get_active_categories());
+        list_version = version;
+    } else {
+        sync_items();
+    }
+}
+
+
 function append_initial_info() {
     // Append "There are no tasks added..." initial info text description
     // paragraph to tasks panel.
@@ -46,7 +135,7 @@ function post_new_item() {
     // Function to be run when onclick event on save button is triggered.
     // - validate entered in input field data;
     // - send POST to the server resource at /api/add_todo_list_item to save it
-    // in session memory;
+    // in the database;
     // - on success delete initial message "There are no tasks added..." to
     // free space for added item, and clear input on success.
     var input_value = $("#add_item_input").val();
@@ -62,7 +151,7 @@ function post_new_item() {
         .value;
     $.post("/api/add_todo_list_item",
            JSON.stringify({"item_value": input_value, "category": category_name }),
-            function() {
+            function(response) {
                 // POST success function.
                 $("#add_item_input").val(""); // clear input
                 if ($("#initial_info").length) {
@@ -70,8 +159,11 @@ function post_new_item() {
                     // moment when user adds new item to list:
                     $("#initial_info").remove();
                 }
-                $("#tasks_list").empty();
-                get_items()
+                after_change(response.version,
+                             {"op": "insert",
+                              "item": {"id": response.id,
+                                       "item_value": input_value,
+                                       "category": category_name}});
             }
           ).fail(
               function(xhr, textStatus, errorThrown) {
@@ -118,9 +210,9 @@ function show_removal_modal(item_to_remove) {
 
     $("#submit_modal").off().on("click", function(event) {
 
-        $.post("/api/remove_item", JSON.stringify({"id": id}), function() {
+        $.post("/api/remove_item", JSON.stringify({"id": id}), function(response) {
             item_to_remove.remove();
-            get_items();
+            after_change(response.version, {"op": "delete", "id": id});
         });
 
         p.remove();
@@ -0,0 +1,214 @@
+"""
+.. module:: test_assessors
+   :platform: Unix
+   :synopsis: Unittests for td.assessors.assessors
+
+.. moduleauthor:: Mykola Radionov <moodaq@gmail.com>
+
+
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from td.assessors.assessors import Connector
+from td.assessors.pool import ConnectionPool, PooledConnection
+from td.exceptions import WrongEngineException, WrongQueryException
+
+
+class FakeCursor(object):
+    """Driver cursor stand-in which records executed queries and fails
+    while the connection has failures left.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.executed = connection.executed
+
+    def execute(self, query, params=None):
+        self.executed.append((query, params))
+        if self.connection.failures:
+            self.connection.failures -= 1
+            raise IOError("Statement failed.")
+
+    def fetchone(self):
+        return (1,)
+
+    def fetchall(self):
+        return [(1,), (2,)]
+
+
+class FakeConnection(object):
+    """Driver connection stand-in which shares list of executed queries
+    between all of it's cursors.
+    """
+
+    def __init__(self, failures=0):
+        self.executed = []
+        self.closed = False
+        self.failures = failures
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectorTestCase(unittest.TestCase):
+    """Base for Connector tests which replaces it's pool with the pool of
+    fake connections.
+    """
+    engine_type = None
+
+    def setUp(self):
+        """Create Connector with single fake connection in the pool."""
+        self.connection = FakeConnection()
+        self.connector = Connector(self.engine_type, {})
+        self.connector.pool = ConnectionPool(connect=lambda: self.connection,
+                                             ping=lambda db: True,
+                                             max_size=1)
+
+
+class TestPostgresConnector(ConnectorTestCase):
+    """Test td.assessors.assessors.Connector with postgres engine."""
+    engine_type = "postgres"
+
+    def test_statement_is_prepared_once(self):
+        """Test that repeated query is prepared only on first execution and
+        params are always bound.
+        """
+        self.connector.select_one("id", "Users", {"username": "user"})
+        self.connector.select_one("id", "Users", {"username": "other"})
+        self.assertEqual(self.connection.executed, [
+            ('PREPARE td_stmt_0 AS SELECT "id" FROM "Users" WHERE '
+             '"username" = $1; EXECUTE td_stmt_0(%s)', ("user",)),
+            ("EXECUTE td_stmt_0(%s)", ("other",))])
+
+    def test_failed_statement_is_not_cached(self):
+        """Test that statement which failed on the first execution isn't
+        cached and it's name isn't reused by the next PREPARE.
+        """
+        db = PooledConnection(FakeConnection(failures=1))
+        query = 'SELECT "id" FROM "Users" WHERE "username" = %s'
+        execute = self.connector._Connector__execute
+        self.assertRaises(IOError, execute, db, query, ("user",))
+        self.assertEqual(db.statements, {})
+        execute(db, query, ("user",))
+        execute(db, query, ("other",))
+        self.assertEqual([executed[0] for executed in db.db.executed[1:]], [
+            'PREPARE td_stmt_1 AS SELECT "id" FROM "Users" WHERE '
+            '"username" = $1; EXECUTE td_stmt_1(%s)',
+            "EXECUTE td_stmt_1(%s)"])
+
+    def test_statement_cache_limit(self):
+        """Test that queries over statement_cache_size are not prepared."""
+        self.connector.statement_cache_size = 0
+        rows = self.connector.select_all("id", "Users")
+        self.assertEqual(rows, ((1,), (2,)))
+        self.assertEqual(self.connection.executed,
+                         [('SELECT "id" FROM "Users"', ())])
+
+    def test_insert(self):
+        """Test that insert binds values for each column."""
+        self.connector.insert("Users", "username, groups",
+                              ("user", "group:users"))
+        query, params = self.connection.executed[0]
+        self.assertTrue(query.startswith(
+            'PREPARE td_stmt_0 AS INSERT INTO "Users" ("username", "groups") '
+            'VALUES ($1, $2); EXECUTE td_stmt_0(%s, %s)'))
+        self.assertEqual(params, ("user", "group:users"))
+
+
+class TestMySQLConnector(ConnectorTestCase):
+    """Test td.assessors.assessors.Connector with mysql engine."""
+    engine_type = "mysql"
+
+    def test_params_are_bound(self):
+        """Test that select sends value as bound param."""
+        self.connector.select_one("id, groups", "Users",
+                                  {"username": "' OR '1'='1"})
+        self.assertEqual(self.connection.executed, [
+            ("SELECT `id`, `groups` FROM `Users` WHERE `username` = %s",
+             ("' OR '1'='1",))])
+
+    def test_listeners(self):
+        """Test that executed statements are reported to listeners."""
+        events = []
+        self.connector.add_listener(events.append)
+        self.connector.select_one("id", "Users", {"username": "user"})
+        self.connector.insert("Users", "username", ("user",))
+        self.assertEqual([(event.kind, event.statement, event.params)
+                          for event in events], [
+            ("sql", "SELECT `id` FROM `Users` WHERE `username` = %s",
+             ("user",)),
+            ("sql", "INSERT INTO `Users` (`username`) VALUES (%s)",
+             ("user",))])
+        self.assertTrue(all(event.duration >= event.wait >= 0
+                            for event in events))
+
+    def test_wrong_identifier(self):
+        """Test that identifiers can't be used for injections."""
+        self.assertRaises(WrongQueryException,
+                          self.connector.select_one,
+                          "id", "Users; DROP TABLE Users")
+        self.assertEqual(self.connection.executed, [])
+
+
+class TestSQLiteConnector(unittest.TestCase):
+    """Test td.assessors.assessors.Connector with sqlite engine."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.connector = Connector("sqlite", {
+            "db_name": os.path.join(self.directory, "td.sqlite")})
+
+    def tearDown(self):
+        self.connector.pool.close()
+        shutil.rmtree(self.directory)
+
+    def test_insert_and_select(self):
+        """Test that Users table is created and rows are selected by bound
+        params.
+        """
+        self.connector.insert("Users", "username, password, groups",
+                              ("user", "hash", "group:users"))
+        self.assertEqual(self.connector.select_one(
+            "id, groups", "Users", {"username": "user"}), (1, "group:users"))
+        self.assertIsNone(self.connector.select_one(
+            "id", "Users", {"username": "' OR '1'='1"}))
+        self.assertEqual(self.connector.select_all("username", "Users"),
+                         (("user",),))
+
+    def test_connection_per_thread(self):
+        """Test that thread reuses it's connection in WAL mode and the other
+        thread gets it's own one.
+        """
+        self.connector.select_all("id", "Users")
+        conn = self.connector.pool.acquire()
+        self.assertIs(self.connector.pool.acquire(), conn)
+        self.assertEqual(conn.cursor().execute(
+            "PRAGMA journal_mode").fetchone(), ("wal",))
+        others = []
+        thread = threading.Thread(
+            target=lambda: others.append(self.connector.pool.acquire()))
+        thread.start()
+        thread.join()
+        self.assertIsNot(others[0], conn)
+        self.assertEqual(self.connector.pool.stats()["size"], 2)
+
+
+class TestWrongEngine(ConnectorTestCase):
+    """Test td.assessors.assessors.Connector with unknown engine."""
+    engine_type = "oracle"
+
+    def test_wrong_engine(self):
+        """Test that unknown engine raises WrongEngineException."""
+        self.assertRaises(WrongEngineException,
+                          self.connector.select_one, "id", "Users")
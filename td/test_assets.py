@@ -0,0 +1,74 @@
+"""
+.. module:: test_assets
+   :platform: Unix
+   :synopsis: Unittests for td.assets
+
+.. moduleauthor:: Mykola Radionov <moodaq@gmail.com>
+
+
+"""
+
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+from cStringIO import StringIO
+
+from td.assets import AssetStore
+
+
+FILES = {
+    "page.html": '<link href="static/css/style.css"><script '
+                 'src="static/vendor/jquery/jquery-3.1.1.min.js"></script>'
+                 '<script src="static/vendor/bootstrap/js/bootstrap.min.js">'
+                 '</script>',
+    "css/style.css": "body { background: url('../img/bg.png?v=1'); }" * 10,
+    "img/bg.png": "\x89PNG fake",
+    "sass/style.sass": "body",
+}
+
+
+class TestAssetStore(unittest.TestCase):
+    """Test td.assets.AssetStore"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        for path, body in FILES.items():
+            full_path = os.path.join(self.directory, path)
+            if not os.path.isdir(os.path.dirname(full_path)):
+                os.makedirs(os.path.dirname(full_path))
+            with open(full_path, "wb") as static_file:
+                static_file.write(body)
+        self.assets = AssetStore(self.directory).load()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_references(self):
+        """Test that references are replaced with fingerprinted URLs and
+        missing vendored assets with CDN URLs.
+        """
+        css = self.assets.get_by_path("css/style.css")
+        png_url = self.assets.url("img/bg.png")
+        self.assertRegexpMatches(png_url, r"^/assets/img/bg\.[0-9a-f]{10}\.png$")
+        self.assertIn("url('%s?v=1')" % png_url, css.body)
+        page = self.assets.get_by_path("page.html").body
+        self.assertIn('href="%s"' % css.url, page)
+        self.assertIn('src="https://code.jquery.com/jquery-3.1.1.min.js">',
+                      page)
+        # CDN fallback keeps the SRI hash the pages were pinned with
+        self.assertIn('src="https://maxcdn.bootstrapcdn.com/bootstrap/'
+                      '4.0.0-alpha.6/js/bootstrap.min.js" integrity="sha384-'
+                      'vBWWzlZJ8ea9aCX4pEW3rVHjgjt7zpkNpZk+02D9phzyeVkE+jo0ie'
+                      'GizqPLForn" crossorigin="anonymous">', page)
+        self.assertIs(self.assets.get(css.url), css)
+        self.assertIsNone(self.assets.get_by_path("sass/style.sass"))
+
+    def test_gzip_variants(self):
+        """Test that only compressible assets have gzip variants."""
+        css = self.assets.get_by_path("css/style.css")
+        self.assertEqual(gzip.GzipFile(fileobj=StringIO(css.gzip_body)).read(),
+                         css.body)
+        self.assertNotEqual(css.gzip_etag, css.etag)
+        self.assertIsNone(self.assets.get_by_path("img/bg.png").gzip_body)
@@ -0,0 +1,97 @@
+"""
+.. module:: test_auth
+   :platform: Unix
+   :synopsis: Unittests for td.auth
+
+.. moduleauthor:: Mykola Radionov <moodaq@gmail.com>
+
+
+"""
+
+import unittest
+
+import mongomock
+from pyramid.request import Request
+from pyramid.response import Response
+
+from td.auth import (TicketAuthenticationPolicy,
+                     decode_tokens,
+                     encode_tokens,
+                     get_user_id)
+from td.versions import get_tickets_version, revoke_tickets
+
+
+class TestTokens(unittest.TestCase):
+    """Test td.auth.encode_tokens and td.auth.decode_tokens"""
+
+    def test_roundtrip(self):
+        """Test that id, version and groups with colons survive encoding."""
+        tokens = encode_tokens(7, ["group:users", "group:admins"], 3)
+        self.assertEqual(decode_tokens(tokens),
+                         (7, 3, ["group:users", "group:admins"]))
+
+    def test_tickets_without_tokens(self):
+        """Test that tickets of the old format are not decoded."""
+        self.assertIsNone(decode_tokens(()))
+        self.assertIsNone(decode_tokens(("uid7",)))
+        self.assertIsNone(decode_tokens(("uidx", "ver0")))
+
+
+class TestTicketAuthenticationPolicy(unittest.TestCase):
+    """Test td.auth.TicketAuthenticationPolicy"""
+
+    def setUp(self):
+        self.mongo_db = mongomock.MongoClient().TDDB
+        self.found = []
+        self.policy = self.make_policy(refresh_interval=300)
+
+    def find_user(self, userid):
+        self.found.append(userid)
+        if userid == "user":
+            return 1, ["group:users"]
+        return None
+
+    def make_policy(self, refresh_interval):
+        return TicketAuthenticationPolicy(
+            "secret", self.find_user,
+            get_version=lambda user_id: get_tickets_version(self.mongo_db,
+                                                            user_id),
+            refresh_interval=refresh_interval)
+
+    def make_request(self, policy=None):
+        """Make request with the ticket of 'user' issued by the policy."""
+        headers = (policy or self.policy).remember(
+            Request.blank("/"), "user", user_id=1, groups=["group:users"])
+        cookie = headers[0][1].split(";")[0]
+        return Request.blank("/", headers={"Cookie": cookie})
+
+    def test_fresh_ticket(self):
+        """Test that fresh ticket is trusted without lookup of the user."""
+        request = self.make_request()
+        self.assertEqual(self.policy.effective_principals(request),
+                         ["system.Everyone", "system.Authenticated", "user",
+                          "group:users"])
+        self.assertEqual(get_user_id(request), 1)
+        self.assertEqual(self.found, [])
+        self.assertFalse(request.response_callbacks)
+
+    def test_stale_ticket_is_refreshed(self):
+        """Test that tokens of the old ticket are checked and the ticket is
+        reissued.
+        """
+        policy = self.make_policy(refresh_interval=0)
+        request = self.make_request(policy)
+        self.assertEqual(policy.authenticated_userid(request), "user")
+        self.assertEqual(self.found, ["user"])
+        response = Response()
+        request._process_response_callbacks(response)
+        self.assertIn("auth_tkt=", response.headers["Set-Cookie"])
+
+    def test_revoked_ticket(self):
+        """Test that tickets issued before revoke_tickets are rejected."""
+        request = self.make_request()
+        self.assertEqual(revoke_tickets(self.mongo_db, 1), 1)
+        self.assertIsNone(self.policy.authenticated_userid(request))
+        self.assertIsNone(get_user_id(request))
+        self.assertEqual(self.policy.authenticated_userid(
+            self.make_request()), "user")
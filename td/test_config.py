@@ -0,0 +1,115 @@
+"""
+.. module:: test_config
+   :platform: Unix
+   :synopsis: Unittests for td.config
+
+.. moduleauthor:: Mykola Radionov <moodaq@gmail.com>
+
+
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from td.config import ConfigScanner, Settings, parse_duration
+
+
+CONFIG = """
+[app:main]
+items.page_size = 20
+debug = yes
+password_master.queue_timeout = 250ms
+
+[databases]
+postgres.host = localhost
+postgres.pool_max_size = %d
+mongo.options.w = majority
+
+[formatter_generic]
+format = %%(asctime)s %%(message)s
+"""
+
+
+class TestSettings(unittest.TestCase):
+    """Test td.config.Settings"""
+
+    def setUp(self):
+        self.settings = Settings({"size": "20", "debug": "Yes",
+                                  "timeout": "2m"},
+                                 defaults={"size": "10", "other": "1"})
+
+    def test_typed_accessors(self):
+        """Test conversion of values and defaults of absent keys."""
+        self.assertEqual(self.settings.get_int("size"), 20)
+        self.assertEqual(self.settings.get_int("other"), 1)
+        self.assertIs(self.settings.get_bool("debug"), True)
+        self.assertEqual(self.settings.get_duration("timeout"), 120.0)
+        self.assertEqual(self.settings.get_int("absent", 5), 5)
+        self.assertRaises(ValueError, self.settings.get_bool, "timeout")
+
+    def test_immutable(self):
+        """Test that settings can't be changed."""
+        with self.assertRaises(TypeError):
+            self.settings["size"] = "30"
+
+    def test_parse_duration(self):
+        """Test units of durations."""
+        self.assertEqual(parse_duration("250ms"), 0.25)
+        self.assertEqual(parse_duration("1.5"), 1.5)
+        self.assertEqual(parse_duration("1h"), 3600.0)
+        self.assertRaises(ValueError, parse_duration, "soon")
+
+
+class TestConfigScanner(unittest.TestCase):
+    """Test td.config.ConfigScanner"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "test.ini")
+        self.write_config(10)
+        self.scanner = ConfigScanner(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_config(self, pool_max_size):
+        """Write config file and move it's mtime forward."""
+        with open(self.path, "w") as config_file:
+            config_file.write(CONFIG % pool_max_size)
+        mtime = os.path.getmtime(self.path) + pool_max_size
+        os.utime(self.path, (mtime, mtime))
+
+    def test_parse_section(self):
+        """Test that keys are split on the first dot and the section is
+        parsed once.
+        """
+        databases = self.scanner.parse_section("databases")
+        self.assertEqual(databases["postgres"].get_int("pool_max_size"), 10)
+        self.assertEqual(databases["mongo"]["options.w"], "majority")
+        self.assertIs(self.scanner.parse_section("databases"), databases)
+        app = self.scanner.get_section("app:main")
+        self.assertEqual(app.get_duration("password_master.queue_timeout"),
+                         0.25)
+
+    def test_reload_if_changed(self):
+        """Test that listeners get reloaded config only after the file is
+        modified.
+        """
+        reloaded = []
+        self.scanner.add_listener(
+            lambda scanner: reloaded.append(scanner.get_subsection_in_section(
+                "postgres", "databases").get_int("pool_max_size")))
+        self.assertFalse(self.scanner.reload_if_changed())
+        self.write_config(20)
+        self.assertTrue(self.scanner.reload_if_changed())
+        self.assertEqual(reloaded, [20])
+
+    def test_broken_config_is_not_applied(self):
+        """Test that config with errors doesn't replace the working one."""
+        with open(self.path, "a") as config_file:
+            config_file.write("broken line without section\n[")
+        os.utime(self.path, (1, 1))
+        self.assertFalse(self.scanner.reload_if_changed())
+        self.assertEqual(self.scanner.get_section("app:main")["debug"], "yes")
@@ -0,0 +1,64 @@
+"""
+.. module:: test_evented
+   :platform: Unix
+   :synopsis: Unittests for td.servers.evented
+
+.. moduleauthor:: Mykola Radionov <moodaq@gmail.com>
+
+
+"""
+
+import thread
+import unittest
+
+from td.instrumentation import QueryTracker
+from td.servers import evented
+
+try:
+    import gevent
+except ImportError:
+    gevent = None
+
+
+class Blocking(object):
+    """Object with blocking method which reports it's thread."""
+    limit = 10
+
+    def get_thread(self, offset, step=1):
+        return thread.get_ident(), offset + step
+
+
+@unittest.skipIf(gevent is None, "gevent is not installed")
+class TestBlockingBridge(unittest.TestCase):
+    """Test td.servers.evented.BlockingBridge"""
+
+    def setUp(self):
+        self.executor = evented.make_executor(2)
+        self.bridge = evented.BlockingBridge(Blocking(), self.executor)
+
+    def tearDown(self):
+        self.executor.kill()
+
+    def test_call_in_executor(self):
+        """Test that method runs in the other thread with all arguments and
+        plain attributes are returned as is.
+        """
+        ident, result = self.bridge.get_thread(1, step=2)
+        self.assertNotEqual(ident, thread.get_ident())
+        self.assertEqual(result, 3)
+        self.assertEqual(self.bridge.limit, 10)
+
+    def test_context_is_propagated(self):
+        """Test that value of the context is current in the executor thread
+        during the call and is restored after it.
+        """
+        tracker = QueryTracker()
+        bridge = evented.BlockingBridge(tracker, self.executor,
+                                        context=tracker)
+        tracker.activate("request")
+        self.assertEqual(bridge.current(), "request")
+        self.assertIsNone(self.executor.apply(tracker.current))
+
+    def test_not_evented(self):
+        """Test that process without patched sockets isn't evented."""
+        self.assertFalse(evented.is_evented())
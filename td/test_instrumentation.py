@@ -0,0 +1,155 @@
+"""
+.. module:: test_instrumentation
+   :platform: Unix
+   :synopsis: Unittests for td.instrumentation
+
+.. moduleauthor:: Mykola Radionov <moodaq@gmail.com>
+
+
+"""
+
+import logging
+import unittest
+
+import mongomock
+from pyramid.config import Configurator
+from pyramid.response import Response
+from webtest import TestApp
+
+from td.instrumentation import (InstrumentedDatabase,
+                                QueryEvent,
+                                QueryTracker,
+                                RequestQueries,
+                                redact)
+
+
+class RecordingHandler(logging.Handler):
+    """Logging handler which keeps formatted messages."""
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class InstrumentationTestCase(unittest.TestCase):
+    """Base for tests which check messages of td.instrumentation logger."""
+
+    def setUp(self):
+        self.handler = RecordingHandler()
+        self.logger = logging.getLogger("td.instrumentation")
+        self.logger.addHandler(self.handler)
+        self.level = self.logger.level
+        self.logger.setLevel(logging.WARNING)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+        self.logger.setLevel(self.level)
+
+
+class TestQueryTracker(InstrumentationTestCase):
+    """Test td.instrumentation.QueryTracker"""
+
+    def test_redact(self):
+        """Test that values are replaced keeping structure of params."""
+        self.assertEqual(redact({"owner_id": 1, "_id": {"$lt": "id"},
+                                 "category": {"$in": ["red", None]}}),
+                         {"owner_id": "?", "_id": {"$lt": "?"},
+                          "category": {"$in": ["?", None]}})
+        self.assertEqual(redact(("secret", 5)), ("?", "?"))
+
+    def test_slow_query_is_logged_redacted(self):
+        """Test that only queries over the threshold are logged without
+        values of their params.
+        """
+        tracker = QueryTracker(slow_threshold=0.5)
+        tracker(QueryEvent("sql", "SELECT 1", ("fast",), 0.1, 0))
+        tracker(QueryEvent("sql", "SELECT 2", ("secret",), 0.6, 0.2))
+        self.assertEqual(len(self.handler.messages), 1)
+        self.assertIn("SELECT 2", self.handler.messages[0])
+        self.assertIn("600.0 ms (200.0 ms waiting", self.handler.messages[0])
+        self.assertNotIn("secret", self.handler.messages[0])
+
+    def test_queries_of_current_request(self):
+        """Test that queries are counted only while request is active."""
+        tracker = QueryTracker()
+        queries = RequestQueries()
+        tracker(QueryEvent("sql", "SELECT 1", (), 0.01, 0))
+        self.assertIsNone(tracker.activate(queries))
+        tracker(QueryEvent("sql", "SELECT 1", (1,), 0.01, 0))
+        tracker(QueryEvent("sql", "SELECT 1", (1,), 0.02, 0))
+        tracker(QueryEvent("sql", "SELECT 1", (2,), 0.03, 0))
+        self.assertIs(tracker.activate(None), queries)
+        self.assertEqual(queries.count, 3)
+        self.assertAlmostEqual(queries.duration, 0.06)
+        self.assertEqual(queries.repeated(), [("sql", "SELECT 1", 2)])
+
+
+class TestQueryTrackerTween(InstrumentationTestCase):
+    """Test td.instrumentation.query_tracker_tween_factory"""
+
+    def test_repeated_queries_are_logged(self):
+        """Test that request with identical queries is logged."""
+        tracker = QueryTracker()
+        requests = []
+
+        def view(request):
+            requests.append(request)
+            for _ in range(3):
+                tracker(QueryEvent("sql", "SELECT id", ("user",), 0.01, 0))
+            return Response("ok")
+
+        config = Configurator(settings={"query_tracker": tracker})
+        config.add_tween("td.instrumentation.query_tracker_tween_factory")
+        config.add_route("home", "/")
+        config.add_view(view, route_name="home")
+        TestApp(config.make_wsgi_app()).get("/")
+        self.assertEqual(requests[0].queries.count, 3)
+        self.assertIsNone(tracker.current())
+        self.assertEqual(self.handler.messages, [
+            "Request / issued identical sql query 3 times: SELECT id"])
+
+
+class TestInstrumentedDatabase(unittest.TestCase):
+    """Test td.instrumentation.InstrumentedDatabase"""
+
+    def setUp(self):
+        self.events = []
+        self.mongo_db = InstrumentedDatabase(mongomock.MongoClient().TDDB,
+                                             self.events.append)
+
+    def test_calls_are_reported(self):
+        """Test that collection methods are reported with their filter."""
+        self.mongo_db.Items.insert_one({"owner_id": 1})
+        self.mongo_db["Items"].find_one({"owner_id": 1})
+        self.assertEqual([(event.kind, event.statement)
+                          for event in self.events],
+                         [("mongo", "Items.insert_one"),
+                          ("mongo", "Items.find_one")])
+        self.assertEqual(self.events[1].params, {"owner_id": 1})
+
+    def test_cursor_is_reported_when_exhausted(self):
+        """Test that find is reported once after all documents are
+        fetched and chained cursor methods keep the proxy.
+        """
+        self.mongo_db.Items.insert_many([{"n": 1}, {"n": 2}, {"n": 3}])
+        del self.events[:]
+        cursor = self.mongo_db.Items.find({}).sort("n", -1).limit(2)
+        self.assertEqual(next(cursor)["n"], 3)
+        self.assertEqual(self.events, [])
+        self.assertEqual([document["n"] for document in cursor], [2])
+        self.assertEqual(len(self.events), 1)
+        self.assertEqual(self.events[0].statement, "Items.find")
+
+    def test_closed_cursor_is_reported(self):
+        """Test that partly consumed cursor is reported once it's closed."""
+        self.mongo_db.Items.insert_many([{"n": 1}, {"n": 2}])
+        del self.events[:]
+        cursor = self.mongo_db.Items.find({})
+        next(cursor)
+        cursor.close()
+        cursor.close()
+        self.assertEqual([event.statement for event in self.events],
+                         ["Items.find"])
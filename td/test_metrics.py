@@ -0,0 +1,124 @@
+"""
+.. module:: test_metrics
+   :platform: Unix
+   :synopsis: Unittests for td.metrics
+
+.. moduleauthor:: Mykola Radionov <moodaq@gmail.com>
+
+
+"""
+
+import threading
+import unittest
+
+from pyramid import testing
+from pyramid.config import Configurator
+from pyramid.httpexceptions import HTTPNotFound
+from pyramid.response import Response
+from webtest import TestApp
+
+from td.config import Settings
+from td.metrics import MetricsRegistry
+from td.views import get_metrics
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    """Test td.metrics.MetricsRegistry"""
+
+    def setUp(self):
+        self.metrics = MetricsRegistry(buckets=(0.1, 1.0))
+
+    def test_histogram_is_cumulative(self):
+        """Test that bucket counts include the smaller buckets."""
+        for duration in (0.05, 0.1, 0.5, 2):
+            self.metrics.observe("home", 200, duration)
+        requests, latencies, in_flight = self.metrics.collect()
+        self.assertEqual(requests, {("home", 200): 4})
+        self.assertEqual(latencies["home"][:-1], [2, 3, 4])
+        self.assertAlmostEqual(latencies["home"][-1], 2.65)
+        self.assertEqual(in_flight, 0)
+
+    def test_shards_of_threads_are_summed(self):
+        """Test that requests observed by other threads are collected."""
+        threads = [threading.Thread(target=self.metrics.observe,
+                                    args=("home", 200, 0.01))
+                   for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(self.metrics._shards), 3)
+        self.assertEqual(self.metrics.collect()[0], {("home", 200): 3})
+
+    def test_render(self):
+        """Test Prometheus text format of counters, histogram and gauges."""
+        self.metrics.observe("home", 404, 0.5)
+        self.metrics.add_gauge("queue_depth", "Waiting requests.", lambda: 7)
+        text = self.metrics.render()
+        self.assertIn('td_requests_total{route="home",status="404"} 1\n',
+                      text)
+        self.assertIn('td_request_duration_seconds_bucket{route="home",'
+                      'le="0.1"} 0\n', text)
+        self.assertIn('td_request_duration_seconds_bucket{route="home",'
+                      'le="+Inf"} 1\n', text)
+        self.assertIn('td_request_duration_seconds_count{route="home"} 1\n',
+                      text)
+        self.assertIn("# TYPE td_queue_depth gauge\ntd_queue_depth 7\n", text)
+
+
+class TestMetricsTween(unittest.TestCase):
+    """Test td.metrics.metrics_tween_factory"""
+
+    def setUp(self):
+        self.metrics = MetricsRegistry()
+        config = Configurator(settings={"metrics": self.metrics})
+        config.add_tween("td.metrics.metrics_tween_factory")
+        config.add_route("home", "/")
+        config.add_route("fail", "/fail")
+        config.add_view(lambda request: Response("ok"), route_name="home")
+        config.add_view(self.fail, route_name="fail")
+        self.app = TestApp(config.make_wsgi_app())
+
+    def fail(self, request):
+        self.assertEqual(self.metrics.collect()[2], 1)
+        raise ValueError("fail")
+
+    def test_requests_are_counted_by_route(self):
+        """Test that matched routes, unknown urls and errors are counted."""
+        self.app.get("/")
+        self.app.get("/")
+        self.app.get("/unknown", status=404)
+        with self.assertRaises(ValueError):
+            self.app.get("/fail")
+        requests, latencies, in_flight = self.metrics.collect()
+        self.assertEqual(requests, {("home", 200): 2,
+                                    ("not_found", 404): 1,
+                                    ("fail", 500): 1})
+        self.assertEqual(latencies["home"][-2], 2)
+        self.assertEqual(in_flight, 0)
+
+
+class TestMetricsView(unittest.TestCase):
+    """Test td.views.get_metrics"""
+
+    def setUp(self):
+        self.metrics = MetricsRegistry()
+        self.metrics.observe("home", 200, 0.01)
+        self.config = testing.setUp(settings={
+            "metrics": self.metrics,
+            "app_settings": Settings({"metrics.allowed_ips": "10.0.0.1"})})
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def test_allowed_ip(self):
+        """Test that metrics are shown to allowed ip."""
+        request = testing.DummyRequest(client_addr="10.0.0.1")
+        response = get_metrics(request)
+        self.assertEqual(response.content_type, "text/plain")
+        self.assertIn('route="home"', response.text)
+
+    def test_not_allowed_ip(self):
+        """Test that the other clients get 404."""
+        request = testing.DummyRequest(client_addr="127.0.0.1")
+        self.assertIsInstance(get_metrics(request), HTTPNotFound)
@@ -0,0 +1,50 @@
+"""
+.. module:: test_migrations
+   :platform: Unix
+   :synopsis: Unittests for td.migrations
+
+.. moduleauthor:: Mykola Radionov <moodaq@gmail.com>
+
+
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import mongomock
+
+from td.assessors.assessors import Connector
+from td.assessors.mongo_connector import MongoConnector
+from td.migrations import USER_COLUMNS, copy_users
+
+
+class TestCopyUsers(unittest.TestCase):
+    """Test td.migrations.copy_users"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.sql = Connector("sqlite", {
+            "db_name": os.path.join(self.directory, "td.sqlite")})
+        self.mongo = MongoConnector(mongomock.MongoClient().TDDB)
+
+    def tearDown(self):
+        self.sql.pool.close()
+        shutil.rmtree(self.directory)
+
+    def test_copy_to_mongo_and_back(self):
+        """Test that users keep their ids and existing ones are skipped."""
+        for user_id, username in ((3, "first"), (5, "second")):
+            self.sql.insert("Users", USER_COLUMNS,
+                            (user_id, None, username, "hash", "group:users"))
+        self.assertEqual(copy_users(self.sql, self.mongo), (2, 0))
+        self.assertEqual(copy_users(self.sql, self.mongo), (0, 2))
+        self.assertEqual(self.mongo.select_all(USER_COLUMNS, "Users"),
+                         self.sql.select_all(USER_COLUMNS, "Users"))
+
+        self.mongo.insert("Users", "username, password, groups",
+                          ("third", "hash", "group:users"))
+        self.assertEqual(copy_users(self.mongo, self.sql), (1, 2))
+        self.assertEqual(self.sql.select_one("id", "Users",
+                                             {"username": "third"}), (6,))
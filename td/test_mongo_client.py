@@ -0,0 +1,89 @@
+"""
+.. module:: test_mongo_client
+   :platform: Unix
+   :synopsis: Unittests for td.mongo_client
+
+.. moduleauthor:: Mykola Radionov <moodaq@gmail.com>
+
+
+"""
+
+import os
+import unittest
+
+import mock
+import mongomock
+from pymongo import read_preferences
+
+from td.config import Settings
+from td.mongo_client import (LazyDatabase,
+                             get_client_options,
+                             make_client,
+                             make_read_preference)
+
+
+class TestClientOptions(unittest.TestCase):
+    """Test td.mongo_client.get_client_options and make_client"""
+
+    def test_options(self):
+        """Test that settings are converted to options of the driver and
+        timeouts are on by default.
+        """
+        creds = Settings({"max_pool_size": "50",
+                          "wait_queue_timeout": "250ms",
+                          "socket_timeout": "0",
+                          "replica_set": "rs0",
+                          "w": "majority",
+                          "journal": "true"})
+        self.assertEqual(get_client_options(creds),
+                         {"maxPoolSize": 50,
+                          "waitQueueTimeoutMS": 250,
+                          "connectTimeoutMS": 5000,
+                          "replicaSet": "rs0",
+                          "w": "majority",
+                          "j": True})
+        self.assertEqual(get_client_options(Settings({"w": "2"}))["w"], 2)
+
+    def test_uri_takes_precedence(self):
+        """Test that client is made of uri if it's given."""
+        uri = "mongodb://db1,db2/?replicaSet=rs0"
+        with mock.patch("td.mongo_client.pymongo.MongoClient") as client:
+            make_client(Settings({"uri": uri, "host": "localhost",
+                                  "port": "27017", "connect_timeout": "0",
+                                  "socket_timeout": "0"}))
+        client.assert_called_once_with(uri)
+
+
+class TestLazyDatabase(unittest.TestCase):
+    """Test td.mongo_client.LazyDatabase"""
+
+    def test_client_per_process(self):
+        """Test that client is made on the first use in each process and
+        collections taken before fork use the client of the caller.
+        """
+        creds = Settings({"host": "localhost", "port": "27017",
+                          "db_name": "TDDB"})
+        with mock.patch("td.mongo_client.pymongo.MongoClient",
+                        side_effect=lambda *args, **kwargs:
+                        mongomock.MongoClient()) as client:
+            mongo_db = LazyDatabase(creds)
+            items = mongo_db.Items
+            self.assertEqual(client.call_count, 0)
+            items.insert_one({"n": 1})
+            self.assertEqual(mongo_db["Items"].count_documents({}), 1)
+            with mock.patch("td.mongo_client.os.getpid",
+                            return_value=os.getpid() + 1):
+                self.assertEqual(items.count_documents({}), 0)
+        self.assertEqual(client.call_count, 2)
+
+
+class TestReadPreference(unittest.TestCase):
+    """Test td.mongo_client.make_read_preference"""
+
+    def test_modes(self):
+        """Test that modes are chosen by their names in URI."""
+        self.assertIsInstance(make_read_preference("secondaryPreferred", 120),
+                              read_preferences.SecondaryPreferred)
+        self.assertIsInstance(make_read_preference("primary", 120),
+                              read_preferences.Primary)
+        self.assertRaises(ValueError, make_read_preference, "secondaries")
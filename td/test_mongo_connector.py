@@ -0,0 +1,62 @@
+"""
+.. module:: test_mongo_connector
+   :platform: Unix
+   :synopsis: Unittests for td.assessors.mongo_connector
+
+.. moduleauthor:: Mykola Radionov <moodaq@gmail.com>
+
+
+"""
+
+import unittest
+
+import mongomock
+from pymongo.errors import DuplicateKeyError
+
+from td.assessors.mongo_connector import MongoConnector
+from td.exceptions import WrongQueryException
+
+
+class TestMongoConnector(unittest.TestCase):
+    """Test td.assessors.mongo_connector.MongoConnector"""
+
+    def setUp(self):
+        self.mongo_db = mongomock.MongoClient().TDDB
+        self.connector = MongoConnector(self.mongo_db)
+        self.connector.create_indexes()
+
+    def test_insert_and_select(self):
+        """Test that inserted rows get increasing ids and are selected as
+        tuples in order of columns.
+        """
+        self.connector.insert("Users", "username, password, groups",
+                              ("first", "hash", "group:users"))
+        self.connector.insert("Users", "username, password, groups",
+                              ("second", "hash", "group:users"))
+        self.assertEqual(self.connector.select_one(
+            "groups, id", "Users", {"username": "second"}),
+            ("group:users", 2))
+        self.assertIsNone(self.connector.select_one(
+            "id", "Users", {"username": "third"}))
+        self.assertEqual(self.connector.select_all("id, username", "Users"),
+                         ((1, "first"), (2, "second")))
+
+    def test_insert_with_id(self):
+        """Test that given id is kept and the next ids follow it."""
+        self.connector.insert("Users", "id, username", (7, "migrated"))
+        self.connector.insert("Users", "username", ("new",))
+        self.assertEqual(self.connector.select_one(
+            "id", "Users", {"username": "new"}), (8,))
+        self.assertEqual(self.connector.select_one(
+            "username", "Users", {"id": 7}), ("migrated",))
+
+    def test_unique_username(self):
+        """Test that username can't be taken twice."""
+        self.connector.insert("Users", "username", ("user",))
+        self.assertRaises(DuplicateKeyError, self.connector.insert,
+                          "Users", "username", ("user",))
+
+    def test_wrong_identifier(self):
+        """Test that names of fields are checked like in Connector."""
+        self.assertRaises(WrongQueryException, self.connector.select_one,
+                          "id", "Users", {"$where": "1"})
@@ -0,0 +1,84 @@
+"""
+.. module:: test_password_master
+   :platform: Unix
+   :synopsis: Unittests for td.password_master
+
+.. moduleauthor:: Mykola Radionov <moodaq@gmail.com>
+
+
+"""
+
+import os
+import time
+import unittest
+
+import bcrypt
+
+from td.exceptions import PasswordMasterBusyException
+from td.password_master import PasswordMaster
+
+
+# cheap hash of '1234' to keep tests fast
+HASHED_PASSWORD = bcrypt.hashpw(b"1234", bcrypt.gensalt(4))
+
+
+class TestInlinePasswordMaster(unittest.TestCase):
+    """Test td.password_master.PasswordMaster without pool of processes."""
+
+    def setUp(self):
+        self.password_master = PasswordMaster()
+
+    def test_check_password(self):
+        """Test comparison of right and wrong passwords with the hash."""
+        self.assertTrue(self.password_master.check_password("1234",
+                                                            HASHED_PASSWORD))
+        self.assertFalse(self.password_master.check_password("4321",
+                                                             HASHED_PASSWORD))
+
+
+class TestPooledPasswordMaster(unittest.TestCase):
+    """Test td.password_master.PasswordMaster with pool of processes."""
+
+    def setUp(self):
+        self.password_master = PasswordMaster(workers=1,
+                                              max_pending=1,
+                                              queue_timeout=0.01)
+
+    def tearDown(self):
+        self.password_master.close()
+
+    def test_check_password(self):
+        """Test comparison of right and wrong passwords in the pool."""
+        self.assertTrue(self.password_master.check_password("1234",
+                                                            HASHED_PASSWORD))
+        self.assertFalse(self.password_master.check_password("4321",
+                                                             HASHED_PASSWORD))
+
+    def test_busy(self):
+        """Test that call which doesn't get the turn in time raises
+        PasswordMasterBusyException.
+        """
+        self.password_master._acquire_slot()
+        self.assertRaises(PasswordMasterBusyException,
+                          self.password_master.check_password,
+                          "1234", HASHED_PASSWORD)
+        self.password_master._release_slot()
+        self.assertTrue(self.password_master.check_password("1234",
+                                                            HASHED_PASSWORD))
+
+    def test_start(self):
+        """Test that start makes the pool which is used by the calls."""
+        self.password_master.start()
+        pool = self.password_master._pool
+        self.assertEqual(self.password_master._pool_pid, os.getpid())
+        self.password_master.check_password("1234", HASHED_PASSWORD)
+        self.assertIs(self.password_master._pool, pool)
+
+    def test_result_timeout(self):
+        """Test that call which isn't done in RESULT_TIMEOUT raises
+        PasswordMasterBusyException and frees it's turn.
+        """
+        self.password_master.RESULT_TIMEOUT = 0.05
+        self.assertRaises(PasswordMasterBusyException,
+                          self.password_master._call, time.sleep, 1)
+        self.assertEqual(self.password_master._pending, 0)
@@ -0,0 +1,148 @@
+"""
+.. module:: test_pool
+   :platform: Unix
+   :synopsis: Unittests for td.assessors.pool
+
+.. moduleauthor:: Mykola Radionov <moodaq@gmail.com>
+
+
+"""
+
+import os
+import threading
+import unittest
+
+import mock
+
+from td.assessors.pool import ConnectionPool
+from td.exceptions import PoolExhaustedException
+
+
+class FakeConnection(object):
+    """Driver connection stand-in which remembers if it was closed."""
+
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class TestConnectionPool(unittest.TestCase):
+    """Test td.assessors.pool.ConnectionPool"""
+
+    def setUp(self):
+        """Create pool with fake connections for each test."""
+        self.opened = []
+        self.pool = ConnectionPool(connect=self.connect,
+                                   ping=lambda db: not db.closed,
+                                   min_size=1,
+                                   max_size=2,
+                                   timeout=0.05,
+                                   ping_interval=0)
+
+    def connect(self):
+        """Open fake connection and remember it."""
+        conn = FakeConnection()
+        self.opened.append(conn)
+        return conn
+
+    def test_connection_reuse(self):
+        """Test that released connection is handed out again instead of
+        opening new one.
+        """
+        first = self.pool.acquire()
+        self.pool.release(first)
+        second = self.pool.acquire()
+        self.assertIs(first, second)
+        self.assertEqual(len(self.opened), 1)
+
+    def test_exhaustion(self):
+        """Test that checkout over max_size waits and then raises
+        PoolExhaustedException.
+        """
+        self.pool.acquire()
+        self.pool.acquire()
+        self.assertRaises(PoolExhaustedException, self.pool.acquire)
+        stats = self.pool.stats()
+        self.assertEqual(stats["waits"], 1)
+        self.assertEqual(stats["timeouts"], 1)
+        self.assertEqual(stats["in_use"], 2)
+
+    def test_waiter_gets_released_connection(self):
+        """Test that waiting checkout is woken up by release."""
+        self.pool.timeout = 5
+        first = self.pool.acquire()
+        self.pool.acquire()
+        timer = threading.Timer(0.01, self.pool.release, args=(first,))
+        timer.start()
+        self.assertIs(self.pool.acquire(), first)
+        timer.join()
+
+    def test_failed_ping_replaces_connection(self):
+        """Test that broken connection is closed and replaced on checkout."""
+        first = self.pool.acquire()
+        self.pool.release(first)
+        first.db.closed = True
+        second = self.pool.acquire()
+        self.assertIsNot(first, second)
+        self.assertEqual(self.pool.stats()["failed_pings"], 1)
+        self.assertEqual(self.pool.stats()["size"], 1)
+
+    def test_idle_reaping(self):
+        """Test that idle connections over min_size are closed after
+        idle_timeout.
+        """
+        self.pool.idle_timeout = -1
+        first = self.pool.acquire()
+        second = self.pool.acquire()
+        self.pool.release(first)
+        self.pool.release(second)
+        self.assertEqual(self.pool.stats()["size"], 1)
+        self.assertTrue(first.db.closed)
+        self.assertFalse(second.db.closed)
+
+    def test_discard(self):
+        """Test that discarded connection is closed and frees it's place."""
+        conn = self.pool.acquire()
+        self.pool.release(conn, discard=True)
+        self.assertTrue(conn.db.closed)
+        self.assertEqual(self.pool.stats()["size"], 0)
+
+    def test_configure(self):
+        """Test that raised max_size lets in more connections and lowered
+        one closes extra connections on release.
+        """
+        first, second = self.pool.acquire(), self.pool.acquire()
+        self.pool.configure(max_size=3)
+        third = self.pool.acquire()
+        self.pool.configure(max_size=1)
+        for conn in (first, second, third):
+            self.pool.release(conn)
+        self.assertEqual(self.pool.stats()["size"], 1)
+        self.assertEqual([conn.closed for conn in self.opened],
+                         [True, True, False])
+        self.assertRaises(ValueError, self.pool.configure, min_size=2)
+
+    def test_warm_up(self):
+        """Test that warm-up opens min_size connections and keeps them
+        idle.
+        """
+        self.pool.configure(min_size=2)
+        self.pool.warm_up()
+        self.assertEqual(len(self.opened), 2)
+        self.assertEqual(self.pool.stats()["idle"], 2)
+
+    def test_fork(self):
+        """Test that pool in the forked process opens it's own connections
+        and leaves the ones of the parent open.
+        """
+        inherited = self.pool.acquire()
+        self.pool.release(inherited)
+        with mock.patch("td.assessors.pool.os.getpid",
+                        return_value=os.getpid() + 1):
+            conn = self.pool.acquire()
+            self.pool.close()
+        self.assertIsNot(conn, inherited)
+        self.assertFalse(inherited.db.closed)
+        self.assertEqual(len(self.opened), 2)
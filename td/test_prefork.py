@@ -0,0 +1,79 @@
+"""
+.. module:: test_prefork
+   :platform: Unix
+   :synopsis: Unittests for td.servers.prefork
+
+.. moduleauthor:: Mykola Radionov <moodaq@gmail.com>
+
+
+"""
+
+import os
+import signal
+import time
+import unittest
+import urllib2
+
+from td.servers import prefork
+
+
+def pid_app(environ, start_response):
+    """WSGI app which answers with pid of the worker."""
+    start_response("200 OK", [("Content-Type", "text/plain")])
+    return [str(os.getpid())]
+
+
+class TestSupervisor(unittest.TestCase):
+    """Test td.servers.prefork.Supervisor"""
+
+    def setUp(self):
+        self.sock = prefork.bind_socket("127.0.0.1", 0)
+        self.url = "http://127.0.0.1:%d/" % self.sock.getsockname()[1]
+        self.supervisor_pid = os.fork()
+        if not self.supervisor_pid:
+            code = 1
+            try:
+                code = prefork.Supervisor(lambda: pid_app, self.sock,
+                                          workers=1,
+                                          server_settings={"threads": "2"},
+                                          max_requests=2,
+                                          graceful_timeout=2).run()
+            finally:
+                os._exit(code)
+        self.sock.close()
+
+    def tearDown(self):
+        if self.supervisor_pid is not None:
+            os.kill(self.supervisor_pid, signal.SIGTERM)
+            os.waitpid(self.supervisor_pid, 0)
+
+    def get_pid(self):
+        """Get pid of the worker which served the request."""
+        deadline = time.time() + 5
+        while True:
+            try:
+                return int(urllib2.urlopen(self.url, timeout=5).read())
+            except (urllib2.URLError, IOError):
+                if time.time() > deadline:
+                    raise
+                time.sleep(0.05)
+
+    def test_recycling(self):
+        """Test that worker finishes it's last request and is replaced after
+        max_requests, and killed worker is replaced too.
+        """
+        first = self.get_pid()
+        self.assertEqual(self.get_pid(), first)
+        second = self.get_pid()
+        self.assertNotEqual(second, first)
+        os.kill(second, signal.SIGKILL)
+        self.assertNotIn(self.get_pid(), (first, second))
+
+    def test_graceful_stop(self):
+        """Test that supervisor stops it's workers and exits on SIGTERM."""
+        worker = self.get_pid()
+        os.kill(self.supervisor_pid, signal.SIGTERM)
+        _, status = os.waitpid(self.supervisor_pid, 0)
+        self.supervisor_pid = None
+        self.assertEqual(os.WEXITSTATUS(status), 0)
+        self.assertRaises(OSError, os.kill, worker, 0)
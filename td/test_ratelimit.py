@@ -0,0 +1,100 @@
+"""
+.. module:: test_ratelimit
+   :platform: Unix
+   :synopsis: Unittests for td.ratelimit
+
+.. moduleauthor:: Mykola Radionov <moodaq@gmail.com>
+
+
+"""
+
+import unittest
+
+import mongomock
+
+from td.metrics import MetricsRegistry
+from td.ratelimit import (LoginLimiter,
+                          MemoryBucketStore,
+                          MongoBucketStore,
+                          TokenBucketLimiter)
+
+
+class TestMemoryBucketStore(unittest.TestCase):
+    """Test td.ratelimit.MemoryBucketStore"""
+
+    def setUp(self):
+        self.store = MemoryBucketStore()
+
+    def test_burst_and_refill(self):
+        """Test that burst of tokens is taken at once and then one token is
+        refilled after 1 / rate seconds.
+        """
+        results = [self.store.consume("key", 0.5, 2, 100) for _ in range(3)]
+        self.assertEqual(results, [True, True, False])
+        self.assertFalse(self.store.consume("key", 0.5, 2, 101))
+        self.assertTrue(self.store.consume("key", 0.5, 2, 103))
+
+    def test_keys_are_separate(self):
+        """Test that empty bucket of one key doesn't affect the other."""
+        self.assertTrue(self.store.consume("one", 1, 1, 100))
+        self.assertFalse(self.store.consume("one", 1, 1, 100))
+        self.assertTrue(self.store.consume("two", 1, 1, 100))
+
+    def test_full_buckets_are_dropped(self):
+        """Test that full buckets are dropped over max_keys."""
+        self.store.max_keys = 1
+        self.store.consume("one", 1, 1, 100)
+        self.store.consume("two", 1, 1, 200)
+        self.assertEqual(list(self.store._buckets), ["two"])
+
+
+class TestMongoBucketStore(TestMemoryBucketStore):
+    """Test td.ratelimit.MongoBucketStore"""
+
+    def setUp(self):
+        self.store = MongoBucketStore(mongomock.MongoClient().TDDB.Buckets)
+        self.store.create_indexes()
+
+    def test_full_buckets_are_dropped(self):
+        """Buckets in Mongo are removed by TTL index instead."""
+
+
+class TestLoginLimiter(unittest.TestCase):
+    """Test td.ratelimit.LoginLimiter"""
+
+    def setUp(self):
+        self.limiter = LoginLimiter(user_limiter=TokenBucketLimiter(0.001, 2),
+                                    ip_limiter=TokenBucketLimiter(0.001, 3))
+
+    def test_user_limit(self):
+        """Test that attempts for the same username are limited from any
+        ip.
+        """
+        self.assertTrue(self.limiter.allow("user", "10.0.0.1"))
+        self.assertTrue(self.limiter.allow("user", "10.0.0.2"))
+        self.assertFalse(self.limiter.allow("user", "10.0.0.3"))
+        self.assertEqual(self.limiter.stats()["user"],
+                         {"allowed": 2, "shed": 1})
+
+    def test_ip_limit(self):
+        """Test that attempts from the same ip are limited for any username
+        and shed attempts don't take tokens of usernames.
+        """
+        for username in ("one", "two", "three", "four"):
+            self.limiter.allow(username, "10.0.0.1")
+        self.assertEqual(self.limiter.stats()["ip"],
+                         {"allowed": 3, "shed": 1})
+        self.assertTrue(self.limiter.allow("four", "10.0.0.2"))
+
+    def test_counters_in_metrics(self):
+        """Test that allowed and rejected attempts are exported by scope."""
+        metrics = MetricsRegistry()
+        self.limiter.add_counters(metrics)
+        for _ in range(3):
+            self.limiter.allow("user", "10.0.0.1")
+        text = metrics.render()
+        self.assertIn("# TYPE td_ratelimit_rejected_total counter", text)
+        self.assertIn('td_ratelimit_allowed_total{scope="ip"} 3', text)
+        self.assertIn('td_ratelimit_allowed_total{scope="user"} 2', text)
+        self.assertIn('td_ratelimit_rejected_total{scope="user"} 1', text)
+        self.assertIn('td_ratelimit_rejected_total{scope="ip"} 0', text)
@@ -0,0 +1,65 @@
+"""
+.. module:: test_renderers
+   :platform: Unix
+   :synopsis: Unittests for td.renderers
+
+.. moduleauthor:: Mykola Radionov <moodaq@gmail.com>
+
+
+"""
+
+import json
+import unittest
+
+from bson import ObjectId
+from pyramid import testing
+
+from td.renderers import (Deferred,
+                          FastJSONRenderer,
+                          StreamedArray,
+                          iter_encode)
+
+
+class TestFastJSONRenderer(unittest.TestCase):
+    """Test td.renderers.FastJSONRenderer"""
+
+    def setUp(self):
+        self.renderer = FastJSONRenderer(None)
+        self.request = testing.DummyRequest()
+
+    def test_object_id(self):
+        """Test that ObjectId is encoded as string."""
+        object_id = ObjectId()
+        result = self.renderer({"id": object_id}, {"request": self.request})
+        self.assertEqual(json.loads(result), {"id": str(object_id)})
+        self.assertEqual(self.request.response.content_type,
+                         "application/json")
+
+    def test_streamed_dict(self):
+        """Test that dict with StreamedArray is rendered into chunks and
+        Deferred value is computed after the array.
+        """
+        seen = []
+
+        def numbers():
+            for number in range(5):
+                seen.append(number)
+                yield {"n": number}
+
+        value = {"items": StreamedArray(numbers(), chunk_size=2),
+                 "count": Deferred(lambda: len(seen)),
+                 "version": 3}
+        chunks = list(self.renderer(value, {"request": self.request}))
+        self.assertGreater(len(chunks), 3)
+        self.assertEqual(json.loads("".join(chunks)),
+                         {"items": [{"n": number} for number in range(5)],
+                          "count": 5,
+                          "version": 3})
+
+    def test_empty_array(self):
+        """Test chunk sizes on the edges and empty_value of empty array."""
+        for count in (0, 2, 4):
+            chunks = StreamedArray(range(count), chunk_size=2).iter_chunks()
+            self.assertEqual(json.loads("".join(chunks)), range(count))
+        chunks = iter_encode(StreamedArray([], empty_value=None))
+        self.assertEqual("".join(chunks), "null")
@@ -0,0 +1,237 @@
+"""
+.. module:: test_resilience
+   :platform: Unix
+   :synopsis: Unittests for td.resilience
+
+.. moduleauthor:: Mykola Radionov <moodaq@gmail.com>
+
+
+"""
+
+import unittest
+
+import mongomock
+from pymongo.errors import AutoReconnect
+
+from td.exceptions import BackendUnavailableException, WrongQueryException
+from td.resilience import (MONGO_TRANSIENT_ERRORS,
+                           CircuitBreaker,
+                           Guard,
+                           GuardedConnector,
+                           GuardedDatabase)
+
+
+class FlakyCursor(object):
+    """Cursor stand-in which fails given count of fetches and then gives
+    out the documents from the start of the last rewind.
+    """
+
+    def __init__(self, failures, documents):
+        self.failures = failures
+        self.documents = documents
+        self.position = 0
+        self.rewinds = 0
+
+    def next(self):
+        if self.failures:
+            self.failures -= 1
+            self.position += 1
+            raise AutoReconnect("Connection is lost.")
+        if self.position >= len(self.documents):
+            raise StopIteration
+        self.position += 1
+        return self.documents[self.position - 1]
+
+    def rewind(self):
+        self.rewinds += 1
+        self.position = 0
+        return self
+
+    def sort(self, *args):
+        return self
+
+
+class FlakyDatabase(object):
+    """Database stand-in whose collections give out FlakyCursor."""
+
+    def __init__(self, failures, documents=()):
+        self.cursor = FlakyCursor(failures, list(documents))
+
+    @property
+    def Items(self):
+        return self
+
+    def find(self, *args, **kwargs):
+        return self.cursor
+
+
+class Clock(object):
+    """Clock which is moved by the test."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FlakyConnector(object):
+    """Connector stand-in which fails given count of calls."""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+
+    def select_one(self, column_names, table, where=None):
+        self.calls += 1
+        if self.failures:
+            self.failures -= 1
+            raise AutoReconnect("connection lost")
+        return (1,)
+
+    insert = select_one
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    """Test td.resilience.CircuitBreaker"""
+
+    def setUp(self):
+        self.clock = Clock()
+        self.breaker = CircuitBreaker("postgres", failure_ratio=0.5,
+                                      min_calls=4, window=10,
+                                      open_timeout=30, clock=self.clock)
+
+    def test_opens_on_failure_ratio(self):
+        """Test that breaker opens when half of the calls in the window
+        failed and rejects calls until open_timeout passes.
+        """
+        for success in (True, True, False):
+            self.breaker.before_call()
+            self.breaker.record(success)
+        self.assertEqual(self.breaker.state, "closed")
+        self.breaker.record(False)
+        self.assertEqual(self.breaker.state, "open")
+        self.assertRaises(BackendUnavailableException,
+                          self.breaker.before_call)
+
+    def test_old_calls_are_forgotten(self):
+        """Test that failures out of the window don't open the breaker."""
+        for _ in range(3):
+            self.breaker.record(False)
+        self.clock.now += 11
+        self.breaker.record(True)
+        self.breaker.record(False)
+        self.assertEqual(self.breaker.stats(),
+                         {"state": "closed", "calls": 2, "failures": 1})
+
+    def test_trial_call(self):
+        """Test that single trial call is let through after open_timeout and
+        it's result closes or opens the breaker again.
+        """
+        for _ in range(4):
+            self.breaker.record(False)
+        self.clock.now += 30
+        self.assertEqual(self.breaker.state, "half_open")
+        self.breaker.before_call()
+        self.assertRaises(BackendUnavailableException,
+                          self.breaker.before_call)
+        self.breaker.record(False)
+        self.assertEqual(self.breaker.state, "open")
+        self.clock.now += 30
+        self.breaker.before_call()
+        self.breaker.record(True)
+        self.assertEqual(self.breaker.state, "closed")
+        self.breaker.before_call()
+
+
+class TestGuard(unittest.TestCase):
+    """Test td.resilience.Guard"""
+
+    def setUp(self):
+        self.delays = []
+        self.guard = Guard("postgres", MONGO_TRANSIENT_ERRORS,
+                           sleep=self.delays.append, retries=2,
+                           retry_delay=0.05, min_calls=100)
+
+    def test_reads_are_retried(self):
+        """Test that read is retried with growing jittered delays."""
+        connector = FlakyConnector(failures=2)
+        guarded = GuardedConnector(connector, self.guard)
+        self.assertEqual(guarded.select_one("id", "Users"), (1,))
+        self.assertEqual(connector.calls, 3)
+        self.assertEqual(len(self.delays), 2)
+        self.assertTrue(0 <= self.delays[0] <= 0.05)
+        self.assertTrue(0 <= self.delays[1] <= 0.1)
+
+    def test_retries_are_bounded(self):
+        """Test that the last error is raised after retries and writes are
+        not retried at all.
+        """
+        connector = FlakyConnector(failures=5)
+        guarded = GuardedConnector(connector, self.guard)
+        self.assertRaises(AutoReconnect, guarded.select_one, "id", "Users")
+        self.assertEqual(connector.calls, 3)
+        self.assertRaises(AutoReconnect, guarded.insert, "Users", "id", (1,))
+        self.assertEqual(connector.calls, 4)
+
+    def test_wrong_query_is_not_failure(self):
+        """Test that errors of the query don't open the breaker."""
+
+        def select_one(*args):
+            raise WrongQueryException("Wrong table or column name.")
+
+        self.guard.configure(min_calls=1)
+        self.assertRaises(WrongQueryException, self.guard.call_idempotent,
+                          select_one)
+        self.assertEqual(self.guard.breaker.state, "closed")
+        self.assertEqual(self.delays, [])
+
+
+class TestGuardedDatabase(unittest.TestCase):
+    """Test td.resilience.GuardedDatabase"""
+
+    def test_open_breaker_rejects_calls(self):
+        """Test that collection methods and cursors go through the guard."""
+        guard = Guard("mongo", MONGO_TRANSIENT_ERRORS, min_calls=1)
+        mongo_db = GuardedDatabase(mongomock.MongoClient().TDDB, guard)
+        mongo_db.Items.insert_many([{"n": 1}, {"n": 2}])
+        self.assertEqual([document["n"] for document in
+                          mongo_db["Items"].find().sort("n", -1).limit(1)],
+                         [2])
+        for _ in range(2):
+            guard.breaker.record(False)
+        self.assertRaises(BackendUnavailableException,
+                          mongo_db.Items.find_one)
+        self.assertRaises(BackendUnavailableException, mongo_db.Items.find)
+
+    def test_cursor_records_single_outcome(self):
+        """Test that find which fails on fetch after all retries is counted
+        as failed calls of each attempt, and successful one as one call.
+        """
+        guard = Guard("mongo", MONGO_TRANSIENT_ERRORS, sleep=lambda _: None,
+                      retries=1, min_calls=100)
+        mongo_db = GuardedDatabase(FlakyDatabase(failures=5), guard)
+        cursor = mongo_db.Items.find({"owner_id": 1})
+        self.assertRaises(AutoReconnect, next, cursor)
+        self.assertRaises(AutoReconnect, next, cursor)
+        self.assertEqual(guard.breaker.stats(),
+                         {"state": "closed", "calls": 2, "failures": 2})
+        mongo_db = GuardedDatabase(mongomock.MongoClient().TDDB, guard)
+        mongo_db.Items.insert_many([{"n": 1}, {"n": 2}])
+        self.assertEqual(len(list(mongo_db.Items.find())), 2)
+        self.assertEqual(guard.breaker.stats()["calls"], 4)
+        self.assertEqual(guard.breaker.stats()["failures"], 2)
+
+    def test_first_fetch_is_retried(self):
+        """Test that page is read from the start after the first fetch
+        failed with transient error.
+        """
+        delays = []
+        guard = Guard("mongo", MONGO_TRANSIENT_ERRORS, sleep=delays.append,
+                      retries=2, min_calls=100)
+        database = FlakyDatabase(failures=1, documents=[{"n": 1}, {"n": 2}])
+        mongo_db = GuardedDatabase(database, guard)
+        self.assertEqual(list(mongo_db.Items.find().sort("n")),
+                         [{"n": 1}, {"n": 2}])
+        self.assertEqual(database.cursor.rewinds, 1)
+        self.assertEqual(len(delays), 1)
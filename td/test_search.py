@@ -0,0 +1,105 @@
+"""
+.. module:: test_search
+   :platform: Unix
+   :synopsis: Unittests for td.search
+
+.. moduleauthor:: Mykola Radionov <moodaq@gmail.com>
+
+
+"""
+
+import unittest
+
+import mongomock
+import pymongo
+
+from td import search
+
+
+class FakeCursor(object):
+    """Cursor stand-in which records sort, skip and limit."""
+
+    def __init__(self):
+        self.calls = []
+
+    def sort(self, key):
+        self.calls.append(("sort", key))
+        return self
+
+    def skip(self, count):
+        self.calls.append(("skip", count))
+        return self
+
+    def limit(self, count):
+        self.calls.append(("limit", count))
+        return self
+
+
+class FakeCollection(object):
+    """Collection stand-in which records the query, mongomock doesn't
+    support $text.
+    """
+
+    def find(self, query, projection):
+        self.query, self.projection = query, projection
+        self.cursor = FakeCursor()
+        return self.cursor
+
+
+class TestTokens(unittest.TestCase):
+    """Test td.search.make_tokens and td.search.get_search_terms"""
+
+    def test_prefixes(self):
+        """Test that each word gives it's prefixes once, in lowercase."""
+        self.assertEqual(search.make_tokens(u"Buy milk, MILK_bar"),
+                         [u"bu", u"buy", u"mi", u"mil", u"milk",
+                          u"ba", u"bar"])
+        self.assertEqual(search.make_tokens(5), [])
+
+    def test_limits(self):
+        """Test that prefixes are cut at MAX_PREFIX and count of tokens at
+        MAX_TOKENS.
+        """
+        tokens = search.make_tokens(u"a" * 50)
+        self.assertEqual(len(tokens), search.MAX_PREFIX - 1)
+        words = u" ".join(u"%sx" % (u"w%03d" % number * 5)
+                          for number in range(20))
+        self.assertEqual(len(search.make_tokens(words)), search.MAX_TOKENS)
+
+    def test_search_terms(self):
+        """Test that terms are unique words cut to the longest token."""
+        self.assertEqual(search.get_search_terms(u"Milk milk " + u"b" * 30),
+                         [u"milk", u"b" * search.MAX_PREFIX])
+        self.assertEqual(search.get_search_terms(u" - "), [])
+
+
+class TestSearch(unittest.TestCase):
+    """Test td.search.find_items and td.search.fill_tokens"""
+
+    def test_query(self):
+        """Test that items of the owner are ranked by text score."""
+        collection = FakeCollection()
+        search.find_items(collection, 1, [u"mil", u"bread"],
+                          categories=[u"red"], offset=20, limit=11)
+        self.assertEqual(collection.query,
+                         {"owner_id": 1,
+                          "$text": {"$search": u"mil bread"},
+                          "category": {"$in": [u"red"]}})
+        score = {"$meta": "textScore"}
+        self.assertEqual(collection.projection["score"], score)
+        self.assertEqual(collection.cursor.calls,
+                         [("sort", [("score", score),
+                                    ("_id", pymongo.DESCENDING)]),
+                          ("skip", 20), ("limit", 11)])
+
+    def test_fill_tokens(self):
+        """Test that only items without tokens are updated."""
+        collection = mongomock.MongoClient().TDDB.Items
+        collection.insert_many([{"item_value": u"item %d" % number}
+                                for number in range(5)])
+        collection.insert_one({"item_value": u"milk", "item_tokens": []})
+        self.assertEqual(search.fill_tokens(collection, batch_size=2), 5)
+        self.assertEqual(collection.find_one({"item_value": u"item 3"})
+                         ["item_tokens"], [u"it", u"ite", u"item"])
+        self.assertEqual(collection.find_one({"item_value": u"milk"})
+                         ["item_tokens"], [])
@@ -0,0 +1,99 @@
+"""
+.. module:: test_startup
+   :platform: Unix
+   :synopsis: Unittests for td.startup
+
+.. moduleauthor:: Mykola Radionov <moodaq@gmail.com>
+
+
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from td.startup import ImportProfiler, PhaseTimer
+
+# imports td and uses sqlite engine, prints loaded heavy modules
+LAZY_IMPORTS_SCRIPT = """
+import os, sys, tempfile
+import td
+from td.assessors.assessors import Connector
+connector = Connector("sqlite", {"db_name": os.path.join(tempfile.mkdtemp(),
+                                                         "td.sqlite")})
+connector.select_all("id", "Users")
+print(" ".join(name for name in ("pyramid", "pymongo", "MySQLdb", "psycopg2")
+               if name in sys.modules))
+"""
+
+
+class TestImportProfiler(unittest.TestCase):
+    """Test td.startup.ImportProfiler"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        for name, body in (("td_slow_parent", "import td_slow_child\n"
+                                              "sum(range(300000))\n"),
+                           ("td_slow_child", "sum(range(300000))\n")):
+            with open(os.path.join(self.directory, name + ".py"), "w") as f:
+                f.write(body)
+        sys.path.insert(0, self.directory)
+
+    def tearDown(self):
+        sys.path.remove(self.directory)
+        for name in ("td_slow_parent", "td_slow_child"):
+            sys.modules.pop(name, None)
+        shutil.rmtree(self.directory)
+
+    def test_self_and_cumulative_time(self):
+        """Test that time of the nested import is counted in cumulative time
+        of the parent, but not in it's self time, and modules which are
+        already imported are not recorded.
+        """
+        profiler = ImportProfiler()
+        profiler.start()
+        try:
+            import td_slow_parent
+            import os.path
+        finally:
+            profiler.stop()
+        self.assertEqual(sorted(profiler.modules),
+                         ["td_slow_child", "td_slow_parent"])
+        parent = profiler.modules["td_slow_parent"]
+        child = profiler.modules["td_slow_child"]
+        self.assertGreaterEqual(parent[0], parent[1] + child[0])
+        self.assertEqual(profiler.top(1, "cumulative")[0][0],
+                         "td_slow_parent")
+        self.assertIsNotNone(td_slow_parent)
+
+
+class TestPhaseTimer(unittest.TestCase):
+    """Test td.startup.PhaseTimer"""
+
+    def test_marks(self):
+        """Test that each phase lasts from the previous mark."""
+        timer = PhaseTimer()
+        timer.start()
+        timer.mark("config")
+        timer.mark("databases")
+        self.assertEqual([name for name, _ in timer.phases],
+                         ["config", "databases"])
+        self.assertAlmostEqual(timer.total(),
+                               sum(duration for _, duration in timer.phases))
+        self.assertTrue(timer.format().startswith("config 0.0"))
+
+
+class TestLazyImports(unittest.TestCase):
+    """Test that td loads Pyramid and the drivers only when they are
+    used.
+    """
+
+    def test_sqlite_engine(self):
+        """Test that sqlite Connector doesn't import the other drivers."""
+        output = subprocess.check_output(
+            [sys.executable, "-c", LAZY_IMPORTS_SCRIPT],
+            env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)))
+        self.assertEqual(output.strip(), "")
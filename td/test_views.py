@@ -8,63 +8,623 @@
 
 """
 
+import json
+import os
+import threading
 import unittest
 
+import mongomock
+from bson import ObjectId
 from pyramid import testing
+from pyramid.request import Request
+from webob.etag import ETagMatcher, NoETag
+from webob.multidict import MultiDict
 
-from td import views
+from td import renderers, views
+from td.assets import AssetStore
+from td.config import Settings
+from td.instrumentation import InstrumentedDatabase
+from td.mongo_client import DEFAULT_MAX_STALENESS
+from td.ratelimit import LoginLimiter, TokenBucketLimiter
+from td.versions import (CHANGES_WRITE_TIMEOUT,
+                         bump_version,
+                         get_changes,
+                         get_version)
+from td.write_behind import WriteBehindQueue
 
 
-class TestItemsGetting(unittest.TestCase):
-    """Test views.get_todo_list_items"""
+ASSETS = AssetStore(os.path.join(os.path.dirname(views.__file__),
+                                 "static")).load()
+
+
+class FakeConnector(object):
+    """Connector stand-in which knows single user with id 1."""
+
+    def select_one(self, column_names, table, where=None):
+        if where == {"username": "user"}:
+            return (1,)
+        return None
+
+
+class ViewTestCase(unittest.TestCase):
+    """Base for tests of views which work with databases."""
 
     def setUp(self):
-        """Create DummyRequest for each test."""
+        """Create DummyRequest of authenticated user 'user' with fake
+        Connector and in-memory Mongo database in the settings.
+        """
+        self.config = testing.setUp()
+        self.config.testing_securitypolicy(userid="user")
+        self.mongo_db = mongomock.MongoClient().TDDB
         self.request = testing.DummyRequest()
+        self.request.GET = MultiDict()
+        self.request.if_none_match = NoETag
+        self.request.client_addr = "127.0.0.1"
+        self.request.registry.settings["db"] = FakeConnector()
+        self.request.registry.settings["mongo_db"] = self.mongo_db
+        self.request.registry.settings["app_settings"] = Settings()
 
-    def test_nonexisting_items_getting(self):
-        """Test views.get_todo_list_items with nonexisting items obj in
-        session.
+    def tearDown(self):
+        testing.tearDown()
+
+    def add_items(self, count, owner_id=1, category="red"):
+        """Insert count of items into Items collection and return their ids
+        as strings from the oldest to the newest.
         """
-        response = views.get_todo_list_items(self.request)
-        self.assertEqual(response, {"items": None})
+        return [str(self.mongo_db.Items.insert_one(
+                    {"item_value": "item %d" % number,
+                     "category": category,
+                     "owner_id": owner_id}).inserted_id)
+                for number in range(count)]
+
+    def get_items(self):
+        """Call the view and decode it's value as the client does."""
+        value = views.get_todo_list_items(self.request)
+        if not isinstance(value, dict):
+            return value
+        return json.loads("".join(renderers.iter_encode(value)))
+
+
+class TestItemsGetting(ViewTestCase):
+    """Test views.get_todo_list_items"""
+
+    def test_nonexisting_items_getting(self):
+        """Test views.get_todo_list_items when user has no items."""
+        self.add_items(2, owner_id=2)
+        response = self.get_items()
+        self.assertEqual(response,
+                         {"items": None, "next": None, "version": 0})
 
     def test_existing_items_getting(self):
-        """Test views.get_todo_list_items with existing items obj in
-        session with value ['one', '2'].
+        """Test views.get_todo_list_items with two existing items which are
+        returned from the newest one.
+        """
+        ids = self.add_items(2)
+        response = self.get_items()
+        self.assertEqual(response, {
+            "items": [{"item_value": "item 1", "category": "red",
+                       "id": ids[1]},
+                      {"item_value": "item 0", "category": "red",
+                       "id": ids[0]}],
+            "next": None,
+            "version": 0})
+
+    def test_pagination(self):
+        """Test that pages follow each other by the next cursor."""
+        ids = self.add_items(5)
+        self.request.GET["limit"] = "2"
+        pages = []
+        while True:
+            response = self.get_items()
+            pages.append([item["id"] for item in response["items"]])
+            if response["next"] is None:
+                break
+            self.request.GET["after"] = response["next"]
+        self.assertEqual(pages, [[ids[4], ids[3]], [ids[2], ids[1]],
+                                 [ids[0]]])
+
+    def test_streamed_page(self):
+        """Test that page bigger than items.stream_threshold is streamed with
+        the same content.
+        """
+        ids = self.add_items(3)
+        self.request.GET["limit"] = "2"
+        self.request.registry.settings["app_settings"] = Settings(
+            {"items.stream_threshold": "1"})
+        value = views.get_todo_list_items(self.request)
+        self.assertIsInstance(value["items"], renderers.StreamedArray)
+        response = self.get_items()
+        self.assertEqual([item["id"] for item in response["items"]],
+                         [ids[2], ids[1]])
+        self.assertEqual(response["next"], ids[1])
+
+    def test_default_settings_stream_big_pages(self):
+        """Test that the biggest pages allowed by default are streamed."""
+        self.add_items(1)
+        self.request.GET["limit"] = str(views.MAX_PAGE_SIZE)
+        value = views.get_todo_list_items(self.request)
+        self.assertIsInstance(value["items"], renderers.StreamedArray)
+
+    def test_streamed_unexpected_values(self):
+        """Test that streamed chunk with not string values is encoded by the
+        generic encoder.
+        """
+        self.mongo_db.Items.insert_one({"item_value": 5, "owner_id": 1})
+        self.request.registry.settings["app_settings"] = Settings(
+            {"items.stream_threshold": "1"})
+        response = self.get_items()
+        self.assertEqual(response["items"][0]["item_value"], 5)
+        self.assertIsNone(response["items"][0]["category"])
+
+    def test_page_size_cap(self):
+        """Test that limit is capped by items.max_page_size setting."""
+        self.add_items(3)
+        self.request.registry.settings["app_settings"] = Settings(
+            {"items.max_page_size": "2"})
+        self.request.GET["limit"] = "1000"
+        response = self.get_items()
+        self.assertEqual(len(response["items"]), 2)
+        self.assertIsNotNone(response["next"])
+
+    def test_category_filter(self):
+        """Test that only items of requested categories are returned."""
+        self.add_items(2, category="red")
+        green_ids = self.add_items(1, category="green")
+        yellow_ids = self.add_items(1, category="yellow")
+        self.request.GET = MultiDict([("category", "green"),
+                                      ("category", "yellow")])
+        response = self.get_items()
+        self.assertEqual([item["id"] for item in response["items"]],
+                         [yellow_ids[0], green_ids[0]])
+
+    def test_wrong_cursor(self):
+        """Test that malformed after param is rejected with 400."""
+        self.request.GET["after"] = "not an id"
+        response = self.get_items()
+        self.assertEqual(response.code, 400)
+
+
+class TestInstrumentedItemsGetting(TestItemsGetting):
+    """Test views.get_todo_list_items with Mongo calls instrumented."""
+
+    def setUp(self):
+        super(TestInstrumentedItemsGetting, self).setUp()
+        self.events = []
+        self.mongo_db = InstrumentedDatabase(self.mongo_db,
+                                             self.events.append)
+        self.request.registry.settings["mongo_db"] = self.mongo_db
+
+    def test_page_with_next_is_reported(self):
+        """Test that cursor of the page which isn't the last one is
+        reported, though it's not exhausted.
+        """
+        self.add_items(3)
+        del self.events[:]
+        self.request.GET["limit"] = "2"
+        self.assertIsNotNone(self.get_items()["next"])
+        self.assertIn("Items.find",
+                      [event.statement for event in self.events])
+
+
+class TestItemsReadRouting(ViewTestCase):
+    """Test that views.get_todo_list_items reads lists from secondaries only
+    when they weren't changed for max staleness.
+    """
+
+    def setUp(self):
+        """Make secondary which hasn't replicated any items yet."""
+        super(TestItemsReadRouting, self).setUp()
+        self.request.registry.settings["secondary_items"] = (
+            mongomock.MongoClient().TDDB.Items)
+        self.add_items(1)
+
+    def test_recently_changed_list(self):
+        """Test that just changed list is read from the primary."""
+        bump_version(self.mongo_db, 1)
+        self.assertEqual(len(self.get_items()["items"]), 1)
+
+    def test_list_unchanged_for_max_staleness(self):
+        """Test that list unchanged for longer than max staleness is read
+        from the secondary.
         """
-        self.request.session["items"] = ["one", "2"]
-        response = views.get_todo_list_items(self.request)
-        self.assertEqual(response, {"items": ["one", "2"]})
+        bump_version(self.mongo_db, 1)
+        self.mongo_db.Versions.update_one(
+            {"_id": 1}, {"$inc": {"changed_at": -DEFAULT_MAX_STALENESS}})
+        self.assertIsNone(self.get_items()["items"])
 
 
-class TestItemsAdding(unittest.TestCase):
+class TestItemsAdding(ViewTestCase):
     """Test views.add_todo_list_item"""
 
     def setUp(self):
         """Create DummyRequest and fake data in json_body for each test."""
-        self.request = testing.DummyRequest()
-        self.request.json_body = {"item": "wake up"}
+        super(TestItemsAdding, self).setUp()
+        self.request.json_body = {"item_value": "wake up", "category": "red"}
 
     def test_adding_to_nonexisting_items_list(self):
-        """Test views.add_todo_list_item with nonexisting items obj in
-        session.
-        """
+        """Test views.add_todo_list_item when user has no items yet."""
         response = views.add_todo_list_item(self.request)
-        self.assertIn("items", self.request.session)
-        self.assertEqual(self.request.session.get("items"), ["wake up"])
-        self.assertEqual(response.body, "OK")
+        item = self.mongo_db.Items.find_one({"owner_id": 1})
+        self.assertEqual(response, {"id": str(item["_id"]), "version": 1})
+        self.assertEqual(item["item_value"], "wake up")
+        self.assertEqual(item["category"], "red")
+        self.assertEqual(item["item_tokens"], ["wa", "wak", "wake", "up"])
 
     def test_adding_to_existing_items_list(self):
-        """Test views.add_todo_list_item with existing items obj in
-        session and ['old item'] in it.
+        """Test views.add_todo_list_item with one existing item and that
+        version of the list is incremented.
         """
-        self.request.session["items"] = ["old item"]
+        self.add_items(1)
+        views.add_todo_list_item(self.request)
+        self.assertEqual(self.mongo_db.Items.count({"owner_id": 1}), 2)
+        self.assertEqual(get_version(self.mongo_db, 1), 1)
+
+    def test_adding_through_write_queue(self):
+        """Test that acknowledged item is in the database already."""
+        write_queue = WriteBehindQueue(self.mongo_db.Items)
+        self.addCleanup(write_queue.close)
+        self.request.registry.settings["write_queue"] = write_queue
         response = views.add_todo_list_item(self.request)
-        self.assertIn("items", self.request.session)
-        self.assertEqual(self.request.session.get("items"),
-                         ["old item", "wake up"])
-        self.assertEqual(response.body, "OK")
+        item = self.mongo_db.Items.find_one({"owner_id": 1})
+        self.assertEqual(response, {"id": str(item["_id"]), "version": 1})
+
+
+class TestItemsSearch(ViewTestCase):
+    """Test views.search_items"""
+
+    def setUp(self):
+        """Add items through the view, so they have tokens, and search them
+        by tokens, mongomock doesn't support $text.
+        """
+        super(TestItemsSearch, self).setUp()
+
+        def find_items(collection, owner_id, terms, categories=None,
+                       offset=0, limit=50):
+            query = {"owner_id": owner_id, "item_tokens": {"$in": terms}}
+            if categories:
+                query["category"] = {"$in": categories}
+            return collection.find(query).sort("_id", -1).skip(
+                offset).limit(limit)
+
+        original = views.find_items
+        views.find_items = find_items
+        self.addCleanup(setattr, views, "find_items", original)
+        self.request.json_body = {"items": [
+            {"item_value": "Buy milk", "category": "red"},
+            {"item_value": "Milkshake", "category": "green"},
+            {"item_value": "Bread", "category": "red"},
+            {"item_value": "Milk again", "category": "red"}]}
+        self.ids = [result["id"] for result in
+                    views.add_todo_list_items(self.request)["results"]]
+
+    def search(self, **params):
+        """Call the view with GET params and decode it's value."""
+        self.request.GET = MultiDict(params)
+        value = views.search_items(self.request)
+        if not isinstance(value, dict):
+            return value
+        return json.loads("".join(renderers.iter_encode(value)))
+
+    def test_prefix_pages(self):
+        """Test that pages of matched items follow each other by offset."""
+        response = self.search(q="MIL", limit="2")
+        self.assertEqual([item["id"] for item in response["items"]],
+                         [self.ids[3], self.ids[1]])
+        self.assertEqual(response["next"], 2)
+        response = self.search(q="MIL", limit="2", offset="2")
+        self.assertEqual([item["id"] for item in response["items"]],
+                         [self.ids[0]])
+        self.assertIsNone(response["next"])
+
+    def test_category_filter(self):
+        """Test that only items of the given categories are matched."""
+        response = self.search(q="milk", category="green")
+        self.assertEqual(response, {
+            "items": [{"item_value": "Milkshake", "category": "green",
+                       "id": self.ids[1]}],
+            "next": None,
+            "version": 1})
+        self.assertIsNone(self.search(q="milk", category="blue")["items"])
+
+    def test_max_results(self):
+        """Test that results are paged only up to search.max_results."""
+        self.request.registry.settings["app_settings"] = Settings(
+            {"search.max_results": "3"})
+        response = self.search(q="milk", limit="2", offset="2")
+        self.assertEqual(len(response["items"]), 1)
+        self.assertIsNone(response["next"])
+        self.assertEqual(self.search(q="milk", offset="3").status_code, 400)
+
+    def test_wrong_params(self):
+        """Test that empty query and negative offset are rejected."""
+        self.assertEqual(self.search().status_code, 400)
+        self.assertEqual(self.search(q=" , ").status_code, 400)
+        self.assertEqual(self.search(q="milk", offset="-1").status_code, 400)
+
+
+class HeldCollection(object):
+    """Collection stand-in which holds inserts until released."""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.released = threading.Event()
+
+    def insert_many(self, documents, ordered=True):
+        self.released.wait(5)
+        return self.collection.insert_many(documents, ordered=ordered)
+
+
+class TestBufferedItemsAdding(ViewTestCase):
+    """Test views.add_todo_list_item with buffered write-behind queue."""
+
+    def setUp(self):
+        super(TestBufferedItemsAdding, self).setUp()
+        self.items = HeldCollection(self.mongo_db.Items)
+        self.write_queue = WriteBehindQueue(self.items, durability="buffered")
+        self.addCleanup(self.write_queue.close, 5)
+        self.request.registry.settings["write_queue"] = self.write_queue
+        self.request.json_body = {"item_value": "wake up", "category": "red"}
+
+    def test_version_is_bumped_after_write(self):
+        """Test that page read between the queueing and the write isn't
+        tagged with the version which has the item.
+        """
+        response = views.add_todo_list_item(self.request)
+        self.assertIsNone(response["version"])
+        self.assertEqual(self.get_items(),
+                         {"items": None, "next": None, "version": 0})
+        self.items.released.set()
+        self.write_queue.close(5)
+        self.assertEqual(get_version(self.mongo_db, 1), 1)
+        self.assertEqual(self.get_items()["items"][0]["id"], response["id"])
+
+    def test_failed_write_isnt_recorded(self):
+        """Test that change of the item which failed to be written isn't
+        recorded.
+        """
+        self.mongo_db.Items.insert_one({"_id": "taken"})
+        original_submit = self.write_queue.submit
+        self.write_queue.submit = lambda document: original_submit(
+            dict(document, _id="taken"))
+        views.add_todo_list_item(self.request)
+        self.items.released.set()
+        self.write_queue.close(5)
+        self.assertEqual(get_version(self.mongo_db, 1), 0)
+
+
+class TestItemRemoval(ViewTestCase):
+    """Test views.remove_item"""
+
+    def test_removal(self):
+        """Test that item is removed and version is incremented."""
+        item_id = self.add_items(1)[0]
+        self.request.json_body = {"id": item_id}
+        response = views.remove_item(self.request)
+        self.assertEqual(response, {"id": item_id, "version": 1})
+        self.assertEqual(self.mongo_db.Items.count(), 0)
+
+    def test_foreign_item_removal(self):
+        """Test that item of the other user is kept."""
+        item_id = self.add_items(1, owner_id=2)[0]
+        self.request.json_body = {"id": item_id}
+        views.remove_item(self.request)
+        self.assertEqual(self.mongo_db.Items.count(), 1)
+        self.assertEqual(get_version(self.mongo_db, 1), 0)
+
+    def test_wrong_id(self):
+        """Test that missing or malformed id is rejected with 400."""
+        self.add_items(1)
+        for body in ({}, {"id": "not an id"}, {"id": None}, ["id"]):
+            self.request.json_body = body
+            response = views.remove_item(self.request)
+            self.assertEqual(response.code, 400)
+        self.assertEqual(self.mongo_db.Items.count(), 1)
+
+
+class TestBatchAdding(ViewTestCase):
+    """Test views.add_todo_list_items"""
+
+    def add_batch(self, ordered):
+        """Add batch with wrong item in the middle."""
+        self.request.json_body = {
+            "items": [{"item_value": "one", "category": "red"},
+                      {"item_value": 2},
+                      {"item_value": "three", "category": "green"}],
+            "ordered": ordered}
+        return views.add_todo_list_items(self.request)
+
+    def test_ordered_batch(self):
+        """Test that ordered batch stops on the wrong item."""
+        results = self.add_batch(ordered=True)["results"]
+        self.assertEqual([result["status"] for result in results],
+                         ["ok", "error", "skipped"])
+        item = self.mongo_db.Items.find_one()
+        self.assertEqual(str(item["_id"]), results[0]["id"])
+        self.assertEqual(self.mongo_db.Items.count(), 1)
+        self.assertEqual(get_version(self.mongo_db, 1), 1)
+
+    def test_unordered_batch(self):
+        """Test that unordered batch skips only the wrong item."""
+        results = self.add_batch(ordered=False)["results"]
+        self.assertEqual([result["status"] for result in results],
+                         ["ok", "error", "ok"])
+        self.assertEqual(self.mongo_db.Items.count({"owner_id": 1}), 2)
+
+    def test_batch_size_limit(self):
+        """Test that too big batch is rejected with 400."""
+        self.request.registry.settings["app_settings"] = Settings(
+            {"items.max_batch_size": "1"})
+        response = self.add_batch(ordered=True)
+        self.assertEqual(response.code, 400)
+        self.assertEqual(self.mongo_db.Items.count(), 0)
+
+
+class TestBatchRemoval(ViewTestCase):
+    """Test views.remove_items"""
+
+    def test_batch_removal(self):
+        """Test that only own items are removed and wrong ids reported."""
+        own_ids = self.add_items(2)
+        foreign_ids = self.add_items(1, owner_id=2)
+        self.request.json_body = {"ids": own_ids + ["wrong"] + foreign_ids,
+                                  "ordered": False}
+        response = views.remove_items(self.request)
+        self.assertEqual([result["status"] for result in response["results"]],
+                         ["ok", "ok", "error", "ok"])
+        self.assertEqual(response["removed"], 2)
+        self.assertEqual(self.mongo_db.Items.count(), 1)
+        self.assertEqual(get_version(self.mongo_db, 1), 1)
+
+    def test_only_removed_items_are_recorded(self):
+        """Test that ids which matched nothing don't get delete changes and
+        don't bump the version.
+        """
+        own_ids = self.add_items(1)
+        foreign_ids = self.add_items(1, owner_id=2)
+        missing_id = str(ObjectId())
+        self.request.json_body = {"ids": own_ids + own_ids + [missing_id] +
+                                  foreign_ids}
+        response = views.remove_items(self.request)
+        self.assertEqual(response["removed"], 1)
+        self.assertEqual(get_changes(self.mongo_db, 1, 0),
+                         (1, [{"op": "delete", "id": own_ids[0]}]))
+        self.request.json_body = {"ids": [missing_id] + foreign_ids}
+        self.assertEqual(views.remove_items(self.request)["version"], 1)
+
+
+class TestItemChanges(ViewTestCase):
+    """Test views.get_item_changes"""
+
+    def get_changes(self, since):
+        """Get changes since the version."""
+        self.request.GET["since"] = str(since)
+        return views.get_item_changes(self.request)
+
+    def test_changes(self):
+        """Test that changes made after the version are returned in order."""
+        self.request.json_body = {"item_value": "one", "category": "red"}
+        first_id = views.add_todo_list_item(self.request)["id"]
+        self.request.json_body = {"item_value": "two", "category": "green"}
+        second_id = views.add_todo_list_item(self.request)["id"]
+        self.request.json_body = {"id": first_id}
+        views.remove_item(self.request)
+
+        self.assertEqual(self.get_changes(1), {
+            "version": 3,
+            "changes": [{"op": "insert",
+                         "item": {"id": second_id,
+                                  "item_value": "two",
+                                  "category": "green"}},
+                        {"op": "delete", "id": first_id}],
+            "reset": False})
+        self.assertEqual(self.get_changes(3),
+                         {"version": 3, "changes": [], "reset": False})
+
+    def test_batch_changes(self):
+        """Test that batch is logged as single version."""
+        self.request.json_body = {"items": [{"item_value": "one",
+                                             "category": "red"},
+                                            {"item_value": "two",
+                                             "category": "red"}]}
+        version = views.add_todo_list_items(self.request)["version"]
+        response = self.get_changes(0)
+        self.assertEqual(response["version"], version)
+        self.assertEqual(len(response["changes"]), 2)
+
+    def test_too_many_changes(self):
+        """Test that client is asked to reload the list when there are more
+        than changes.max_changes of changes.
+        """
+        self.request.registry.settings["app_settings"] = Settings(
+            {"changes.max_changes": "1"})
+        self.request.json_body = {"items": [{"item_value": "one",
+                                             "category": "red"},
+                                            {"item_value": "two",
+                                             "category": "red"}]}
+        views.add_todo_list_items(self.request)
+        self.assertEqual(self.get_changes(0),
+                         {"version": 1, "changes": None, "reset": True})
+
+    def test_expired_changes(self):
+        """Test that client is asked to reload the list when it's version is
+        older than kept in the log.
+        """
+        self.request.registry.settings["app_settings"] = Settings(
+            {"changes.retention": "1"})
+        for _ in range(3):
+            self.request.json_body = {"item_value": "one", "category": "red"}
+            views.add_todo_list_item(self.request)
+        self.assertEqual(self.get_changes(0),
+                         {"version": 3, "changes": None, "reset": True})
+
+    def test_change_in_progress(self):
+        """Test that the newest version without logged changes is not
+        reported yet.
+        """
+        self.request.json_body = {"item_value": "one", "category": "red"}
+        views.add_todo_list_item(self.request)
+        bump_version(self.mongo_db, 1)
+        response = self.get_changes(0)
+        self.assertEqual(response["version"], 1)
+        self.assertEqual(len(response["changes"]), 1)
+
+    def test_lost_change(self):
+        """Test that client is asked to reload the list when changes of the
+        newest version weren't written in time.
+        """
+        self.request.json_body = {"item_value": "one", "category": "red"}
+        views.add_todo_list_item(self.request)
+        bump_version(self.mongo_db, 1)
+        self.mongo_db.Versions.update_one(
+            {"_id": 1},
+            {"$inc": {"changed_at": -CHANGES_WRITE_TIMEOUT - 1}})
+        self.assertEqual(self.get_changes(0),
+                         {"version": 2, "changes": None, "reset": True})
+
+
+class TestItemsRevalidation(ViewTestCase):
+    """Test ETag support of views.get_todo_list_items"""
+
+    def get_etag(self):
+        """Get items and return ETag of the response."""
+        views.get_todo_list_items(self.request)
+        return self.request.response.etag
+
+    def test_not_modified(self):
+        """Test that request with current ETag gets 304."""
+        self.add_items(1)
+        self.request.if_none_match = ETagMatcher([self.get_etag()])
+        response = self.get_items()
+        self.assertEqual(response.code, 304)
+
+    def test_modified(self):
+        """Test that ETag changes after the list is changed."""
+        etag = self.get_etag()
+        bump_version(self.mongo_db, 1)
+        self.assertNotEqual(self.get_etag(), etag)
+
+    def test_etag_depends_on_params(self):
+        """Test that pages with different params have different ETags."""
+        etag = self.get_etag()
+        self.request.GET["category"] = "red"
+        self.assertNotEqual(self.get_etag(), etag)
+
+
+class TestLogin(ViewTestCase):
+    """Test views.post_login_credentials"""
+
+    def test_attempts_over_limit(self):
+        """Test that attempt over the limit is rejected before password is
+        checked.
+        """
+        self.request.registry.settings["login_limiter"] = LoginLimiter(
+            user_limiter=TokenBucketLimiter(0.001, 1))
+        self.request.registry.settings["password_master"] = None
+        self.request.registry.settings["db"] = None
+        self.request.json_body = {"login": "user", "password": "1234"}
+        self.request.registry.settings["login_limiter"].allow("user", "ip")
+        response = views.post_login_credentials(self.request)
+        self.assertEqual(response.code, 429)
 
 
 class TestHomeIndex(unittest.TestCase):
@@ -87,13 +647,41 @@ class TestTodoListPageGetting(unittest.TestCase):
     """Test views.get_todo_list_page"""
 
     def setUp(self):
-        """Create DummyRequest for the test."""
-        self.request = testing.DummyRequest()
+        """Create request with assets of td/static for the test."""
+        self.config = testing.setUp(settings={"assets": ASSETS})
+        self.request = Request.blank("/todo_list")
+        self.request.registry = self.config.registry
+
+    def tearDown(self):
+        testing.tearDown()
 
     def test_page_getting(self):
-        """Test views.get_todo_list_page by checking if FileResponse is done
+        """Test views.get_todo_list_page by checking if response is done
         with known html code in it's body.
         """
         response = views.get_todo_list_page(self.request)
         self.assertIn('<div id="add_item_panel" class="input-group">',
                       response.body)
+        self.assertEqual(response.cache_control.no_cache, "*")
+
+    def test_gzipped_asset(self):
+        """Test that fingerprinted asset is served gzipped with immutable
+        caching and 304 is returned for it's ETag.
+        """
+        url = ASSETS.url("todo_list_script.js")
+        self.request = Request.blank(url,
+                                     headers={"Accept-Encoding": "gzip"})
+        self.request.registry = self.config.registry
+        response = views.get_asset(self.request)
+        self.assertEqual(response.content_encoding, "gzip")
+        self.assertEqual(response.headers["Cache-Control"],
+                         views.ASSET_CACHE_CONTROL)
+        self.request.if_none_match = ETagMatcher([response.etag])
+        self.assertEqual(views.get_asset(self.request).code, 304)
+
+    def test_unknown_asset(self):
+        """Test that unknown fingerprinted URL gets 404."""
+        self.request = Request.blank(
+            "/assets/todo_list_script.0000000000.js")
+        self.request.registry = self.config.registry
+        self.assertEqual(views.get_asset(self.request).code, 404)
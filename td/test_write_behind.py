@@ -0,0 +1,105 @@
+"""
+.. module:: test_write_behind
+   :platform: Unix
+   :synopsis: Unittests for td.write_behind
+
+.. moduleauthor:: Mykola Radionov <moodaq@gmail.com>
+
+
+"""
+
+import threading
+import time
+import unittest
+
+import mongomock
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from td.exceptions import WriteQueueBusyException
+from td.write_behind import WriteBehindQueue
+
+
+class RecordingCollection(object):
+    """Collection stand-in which records sizes of batches and can hold
+    them until released.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.batches = []
+        self.released = threading.Event()
+        self.released.set()
+
+    def insert_many(self, documents, ordered=True):
+        self.released.wait()
+        self.batches.append(len(documents))
+        return self.collection.insert_many(documents, ordered=ordered)
+
+
+class TestWriteBehindQueue(unittest.TestCase):
+    """Test td.write_behind.WriteBehindQueue"""
+
+    def setUp(self):
+        self.items = mongomock.MongoClient().TDDB.Items
+        self.collection = RecordingCollection(self.items)
+
+    def test_concurrent_inserts_are_grouped(self):
+        """Test that documents queued within max_delay share one batch and
+        each of them is acknowledged with it's _id.
+        """
+        queue = WriteBehindQueue(self.collection, max_delay=0.2)
+        self.addCleanup(queue.close)
+        pending = [queue.submit({"n": n}) for n in range(5)]
+        ids = [write.result(5) for write in pending]
+        self.assertEqual(self.collection.batches, [5])
+        self.assertEqual(sorted(document["_id"]
+                                for document in self.items.find()),
+                         sorted(ids))
+
+    def test_buffered_documents_are_written_on_close(self):
+        """Test that buffered insert returns before the write and close
+        writes the queue.
+        """
+        self.collection.released.clear()
+        queue = WriteBehindQueue(self.collection, durability="buffered")
+        inserted_id = queue.insert_one({"n": 1})
+        self.assertEqual(self.items.count_documents({}), 0)
+        self.collection.released.set()
+        queue.close(5)
+        self.assertEqual(self.items.find_one()["_id"], inserted_id)
+        # nothing writes the queue after close, so insert is written inline
+        queue.insert_one({"n": 2})
+        self.assertEqual(self.items.count_documents({}), 2)
+
+    def test_backpressure(self):
+        """Test that insert into the full queue is rejected after
+        queue_timeout.
+        """
+        self.collection.released.clear()
+        queue = WriteBehindQueue(self.collection, durability="buffered",
+                                 writers=1, max_pending=1,
+                                 queue_timeout=0.01)
+        self.addCleanup(queue.close)
+        self.addCleanup(self.collection.released.set)
+        first = queue.submit({"n": 1})
+        while len(queue):
+            # the worker takes the first document and waits in insert_many
+            time.sleep(0.001)
+        self.assertFalse(first.done())
+        queue.submit({"n": 2})
+        self.assertRaises(WriteQueueBusyException, queue.submit, {"n": 3})
+
+    def test_failed_document(self):
+        """Test that only the document which failed gets the error."""
+
+        def insert_many(documents, ordered=True):
+            raise BulkWriteError({"writeErrors": [
+                {"index": 0, "code": 11000, "errmsg": "duplicate key"}]})
+
+        self.collection.insert_many = insert_many
+        queue = WriteBehindQueue(self.collection, max_delay=0.2)
+        self.addCleanup(queue.close)
+        duplicate = queue.submit({"_id": 1})
+        other = queue.submit({"_id": 2})
+        self.assertRaises(DuplicateKeyError, duplicate.result, 5)
+        self.assertEqual(other.result(5), 2)
@@ -0,0 +1,207 @@
+"""
+.. module:: versions
+   :platform: Unix
+   :synopsis: Versions and change log of users' todo lists for td app.
+
+.. moduleauthor:: Mykola Radionov <moodaq@gmail.com>
+
+
+"""
+
+
+import time
+
+import pymongo
+
+
+# count of the latest versions which changes are kept in the log
+CHANGES_RETENTION = 1000
+# the biggest count of changes in the reply, the client reloads longer ones
+MAX_CHANGES = 1000
+# old changes are removed from the log on every PRUNE_INTERVAL-th version
+PRUNE_INTERVAL = 50
+# seconds for which the newest version may have no changes in the log, after
+# that it's changes are considered lost, e.g. by failed insert
+CHANGES_WRITE_TIMEOUT = 5
+
+
+def get_version(mongo_db, owner_id):
+    """Get current version of the owner's todo list.
+
+    Version is a counter which is incremented after every change of owner's
+    items, so equal versions mean equal lists.
+
+    :param mongo_db: Mongo database with Versions collection.
+    :type mongo_db: pymongo.database.Database
+    :param owner_id: integer id of the user.
+    :type owner_id: int
+    :return: current version, 0 if owner's items were never changed.
+    :rtype: int
+    """
+    document = mongo_db.Versions.find_one({"_id": owner_id}, {"version": 1})
+    if document is None:
+        return 0
+    return document.get("version", 0)
+
+
+def get_version_state(mongo_db, owner_id):
+    """Get current version of the owner's todo list and time of it's last
+    change.
+
+    :param mongo_db: Mongo database with Versions collection.
+    :type mongo_db: pymongo.database.Database
+    :param owner_id: integer id of the user.
+    :type owner_id: int
+    :return: tuple (version, unix time of the change or None if it's
+    unknown).
+    :rtype: tuple
+    """
+    document = mongo_db.Versions.find_one({"_id": owner_id},
+                                          {"version": 1, "changed_at": 1})
+    if document is None:
+        return 0, None
+    return document.get("version", 0), document.get("changed_at")
+
+
+def get_tickets_version(mongo_db, owner_id):
+    """Get version of the owner's auth tickets, tickets with the other
+    version are revoked.
+
+    :param mongo_db: Mongo database with Versions collection.
+    :type mongo_db: pymongo.database.Database
+    :param owner_id: integer id of the user.
+    :type owner_id: int
+    :return: current version, 0 if tickets were never revoked.
+    :rtype: int
+    """
+    document = mongo_db.Versions.find_one({"_id": owner_id},
+                                          {"tickets_version": 1})
+    if document is None:
+        return 0
+    return document.get("tickets_version", 0)
+
+
+def revoke_tickets(mongo_db, owner_id):
+    """Revoke all auth tickets of the owner, e.g. after password change.
+
+    :param mongo_db: Mongo database with Versions collection.
+    :type mongo_db: pymongo.database.Database
+    :param owner_id: integer id of the user.
+    :type owner_id: int
+    :return: new version of the owner's tickets.
+    :rtype: int
+    """
+    document = mongo_db.Versions.find_one_and_update(
+        {"_id": owner_id},
+        {"$inc": {"tickets_version": 1}},
+        projection={"tickets_version": 1},
+        upsert=True,
+        return_document=pymongo.ReturnDocument.AFTER)
+    return document["tickets_version"]
+
+
+def bump_version(mongo_db, owner_id):
+    """Increment version of the owner's todo list after it's change.
+
+    :param mongo_db: Mongo database with Versions collection.
+    :type mongo_db: pymongo.database.Database
+    :param owner_id: integer id of the user.
+    :type owner_id: int
+    :return: new version.
+    :rtype: int
+    """
+    document = mongo_db.Versions.find_one_and_update(
+        {"_id": owner_id},
+        {"$inc": {"version": 1}, "$set": {"changed_at": time.time()}},
+        projection={"version": 1},
+        upsert=True,
+        return_document=pymongo.ReturnDocument.AFTER)
+    return document["version"]
+
+
+def record_changes(mongo_db, owner_id, changes, retention=CHANGES_RETENTION):
+    """Bump version of the owner's todo list and write it's changes into the
+    Changes collection with this version.
+
+    Changes are dicts like {'op': 'insert', 'item': {'id': '...',
+    'item_value': 'sleep', 'category': 'green'}} or {'op': 'delete',
+    'id': '...'}. Changes older than retention versions are removed from the
+    log from time to time.
+
+    :param mongo_db: Mongo database with Versions and Changes collections.
+    :type mongo_db: pymongo.database.Database
+    :param owner_id: integer id of the user.
+    :type owner_id: int
+    :param changes: non-empty list of changes made in the list.
+    :type changes: list
+    :param retention: count of the latest versions to keep in the log.
+    :type retention: int
+    :return: new version.
+    :rtype: int
+    """
+    version = bump_version(mongo_db, owner_id)
+    mongo_db.Changes.insert_many([dict(change,
+                                       owner_id=owner_id,
+                                       version=version)
+                                  for change in changes])
+    if version % PRUNE_INTERVAL == 0:
+        mongo_db.Changes.delete_many({"owner_id": owner_id,
+                                      "version": {"$lte": version - retention}})
+    return version
+
+
+def get_changes(mongo_db, owner_id, since, retention=CHANGES_RETENTION,
+                max_changes=MAX_CHANGES):
+    """Get changes of the owner's todo list made after the since version.
+
+    If changes are not available anymore (since is older than retention
+    versions, or there are more than max_changes of them) then None is
+    returned instead of them and the client should reload the whole list.
+
+    Version is bumped before it's changes are written, so the newest version
+    may have no changes in the log yet. In this case changes are returned up
+    to the previous version for CHANGES_WRITE_TIMEOUT seconds after the bump,
+    then the changes are considered lost and None is returned.
+
+    :param mongo_db: Mongo database with Versions and Changes collections.
+    :type mongo_db: pymongo.database.Database
+    :param owner_id: integer id of the user.
+    :type owner_id: int
+    :param since: version of the list known to the client.
+    :type since: int
+    :param retention: count of the latest versions kept in the log.
+    :type retention: int
+    :param max_changes: the biggest count of changes to return.
+    :type max_changes: int
+    :return: tuple (version which the changes lead to, list of changes or
+    None).
+    :rtype: tuple
+    """
+    current, changed_at = get_version_state(mongo_db, owner_id)
+    if since == current:
+        return current, []
+    if since > current or since < current - retention:
+        return current, None
+
+    reply = mongo_db.Changes.find({"owner_id": owner_id,
+                                   "version": {"$gt": since}},
+                                  {"_id": 0, "owner_id": 0})
+    reply = reply.sort("version", pymongo.ASCENDING).limit(max_changes + 1)
+    changes = []
+    version = since
+    for document in reply:
+        if document["version"] > version + 1:
+            break
+        version = document.pop("version")
+        changes.append(document)
+    if len(changes) > max_changes:
+        return current, None
+    if version < current - 1:
+        # changes of the older version are missing, not just being written
+        return current, None
+    written_before = time.time() - CHANGES_WRITE_TIMEOUT
+    if version < current and (changed_at is None or
+                              changed_at < written_before):
+        # changes of the newest version weren't written in time
+        return current, None
+    return version, changes
@@ -9,26 +9,82 @@
 """
 
 
+import hashlib
 import logging
-import os
+import time
+import urllib
 
+import pymongo
 from bson import ObjectId
-from pyramid.httpexceptions import (HTTPFound,
+from bson.errors import InvalidId
+from pymongo import DeleteOne, InsertOne
+from pymongo.errors import BulkWriteError
+from pyramid.httpexceptions import (HTTPBadRequest,
+                                    HTTPFound,
+                                    HTTPNotFound,
+                                    HTTPNotModified,
                                     HTTPUnauthorized,
-                                    HTTPInternalServerError)
-from pyramid.response import FileResponse, Response
+                                    HTTPInternalServerError,
+                                    HTTPServiceUnavailable,
+                                    HTTPTooManyRequests)
+from pyramid.response import Response
 from pyramid.security import remember, forget, authenticated_userid
 
-from td.password_master import PasswordMaster
+from td.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from td.mongo_client import DEFAULT_MAX_STALENESS
+from td.auth import get_user_id
+from td.renderers import (Deferred,
+                          StreamedArray,
+                          dumps,
+                          object_id_str,
+                          quote_string)
+from td.search import find_items, get_search_terms, make_tokens
+from td.versions import (CHANGES_RETENTION,
+                         MAX_CHANGES,
+                         get_changes,
+                         get_version,
+                         get_version_state,
+                         record_changes)
 
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+MAX_BATCH_SIZE = 1000
+# matched items beyond this are not paged through, the query should be refined
+MAX_SEARCH_RESULTS = 1000
+# pages bigger than this are streamed from the cursor into the response, it
+# should be below MAX_PAGE_SIZE for any page to be streamed
+STREAM_THRESHOLD = 100
+# JSON object of the item which is filled in by _encode_items
+ITEM_TEMPLATE = '{"item_value":%s,"category":%s,"id":"%s"}'
+# browsers should keep the items but revalidate them on every use
+ITEMS_CACHE_CONTROL = "private, no-cache"
+# pages refer to the current fingerprinted assets, so they are revalidated
+PAGE_CACHE_CONTROL = "no-cache"
+ASSET_CACHE_CONTROL = "public, max-age=31536000, immutable"
+METRICS_ALLOWED_IPS = ("127.0.0.1", "::1")
+
 
 def forbidden_view(request):
     return HTTPFound(location="/login")
 
 
+def service_unavailable_view(exc, request):
+    """Reply with 503 status code when backend resources are temporarily
+    unavailable (e.g. all database connections of the pool are in use).
+
+    :param exc: exception raised by the view.
+    :type exc: Exception
+    :param request: instance-object which represents HTTP request.
+    :type request: pyramid.request.Request
+    :returns: HTTPServiceUnavailable response object with status code 503.
+    """
+    logger.warning("Reply with 503 on request at %s: %s", request.path, exc)
+    return HTTPServiceUnavailable()
+
+
 def home(request):
     """Redirect from / to /todo_list url.
 
@@ -48,36 +104,61 @@ def get_todo_list_page(request):
 
     :param request: instance-object which represents HTTP request.
     :type request: pyramid.request.Request
-    :returns: object that is used to serve a file from static/base.html.
-    :rtype: pyramid.response.FileResponse
+    :returns: response with the page kept in memory by td.assets.AssetStore.
+    :rtype: pyramid.response.Response
 
     """
     logger.debug("Get request for resource at /todo_list and replied with "
                  "file static/base.html")
-    abs_path_to_base = os.path.join(os.path.dirname(__file__),
-                                    "static",
-                                    "base.html")
-    return FileResponse(path=abs_path_to_base, cache_max_age=3600)
+    assets = request.registry.settings["assets"]
+    return _get_asset_response(request, assets.get_by_path("base.html"),
+                               PAGE_CACHE_CONTROL)
 
 
 def get_todo_list_items(request):
-    """Get JSON with list of todo-items from Mongo database at request on
+    """Get JSON with page of todo-items from Mongo database at request on
     /api/get_todo_list_items url.
 
+    Items are ordered from the newest to the oldest one. Optional GET params:
+
+    * limit - count of items on the page, capped by items.max_page_size
+      setting (items.page_size setting is used if it's not provided);
+    * after - id of the last item from the previous page, only older items
+      are returned;
+    * category - name of the category to include, can be repeated
+      (e.g. ?category=red&category=green), items of all categories are
+      returned if it's not provided.
+
+    Pages are selected by _id range (keyset pagination), so the query is
+    served from the (owner_id, _id) index, or from the (owner_id, category,
+    _id) index when categories are filtered, with the same cost for any page.
+
+    Response is tagged with strong ETag made of the owner's list version and
+    the params. If request's If-None-Match has the same tag then
+    HTTPNotModified is returned without querying Items collection.
+
     :param request: instance-object which represents HTTP request.
     :type request: pyramid.request.Request
     :returns: dict that is later transformed by json-renderer into response
     object with included JSON-serialized string made from this dict:
 
-    * {'items': [{'item_value': 'sleep', 'category': 'green'},
-                 {'item_value': 'eat', 'category': 'red'},
-                 {'item_value': 'repeat', 'category': 'yellow'}
-                ]} or similar user-defined notes in list if they exist in the
-    database;
+    * {'items': [{'item_value': 'sleep', 'category': 'green', 'id': '...'},
+                 {'item_value': 'eat', 'category': 'red', 'id': '...'},
+                 {'item_value': 'repeat', 'category': 'yellow', 'id': '...'}
+                ],
+       'next': '...',
+       'version': 15} or similar user-defined notes in list if they exist in
+    the database, where 'next' is the value of after param for the next page
+    or None if this page is the last one and 'version' is the version of the
+    list to ask /api/changes for the later changes;
 
-    * {'items': None} otherwise, if items for user with current id doesn't
-    exist.
-    :rtype: dict
+    * {'items': None, 'next': None, 'version': 15} otherwise, if items for
+    user with current id doesn't exist.
+
+    Pages bigger than items.stream_threshold setting are returned with
+    td.renderers.StreamedArray items and td.renderers.Deferred next, which
+    are streamed from the Mongo cursor by the JSON renderer.
+    :rtype: dict or pyramid.httpexceptions.HTTPNotModified
 
     """
     settings = request.registry.settings
@@ -86,30 +167,289 @@ def get_todo_list_items(request):
     logger.debug("Get request for todo list items at "
                  "/api/get_todo_list_items from user with ip %s and username"
                  "'%s'", ip, login_name)
-    db = settings["db"]
-
-    user_int_id = db.select_one("id", "Users", "username='%s'" % login_name)
+    try:
+        limit = _get_page_limit(request)
+        after = request.GET.get("after")
+        if after is not None:
+            after = ObjectId(after)
+    except (ValueError, InvalidId):
+        logger.debug("Wrong pagination params: %s", request.GET)
+        return HTTPBadRequest()
+
+    user_int_id = _get_user_int_id(request)
     if user_int_id is None:
         return HTTPUnauthorized()
-    # extract id integer from tuple like (2,)[0] -> 2
-    user_int_id = user_int_id[0]
 
     mongo_db = settings["mongo_db"]
-    items_collection = mongo_db.Items
-
-    reply = items_collection.find({"owner_id": user_int_id},
+    # Version is read before the items, so the page is never older than the
+    # version it is tagged with.
+    version, changed_at = get_version_state(mongo_db, user_int_id)
+    etag = _get_items_etag(request, user_int_id, version)
+    if etag in request.if_none_match:
+        logger.debug("Items of the user weren't changed since version %d, "
+                     "reply with 304.", version)
+        response = HTTPNotModified()
+        response.etag = etag
+        response.cache_control = ITEMS_CACHE_CONTROL
+        return response
+    request.response.etag = etag
+    request.response.cache_control = ITEMS_CACHE_CONTROL
+
+    items_collection = _get_items_reader(request, changed_at)
+    query = {"owner_id": user_int_id}
+    categories = request.GET.getall("category")
+    if categories:
+        query["category"] = {"$in": categories}
+    if after is not None:
+        query["_id"] = {"$lt": after}
+    # one extra item is fetched to find out if there is the next page
+    reply = items_collection.find(query,
                                   {"item_value": 1, "category": 1, "_id": 1})
+    reply = reply.sort("_id", pymongo.DESCENDING).limit(limit + 1)
+    page = {"next": None}
+    documents = _iter_page(reply, limit, page)
+    stream_threshold = settings["app_settings"].get_int(
+        "items.stream_threshold", STREAM_THRESHOLD)
+    if limit > stream_threshold:
+        logger.debug("Stream up to %d items from the database.", limit)
+        return {"items": StreamedArray(documents,
+                                       empty_value=None,
+                                       encode_chunk=_encode_items),
+                "next": Deferred(lambda: page["next"]),
+                "version": version}
+    # ids are left as ObjectId, they are encoded by the JSON renderer
     items = [{"item_value": document["item_value"],
               "category": document["category"],
-              "id": str(document["_id"])}
-             for document in reply]
+              "id": document["_id"]}
+             for document in documents]
     if len(items) == 0:
         logger.debug("Items for this user don't exist, reply with "
                      "{'items': null} JSON.")
-        return {"items": None}
+        return {"items": None, "next": None, "version": version}
     logger.debug("Found existing items in the database, reply with "
-                 "{'items': %s} JSON object.", items)
-    return {"items": items}
+                 "{'items': %s, 'next': %s} JSON object.", items, page["next"])
+    return {"items": items, "next": page["next"], "version": version}
+
+
+def search_items(request):
+    """Get JSON with page of the user's items which match the search query
+    at request on /api/search_items url.
+
+    GET params:
+
+    * q - words to search, each word matches the words of item_value which
+      start with it (e.g. 'mil' matches 'milk'), items which match more
+      words go first;
+    * category - name of the category to include, can be repeated;
+    * limit - count of items on the page, as in get_todo_list_items;
+    * offset - count of the matched items to skip, 0 by default.
+
+    Search is served by the text index of td.search with owner_id prefix.
+    Pages are selected by offset, because items are ordered by relevance,
+    not by _id, and only the first search.max_results matched items can be
+    paged through. Response is tagged with ETag like in get_todo_list_items.
+
+    :param request: instance-object which represents HTTP request.
+    :type request: pyramid.request.Request
+    :returns: dict that is later transformed by json-renderer into response
+    object with included JSON-serialized string made from this dict:
+
+    * {'items': [{'item_value': 'milk', 'category': 'green', 'id': '...'}],
+       'next': 50,
+       'version': 15} where 'next' is the value of offset param for the next
+    page or None if this page is the last one;
+
+    * {'items': None, 'next': None, 'version': 15} otherwise, if no items
+    match the query.
+    :rtype: dict or pyramid.httpexceptions.HTTPNotModified
+
+    """
+    settings = request.registry.settings
+    max_results = settings["app_settings"].get_int("search.max_results",
+                                                   MAX_SEARCH_RESULTS)
+    try:
+        terms = get_search_terms(request.GET.get("q", u""))
+        limit = _get_page_limit(request)
+        offset = int(request.GET.get("offset", 0))
+        if not terms:
+            raise ValueError("Nothing to search.")
+        if offset < 0 or offset >= max_results:
+            raise ValueError("Offset is out of the results.")
+    except ValueError as e:
+        logger.debug("Wrong search params %s: %s", request.GET, e)
+        return HTTPBadRequest()
+
+    user_int_id = _get_user_int_id(request)
+    if user_int_id is None:
+        return HTTPUnauthorized()
+
+    version, changed_at = get_version_state(settings["mongo_db"], user_int_id)
+    etag = _get_items_etag(request, user_int_id, version)
+    if etag in request.if_none_match:
+        response = HTTPNotModified()
+        response.etag = etag
+        response.cache_control = ITEMS_CACHE_CONTROL
+        return response
+    request.response.etag = etag
+    request.response.cache_control = ITEMS_CACHE_CONTROL
+
+    limit = min(limit, max_results - offset)
+    # one extra item is fetched to find out if there is the next page
+    documents = list(find_items(_get_items_reader(request, changed_at),
+                                user_int_id, terms,
+                                categories=request.GET.getall("category"),
+                                offset=offset,
+                                limit=limit + 1))
+    next_offset = None
+    if len(documents) > limit and offset + limit < max_results:
+        next_offset = offset + limit
+    items = [{"item_value": document["item_value"],
+              "category": document["category"],
+              "id": document["_id"]}
+             for document in documents[:limit]]
+    logger.debug("Found %d items by terms %s.", len(items), terms)
+    return {"items": items or None, "next": next_offset, "version": version}
+
+
+def _get_items_reader(request, changed_at):
+    """Choose Items collection to read the page from.
+
+    Lists which weren't changed for items.max_staleness seconds (at least
+    DEFAULT_MAX_STALENESS) are read by items.read_preference, e.g. from
+    secondaries, because secondaries which lag less than that have the same
+    items as the primary. The others are read from the primary, so the page
+    matches it's version. Lag of secondaries is bounded by the driver since
+    pymongo 3.4, for older drivers it should be watched.
+
+    :param request: instance-object which represents HTTP request.
+    :type request: pyramid.request.Request
+    :param changed_at: unix time of the last change of the list or None.
+    :type changed_at: float
+    :return: Items collection.
+    :rtype: pymongo.collection.Collection
+    """
+    settings = request.registry.settings
+    secondary_items = settings.get("secondary_items")
+    if secondary_items is None:
+        return settings["mongo_db"].Items
+    max_staleness = max(settings["app_settings"].get_duration(
+        "items.max_staleness", DEFAULT_MAX_STALENESS), DEFAULT_MAX_STALENESS)
+    if changed_at is not None and time.time() - changed_at < max_staleness:
+        return settings["mongo_db"].Items
+    return secondary_items
+
+
+def _encode_items(documents):
+    """Encode chunk of Items documents into comma separated JSON objects
+    for StreamedArray.
+
+    Values are put into ITEM_TEMPLATE without building item dicts and
+    without calling generic encoder for each of them. Chunk with unexpected
+    values (e.g. not string item_value) is encoded by the generic encoder.
+
+    :param documents: list of documents from Items collection.
+    :type documents: list
+    :return: JSON text.
+    :rtype: str
+    """
+    try:
+        return ",".join([ITEM_TEMPLATE % (
+                             quote_string(document["item_value"]),
+                             quote_string(document["category"]),
+                             object_id_str(document["_id"]))
+                         for document in documents])
+    except (KeyError, TypeError):
+        return ",".join(dumps({"item_value": document.get("item_value"),
+                               "category": document.get("category"),
+                               "id": document["_id"]})
+                        for document in documents)
+
+
+def _iter_page(reply, limit, page):
+    """Yield documents of the page from Mongo cursor and set id for the next
+    page cursor in page dict if cursor has more than limit documents. The
+    cursor is closed at the end, so it's reported by instrumentation even
+    if it's not exhausted.
+
+    :param reply: cursor of owner's items sorted from the newest one.
+    :type reply: pymongo.cursor.Cursor
+    :param limit: count of items on the page.
+    :type limit: int
+    :param page: dict which 'next' key is set after the last document.
+    :type page: dict
+    :return: iterator of documents.
+    :rtype: iterator
+    """
+    last_id = None
+    try:
+        for count, document in enumerate(reply):
+            if count == limit:
+                page["next"] = last_id
+                break
+            last_id = document["_id"]
+            yield document
+    finally:
+        reply.close()
+
+
+def _get_user_int_id(request):
+    """Get integer id of the authenticated user from the auth ticket or find
+    it in the Users table if the ticket doesn't carry it.
+
+    :param request: instance-object which represents HTTP request.
+    :type request: pyramid.request.Request
+    :return: user's id or None if there is no such user.
+    :rtype: int
+    """
+    user_id = get_user_id(request)
+    if user_id is not None:
+        return user_id
+    db = request.registry.settings["db"]
+    query_output = db.select_one("id", "Users",
+                                 {"username": authenticated_userid(request)})
+    if query_output is None:
+        return None
+    # extract id integer from tuple like (2,)[0] -> 2
+    return query_output[0]
+
+
+def _get_items_etag(request, owner_id, version):
+    """Make ETag for the page of owner's items.
+
+    :param request: instance-object which represents HTTP request.
+    :type request: pyramid.request.Request
+    :param owner_id: integer id of the user.
+    :type owner_id: int
+    :param version: current version of the user's todo list.
+    :type version: int
+    :return: tag like '2-15-0beec7b5ea3f0fdb' (owner, version, params hash).
+    :rtype: str
+    """
+    params = sorted((key.encode("utf8"), value.encode("utf8"))
+                    for key, value in request.GET.items())
+    digest = hashlib.sha1(urllib.urlencode(params)).hexdigest()[:16]
+    return "%d-%d-%s" % (owner_id, version, digest)
+
+
+def _get_page_limit(request):
+    """Get count of items on the page from the 'limit' GET param.
+
+    :param request: instance-object which represents HTTP request.
+    :type request: pyramid.request.Request
+    :return: page size capped by items.max_page_size setting.
+    :rtype: int
+    :raises: ValueError
+    """
+    app_settings = request.registry.settings["app_settings"]
+    max_page_size = app_settings.get_int("items.max_page_size", MAX_PAGE_SIZE)
+    limit = request.GET.get("limit")
+    if limit is None:
+        limit = app_settings.get_int("items.page_size", DEFAULT_PAGE_SIZE)
+    else:
+        limit = int(limit)
+    if limit < 1:
+        raise ValueError("Page size should be positive.")
+    return min(limit, max_page_size)
 
 
 def add_todo_list_item(request):
@@ -121,8 +461,11 @@ def add_todo_list_item(request):
 
     :param request: instance-object which represents HTTP request.
     :type request: pyramid.request.Request
-    :returns: Response instance with 'OK' str body to indicate a success.
-    :rtype: pyramid.response.Response
+    :returns: dict that is later transformed by json-renderer into response
+    with the id of the new item and the new version of the list:
+    {'id': '...', 'version': 16}, version is None if the item is buffered
+    by the write-behind queue.
+    :rtype: dict
 
     """
     settings = request.registry.settings
@@ -132,39 +475,376 @@ def add_todo_list_item(request):
                  "with POST request on /api/add_todo_list_items",
                  ip, login_name)
 
-    db = settings["db"]
-    user_int_id = db.select_one("id", "Users", "username='%s'" % login_name)
+    user_int_id = _get_user_int_id(request)
     if user_int_id is None:
         return HTTPUnauthorized()
-    # extract id integer from tuple like (2,)[0] -> 2
-    user_int_id = user_int_id[0]
     mongo_db = settings["mongo_db"]
     items_collection = mongo_db.Items
-    items_collection.insert_one({"item_value": request.json_body["item_value"],
-                                 "category": request.json_body["category"],
-                                 "owner_id": user_int_id})
-    logger.debug("Successfully added item '%s' to the database.",
-                 request.json_body["item_value"])
+    item = {"item_value": request.json_body["item_value"],
+            "category": request.json_body["category"]}
+    document = dict(item, owner_id=user_int_id,
+                    item_tokens=make_tokens(item["item_value"]))
+    write_queue = settings.get("write_queue")
+    if write_queue is not None and write_queue.durability == "buffered":
+        return _add_buffered_item(request, write_queue, user_int_id, item,
+                                  document)
+    if write_queue is not None:
+        # grouped with inserts of the concurrent requests
+        item["id"] = str(write_queue.insert_one(document))
+    else:
+        item["id"] = str(items_collection.insert_one(document).inserted_id)
+    version = _record_changes(request, user_int_id,
+                              [{"op": "insert", "item": item}])
+    logger.debug("Successfully added item '%s' to the database, list version "
+                 "is %d now.", request.json_body["item_value"], version)
+
+    return {"id": item["id"], "version": version}
+
+
+def _add_buffered_item(request, write_queue, owner_id, item, document):
+    """Queue the item into buffered write-behind queue and record it's
+    change once it's written.
+
+    Version of the list is bumped only after the item is in Items, so pages
+    cached under the new version always have it, and the change of the item
+    which failed to be written is never recorded.
+
+    :param request: instance-object which represents HTTP request.
+    :type request: pyramid.request.Request
+    :param write_queue: queue with buffered durability.
+    :type write_queue: td.write_behind.WriteBehindQueue
+    :param owner_id: integer id of the user.
+    :type owner_id: int
+    :param item: item of the change without id.
+    :type item: dict
+    :param document: document to insert.
+    :type document: dict
+    :return: {'id': '...', 'version': None}, the version isn't known yet.
+    :rtype: dict
+    """
+    settings = request.registry.settings
+    # the callback runs in the writer thread, out of the request
+    mongo_db = settings["mongo_db"]
+    retention = settings["app_settings"].get_int("changes.retention",
+                                                 CHANGES_RETENTION)
+    pending = write_queue.submit(document)
+    item["id"] = str(pending.inserted_id)
 
-    return Response("OK")
+    def record(error):
+        if error is not None:
+            logger.warning("Buffered item %s isn't written, it's change "
+                           "isn't recorded.", item["id"])
+            return
+        record_changes(mongo_db, owner_id, [{"op": "insert", "item": item}],
+                       retention=retention)
+
+    pending.add_done_callback(record)
+    logger.debug("Queued item '%s' to the database.", item["item_value"])
+    return {"id": item["id"], "version": None}
 
 
 def remove_item(request):
-    """Delete item from database by id.
+    """Delete item of the authenticated user from database by id.
 
     :param request: instance-object which represents HTTP request.
     :type request: pyramid.request.Request
-    :returns: Response instance with 'OK' str body to indicate a success.
-    :rtype: pyramid.response.Response
+    :returns: dict that is later transformed by json-renderer into response
+    with the id of the removed item and the version of the list after
+    removal: {'id': '...', 'version': 17}.
+    :rtype: dict
     """
-    item_id = ObjectId(request.json_body['id'])
+    try:
+        item_id = request.json_body['id']
+        if not isinstance(item_id, basestring):
+            # ObjectId(None) would make a new id
+            raise TypeError("Id of the item isn't string: %r" % (item_id,))
+        item_id = ObjectId(item_id)
+    except (KeyError, TypeError, ValueError, InvalidId):
+        logger.debug("Wrong id of the item to remove.")
+        return HTTPBadRequest()
 
     settings = request.registry.settings
+    user_int_id = _get_user_int_id(request)
+    if user_int_id is None:
+        return HTTPUnauthorized()
+
     mongo_db = settings["mongo_db"]
     items_collection = mongo_db.Items
-    items_collection.delete_one({"_id": item_id})
+    result = items_collection.delete_one({"_id": item_id,
+                                          "owner_id": user_int_id})
     logger.debug("Removing item from mongo db with id: %s", item_id)
-    return Response("OK")
+    if result.deleted_count:
+        version = _record_changes(request, user_int_id,
+                                  [{"op": "delete", "id": str(item_id)}])
+    else:
+        version = get_version(mongo_db, user_int_id)
+    return {"id": str(item_id), "version": version}
+
+
+def add_todo_list_items(request):
+    """Add batch of new items to the database with single bulk write.
+
+    Expects JSON body like {'items': [{'item_value': 'sleep',
+                                       'category': 'green'}, ...],
+                            'ordered': true}.
+    In ordered mode (default) items are inserted one by one and the first
+    failed item stops the batch, all items after it are skipped. In unordered
+    mode failure of one item doesn't affect the others.
+
+    :param request: instance-object which represents HTTP request.
+    :type request: pyramid.request.Request
+    :returns: dict that is later transformed by json-renderer into response
+    with the result for each item of the batch in the same order and the
+    version of the list after the batch:
+    {'results': [{'status': 'ok', 'id': '...'},
+                 {'status': 'error', 'error': 'Wrong element.'},
+                 {'status': 'skipped'}],
+     'version': 18}
+    :rtype: dict
+    """
+    user_int_id = _get_user_int_id(request)
+    if user_int_id is None:
+        return HTTPUnauthorized()
+    try:
+        items, ordered = _get_batch(request, "items")
+    except ValueError as e:
+        logger.debug("Wrong batch of items: %s", e)
+        return HTTPBadRequest()
+
+    operations = []
+    new_ids = []
+    for item in items:
+        if (not isinstance(item, dict) or
+                not isinstance(item.get("item_value"), basestring) or
+                not isinstance(item.get("category"), basestring) or
+                not item["item_value"]):
+            operations.append(None)
+            new_ids.append(None)
+            continue
+        # ids are generated here to report them for each inserted item
+        new_ids.append(ObjectId())
+        operations.append(InsertOne({"_id": new_ids[-1],
+                                     "item_value": item["item_value"],
+                                     "category": item["category"],
+                                     "owner_id": user_int_id,
+                                     "item_tokens": make_tokens(
+                                         item["item_value"])}))
+
+    mongo_db = request.registry.settings["mongo_db"]
+    results, written = _run_bulk(mongo_db.Items, operations, ordered)
+    changes = []
+    for result, new_id, item in zip(results, new_ids, items):
+        if result["status"] == "ok":
+            result["id"] = str(new_id)
+            changes.append({"op": "insert",
+                            "item": {"id": result["id"],
+                                     "item_value": item["item_value"],
+                                     "category": item["category"]}})
+    if written:
+        version = _record_changes(request, user_int_id, changes)
+    else:
+        version = get_version(mongo_db, user_int_id)
+    logger.debug("Added %d of %d items in batch.", written, len(items))
+    return {"results": results, "version": version}
+
+
+def remove_items(request):
+    """Delete batch of items of the authenticated user with single bulk
+    write.
+
+    Expects JSON body like {'ids': ['...', '...'], 'ordered': true}, see
+    add_todo_list_items for the meaning of ordered mode. Removal of item
+    which doesn't exist (or was already removed) is reported as successful.
+
+    :param request: instance-object which represents HTTP request.
+    :type request: pyramid.request.Request
+    :returns: dict that is later transformed by json-renderer into response
+    with the result for each id of the batch in the same order and the count
+    of actually removed items and the version of the list after removal:
+    {'results': [{'status': 'ok'}, {'status': 'error', 'error': '...'}],
+     'removed': 1,
+     'version': 19}
+    :rtype: dict
+    """
+    user_int_id = _get_user_int_id(request)
+    if user_int_id is None:
+        return HTTPUnauthorized()
+    try:
+        ids, ordered = _get_batch(request, "ids")
+    except ValueError as e:
+        logger.debug("Wrong batch of ids: %s", e)
+        return HTTPBadRequest()
+
+    operations = []
+    object_ids = []
+    for item_id in ids:
+        if (not isinstance(item_id, basestring) or
+                not ObjectId.is_valid(item_id)):
+            operations.append(None)
+            object_ids.append(None)
+            continue
+        object_ids.append(ObjectId(item_id))
+        operations.append(DeleteOne({"_id": object_ids[-1],
+                                     "owner_id": user_int_id}))
+
+    mongo_db = request.registry.settings["mongo_db"]
+    # only existing items of the owner get delete changes, item removed by
+    # concurrent request in between can be recorded twice, which clients
+    # ignore
+    owned = set(document["_id"] for document in mongo_db.Items.find(
+        {"_id": {"$in": [object_id for object_id in object_ids
+                         if object_id is not None]},
+         "owner_id": user_int_id}, {"_id": 1}))
+    results, removed = _run_bulk(mongo_db.Items, operations, ordered)
+    changes = []
+    for item_id, object_id, result in zip(ids, object_ids, results):
+        if result["status"] == "ok" and object_id in owned:
+            owned.discard(object_id)
+            changes.append({"op": "delete", "id": item_id})
+    if removed and changes:
+        version = _record_changes(request, user_int_id, changes)
+    else:
+        version = get_version(mongo_db, user_int_id)
+    logger.debug("Removed %d of %d items in batch.", removed, len(ids))
+    return {"results": results, "removed": removed, "version": version}
+
+
+def get_item_changes(request):
+    """Get changes of the user's todo list made after the version known to
+    the client at request on /api/changes?since=<version> url.
+
+    :param request: instance-object which represents HTTP request.
+    :type request: pyramid.request.Request
+    :returns: dict that is later transformed by json-renderer into response:
+
+    * {'version': 17,
+       'changes': [{'op': 'insert', 'item': {'id': '...',
+                                             'item_value': 'sleep',
+                                             'category': 'green'}},
+                   {'op': 'delete', 'id': '...'}],
+       'reset': False} with changes in the order they were made;
+
+    * {'version': 17, 'changes': None, 'reset': True} if changes since this
+    version are not available anymore and the whole list should be reloaded.
+    :rtype: dict
+    """
+    try:
+        since = int(request.GET["since"])
+    except (KeyError, ValueError):
+        return HTTPBadRequest()
+    user_int_id = _get_user_int_id(request)
+    if user_int_id is None:
+        return HTTPUnauthorized()
+
+    settings = request.registry.settings
+    app_settings = settings["app_settings"]
+    version, changes = get_changes(
+        settings["mongo_db"], user_int_id, since,
+        retention=app_settings.get_int("changes.retention",
+                                       CHANGES_RETENTION),
+        max_changes=app_settings.get_int("changes.max_changes", MAX_CHANGES))
+    logger.debug("Reply with %s changes since version %d up to %d.",
+                 "no" if changes is None else len(changes), since, version)
+    return {"version": version,
+            "changes": changes,
+            "reset": changes is None}
+
+
+def _record_changes(request, owner_id, changes):
+    """Write changes of the owner's list into the log and get new version.
+
+    :param request: instance-object which represents HTTP request.
+    :type request: pyramid.request.Request
+    :param owner_id: integer id of the user.
+    :type owner_id: int
+    :param changes: list of changes, see td.versions.record_changes.
+    :type changes: list
+    :return: new version of the list.
+    :rtype: int
+    """
+    settings = request.registry.settings
+    retention = settings["app_settings"].get_int("changes.retention",
+                                                 CHANGES_RETENTION)
+    return record_changes(settings["mongo_db"], owner_id, changes,
+                          retention=retention)
+
+
+def _get_batch(request, key):
+    """Get list of batch elements and ordered flag from JSON body.
+
+    :param request: instance-object which represents HTTP request.
+    :type request: pyramid.request.Request
+    :param key: key of the list in JSON body.
+    :type key: str
+    :return: tuple (list of elements, ordered flag).
+    :rtype: tuple
+    :raises: ValueError
+    """
+    body = request.json_body
+    if not isinstance(body, dict) or not isinstance(body.get(key), list):
+        raise ValueError("JSON object with '%s' list is expected." % key)
+    app_settings = request.registry.settings["app_settings"]
+    max_batch_size = app_settings.get_int("items.max_batch_size",
+                                          MAX_BATCH_SIZE)
+    if len(body[key]) > max_batch_size:
+        raise ValueError("Batch is bigger than %d." % max_batch_size)
+    return body[key], bool(body.get("ordered", True))
+
+
+def _run_bulk(collection, operations, ordered):
+    """Send operations to the collection with single bulk write.
+
+    Operations which are None (elements which failed validation) are not
+    sent. In ordered mode the first of them stops the batch.
+
+    :param collection: Mongo collection to write in.
+    :type collection: pymongo.collection.Collection
+    :param operations: list of bulk operations or None for wrong elements.
+    :type operations: list
+    :param ordered: stop on the first failed element.
+    :type ordered: bool
+    :return: tuple (list of results for each element, count of inserted plus
+    deleted documents).
+    :rtype: tuple
+    """
+    results = [{"status": "ok"} if operation is not None else
+               {"status": "error", "error": "Wrong element."}
+               for operation in operations]
+    # positions of sent operations in the batch
+    positions = []
+    for position, operation in enumerate(operations):
+        if operation is None:
+            if ordered:
+                break
+            continue
+        positions.append(position)
+
+    written = 0
+    failed_at = None
+    if positions:
+        try:
+            reply = collection.bulk_write([operations[position]
+                                           for position in positions],
+                                          ordered=ordered)
+            written = reply.inserted_count + reply.deleted_count
+        except BulkWriteError as e:
+            details = e.details
+            written = details["nInserted"] + details["nRemoved"]
+            for error in details["writeErrors"]:
+                position = positions[error["index"]]
+                results[position] = {"status": "error",
+                                     "error": error["errmsg"]}
+                if failed_at is None or position < failed_at:
+                    failed_at = position
+
+    if ordered:
+        if failed_at is None and len(positions) < len(operations):
+            # stopped on the element which failed validation
+            failed_at = len(positions)
+        if failed_at is not None:
+            for position in range(failed_at + 1, len(operations)):
+                results[position] = {"status": "skipped"}
+    return results, written
 
 
 def get_login_page(request):
@@ -172,15 +852,87 @@ def get_login_page(request):
 
     :param request: instance-object which represents HTTP request.
     :type request: pyramid.request.Request
-    :returns: object that is used to serve a file from static/login.html.
-    :rtype: pyramid.response.FileResponse
+    :returns: response with the page kept in memory by td.assets.AssetStore.
+    :rtype: pyramid.response.Response
     """
     logger.debug("Get request for resource at /login and replied with "
                  "file static/login.html")
-    abs_path_to_html_page = os.path.join(os.path.dirname(__file__),
-                                         "static",
-                                         "login.html")
-    return FileResponse(path=abs_path_to_html_page, cache_max_age=3600)
+    assets = request.registry.settings["assets"]
+    return _get_asset_response(request, assets.get_by_path("login.html"),
+                               PAGE_CACHE_CONTROL)
+
+
+def get_metrics(request):
+    """Return metrics of requests in Prometheus text format at /metrics url.
+
+    Route exists only if metrics.enabled setting is on. Metrics are shown
+    only to clients from metrics.allowed_ips, the others get 404.
+
+    :param request: instance-object which represents HTTP request.
+    :type request: pyramid.request.Request
+    :returns: response with metrics or HTTPNotFound.
+    :rtype: pyramid.response.Response
+    """
+    settings = request.registry.settings
+    allowed_ips = settings["app_settings"].get_list("metrics.allowed_ips",
+                                                    METRICS_ALLOWED_IPS)
+    if request.client_addr not in allowed_ips:
+        logger.warning("Metrics are requested from not allowed ip %s.",
+                       request.client_addr)
+        return HTTPNotFound()
+    return Response(body=settings["metrics"].render(),
+                    content_type=METRICS_CONTENT_TYPE,
+                    charset="utf-8",
+                    cache_control="no-store")
+
+
+def get_asset(request):
+    """Return static asset by it's fingerprinted URL at /assets/... url.
+
+    URL changes with the content of the asset, so it's cached by browsers
+    for a year without revalidation.
+
+    :param request: instance-object which represents HTTP request.
+    :type request: pyramid.request.Request
+    :returns: response with the asset or HTTPNotFound.
+    :rtype: pyramid.response.Response
+    """
+    asset = request.registry.settings["assets"].get(request.path)
+    if asset is None:
+        return HTTPNotFound()
+    return _get_asset_response(request, asset, ASSET_CACHE_CONTROL)
+
+
+def _get_asset_response(request, asset, cache_control):
+    """Make response with asset's body, gzipped if client accepts it, or 304
+    if client has it already.
+
+    :param request: instance-object which represents HTTP request.
+    :type request: pyramid.request.Request
+    :param asset: asset to serve.
+    :type asset: td.assets.Asset
+    :param cache_control: value of Cache-Control header.
+    :type cache_control: str
+    :returns: response object.
+    :rtype: pyramid.response.Response
+    """
+    # clients which don't send Accept-Encoding get the plain body
+    gzipped = (asset.gzip_body is not None and
+               "Accept-Encoding" in request.headers and
+               request.accept_encoding.acceptable_offers(["gzip"]))
+    etag = asset.gzip_etag if gzipped else asset.etag
+    if etag in request.if_none_match:
+        response = HTTPNotModified()
+    else:
+        response = Response(body=asset.gzip_body if gzipped else asset.body,
+                            content_type=asset.content_type)
+        if gzipped:
+            response.content_encoding = "gzip"
+    response.etag = etag
+    response.cache_control = cache_control
+    if asset.gzip_body is not None:
+        response.vary = ("Accept-Encoding",)
+    return response
 
 
 def post_login_credentials(request):
@@ -188,19 +940,32 @@ def post_login_credentials(request):
 
     :param request: instance-object which represents HTTP request.
     :type request: pyramid.request.Request
-    :returns: if ok HTTPFound with auth. headers in response else HTTPUnauthorized
+    :returns: if ok HTTPFound with auth. headers in response else
+    HTTPUnauthorized, or HTTPTooManyRequests if there were too many attempts
+    for this username or from this ip (checked before any password work).
     """
     login = request.json_body["login"]
     password = request.json_body["password"]
-    password_master = PasswordMaster()
+
+    login_limiter = request.registry.settings["login_limiter"]
+    if not login_limiter.allow(login, request.client_addr):
+        logger.warning("Login attempt for user %s from ip %s is over the "
+                       "limit.", login, request.client_addr)
+        return HTTPTooManyRequests()
+
+    password_master = request.registry.settings["password_master"]
 
     db = request.registry.settings["db"]
-    query_output = db.select_one("password", "Users", "username='%s'" % login)
+    query_output = db.select_one("id, password, groups", "Users",
+                                 {"username": login})
 
     if query_output is not None:
-        hashed_pword_from_db = query_output[0]
+        user_id, hashed_pword_from_db, groups = query_output
         if password_master.check_password(password, hashed_pword_from_db):
-            headers = remember(request=request, userid=login)
+            # id and groups in the ticket spare lookups of the user in the
+            # following requests
+            headers = remember(request=request, userid=login,
+                               user_id=user_id, groups=groups.split(", "))
             logger.debug("User %s has logged in right now.", login)
             return HTTPFound(location="/todo_list", headers=headers)
         else:
@@ -0,0 +1,342 @@
+"""
+.. module:: write_behind
+   :platform: Unix
+   :synopsis: Write-behind queue which groups inserts of concurrent requests
+   into batches.
+
+.. moduleauthor:: Mykola Radionov <moodaq@gmail.com>
+
+insert_one of the queue puts the document into the queue and one of the
+writer threads takes all queued documents (up to max_batch) and writes them
+with single insert_many, so concurrent requests share one round trip to
+Mongo. Documents which come while the batch is being written form the next
+batch, waiting max_delay seconds for more documents makes batches bigger at
+the cost of latency. Documents get their _id when they are queued, like
+insert_one of pymongo does, so it's known before the write.
+
+Durability modes:
+
+    buffered      insert_one returns as soon as the document is queued. It's
+                  written on clean shutdown, but it's lost if the process
+                  dies before it's batch is written. Whatever depends on the
+                  document being in the collection (e.g. version of the
+                  list) should be done by the done callback of submit.
+    acknowledged  insert_one waits until it's batch is acknowledged by Mongo,
+                  the same as insert_one of the collection does.
+    journaled     as acknowledged, but the batch is written with j=True and
+                  is acknowledged only after it's in the journal.
+
+No more than max_pending documents wait in the queue, the other requests
+wait for their turn up to queue_timeout seconds and then
+WriteQueueBusyException is raised.
+
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+from pymongo.write_concern import WriteConcern
+
+from td.exceptions import WriteQueueBusyException
+
+
+logger = logging.getLogger(__name__)
+
+DURABILITY_MODES = ("buffered", "acknowledged", "journaled")
+# code of Mongo error about duplicate key
+DUPLICATE_KEY_ERROR = 11000
+
+
+class PendingWrite(object):
+    """Future of the queued document which is resolved when it's batch is
+    written.
+    """
+
+    def __init__(self, document):
+        """Initialize pending write.
+
+        :param document: document to insert, with _id.
+        :type document: dict
+        """
+        self.document = document
+        self._event = threading.Event()
+        self._error = None
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def inserted_id(self):
+        """_id of the document."""
+        return self.document["_id"]
+
+    def done(self):
+        """Check if the batch of the document was written or failed."""
+        return self._event.is_set()
+
+    def add_done_callback(self, callback):
+        """Call callback(error) once the batch of the document is written
+        (error is None) or failed. It's called by the writer thread, or
+        right away if the write is done already.
+
+        :param callback: function of one argument.
+        :type callback: callable
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        self._call(callback)
+
+    def resolve(self, error=None):
+        """Mark the document as written, or as failed with the error."""
+        with self._lock:
+            self._error = error
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            self._call(callback)
+
+    def _call(self, callback):
+        """Call the done callback, it's errors are logged and don't affect
+        the other documents of the batch.
+        """
+        try:
+            callback(self._error)
+        except Exception:
+            logger.exception("Done callback of the write of %s failed.",
+                             self.document["_id"])
+
+    def result(self, timeout=None):
+        """Wait until the document is written and return it's _id.
+
+        :param timeout: seconds to wait, None to wait until the batch is
+        written or fails.
+        :type timeout: float
+        :return: _id of the document.
+        :rtype: bson.ObjectId
+        :raises: WriteQueueBusyException, error of the write
+        """
+        if not self._event.wait(timeout):
+            raise WriteQueueBusyException("Document isn't written in %.2f "
+                                          "seconds." % timeout)
+        if self._error is not None:
+            raise self._error
+        return self.document["_id"]
+
+
+class WriteBehindQueue(object):
+    """Queue of documents which are inserted into the collection in batches
+    by the writer threads.
+
+    Writers are started by the first insert in the process, documents left
+    in the queue are written by close.
+    """
+
+    def __init__(self, collection, durability="acknowledged", writers=2,
+                 max_batch=100, max_delay=0, max_pending=1000,
+                 queue_timeout=1.0):
+        """Initialize queue.
+
+        :param collection: Mongo collection to insert documents into.
+        :type collection: pymongo.collection.Collection
+        :param durability: one of DURABILITY_MODES.
+        :type durability: str
+        :param writers: count of threads writing batches at the same time.
+        :type writers: int
+        :param max_batch: the biggest count of documents in one insert_many.
+        :type max_batch: int
+        :param max_delay: seconds to wait for more documents before the
+        batch is written.
+        :type max_delay: float
+        :param max_pending: the biggest count of queued documents.
+        :type max_pending: int
+        :param queue_timeout: seconds to wait for the turn to queue document
+        when the queue is full.
+        :type queue_timeout: float
+        :raises: ValueError
+        """
+        if durability not in DURABILITY_MODES:
+            raise ValueError("Wrong durability mode: %r." % (durability,))
+        if durability == "journaled":
+            collection = collection.with_options(
+                write_concern=WriteConcern(w=1, j=True))
+        self.collection = collection
+        self.durability = durability
+        self.writers = writers
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition(threading.Lock())
+        self._queue = deque()
+        self._workers = []
+        self._workers_pid = None
+        self._closed = False
+
+    def __len__(self):
+        """Count of queued documents."""
+        return len(self._queue)
+
+    def insert_one(self, document):
+        """Queue the document and wait for it's write as the durability
+        mode requires.
+
+        :param document: document to insert, it gets _id if it has none.
+        :type document: dict
+        :return: _id of the document.
+        :rtype: bson.ObjectId
+        :raises: WriteQueueBusyException, pymongo.errors.PyMongoError
+        """
+        pending = self.submit(document)
+        if self.durability == "buffered":
+            return pending.inserted_id
+        return pending.result()
+
+    def submit(self, document):
+        """Queue the document without waiting for it's write.
+
+        :param document: document to insert, it gets _id if it has none.
+        :type document: dict
+        :return: future of the write.
+        :rtype: PendingWrite
+        :raises: WriteQueueBusyException
+        """
+        if "_id" not in document:
+            document["_id"] = ObjectId()
+        pending = PendingWrite(document)
+        deadline = time.time() + self.queue_timeout
+        with self._cond:
+            if not self._closed:
+                self._start_workers()
+                while len(self._queue) >= self.max_pending:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        logger.warning("Write queue is full with %d "
+                                       "documents.", len(self._queue))
+                        raise WriteQueueBusyException(
+                            "No turn to queue document in %.2f seconds." %
+                            self.queue_timeout)
+                    self._cond.wait(remaining)
+                self._queue.append(pending)
+                self._cond.notify_all()
+                return pending
+        # nobody will write the queue after close
+        self._write([pending])
+        return pending
+
+    def configure(self, max_batch=None, max_delay=None, max_pending=None,
+                  queue_timeout=None):
+        """Change limits of the working queue, see __init__ for their
+        meaning. Limits which are None are kept. Durability mode can't be
+        changed without restart.
+        """
+        with self._cond:
+            if max_batch is not None:
+                self.max_batch = max_batch
+            if max_delay is not None:
+                self.max_delay = max_delay
+            if max_pending is not None:
+                self.max_pending = max_pending
+            if queue_timeout is not None:
+                self.queue_timeout = queue_timeout
+            self._cond.notify_all()
+
+    def close(self, timeout=None):
+        """Write all queued documents and stop the writers. Documents queued
+        after close are written right away.
+
+        :param timeout: seconds to wait for each writer.
+        :type timeout: float
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            workers = self._workers
+            if self._workers_pid != os.getpid():
+                workers = []
+        for worker in workers:
+            worker.join(timeout)
+        with self._cond:
+            left = list(self._queue)
+            self._queue.clear()
+        while left:
+            self._write(left[:self.max_batch])
+            del left[:self.max_batch]
+
+    def _start_workers(self):
+        """Start writer threads on the first insert in this process, it's
+        called with the lock held.
+        """
+        pid = os.getpid()
+        if self._workers and self._workers_pid == pid:
+            return
+        if self._workers:
+            # documents copied from the parent process are written by it
+            self._queue.clear()
+        self._workers_pid = pid
+        self._workers = [threading.Thread(target=self._run,
+                                          name="td-write-behind-%d" % number)
+                         for number in range(max(self.writers, 1))]
+        for worker in self._workers:
+            # close is called at exit, non-daemon thread would block the
+            # exit before that
+            worker.daemon = True
+            worker.start()
+
+    def _run(self):
+        """Write batches of the queue until it's closed and empty."""
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                # give concurrent requests time to join the batch
+                deadline = time.time() + self.max_delay
+                while len(self._queue) < self.max_batch and not self._closed:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = [self._queue.popleft()
+                         for _ in range(min(self.max_batch,
+                                            len(self._queue)))]
+                self._cond.notify_all()
+            if batch:
+                # the other writer could take the queue during the delay
+                self._write(batch)
+
+    def _write(self, batch):
+        """Insert documents of the batch and resolve their futures.
+
+        :param batch: list of PendingWrite.
+        :type batch: list
+        """
+        errors = {}
+        try:
+            self.collection.insert_many(
+                [pending.document for pending in batch], ordered=False)
+        except BulkWriteError as error:
+            write_errors = error.details.get("writeErrors", [])
+            for write_error in write_errors:
+                error_class = (DuplicateKeyError
+                               if write_error.get("code") ==
+                               DUPLICATE_KEY_ERROR else OperationFailure)
+                errors[write_error["index"]] = error_class(
+                    write_error.get("errmsg"), write_error.get("code"),
+                    write_error)
+            if not write_errors:
+                # write concern failed, the whole batch is in doubt
+                errors = dict.fromkeys(range(len(batch)), error)
+        except Exception as error:
+            errors = dict.fromkeys(range(len(batch)), error)
+        if errors:
+            logger.error("%d of %d queued documents aren't written: %s",
+                         len(errors), len(batch), errors.values()[0])
+        for index, pending in enumerate(batch):
+            pending.resolve(errors.get(index))